@@ -1,9 +1,14 @@
 # app.py
 import streamlit as st
 import pandas as pd
-from utils.io import load_data
-from utils.prep import clean_data, make_geodataframe
-from utils.viz import bar_chart_dispo_commune, scatter_plot_capacite_vs_dispo, map_chart_dispo
+from utils.io import load_snapshot, build_snapshot
+from utils.feeds import get_multi_feed
+from utils.live import LIVE_INTERVAL, LIVE_SOURCE, get_live_feed
+from utils.anomalies import reliable_cube
+from utils.cache import section_cache, snapshot_cache
+from utils.perf import PROFILE_DEFAULT, span, start_run
+from utils.sections import episodes_section, forecast_section, performance_section, quality_section, secours_section, zoom_commune_table
+from utils.viz import aggregate_map_bins, bar_chart_dispo_commune, scatter_plot_capacite_vs_dispo, map_chart_dispo
 
 
 st.set_page_config(
@@ -13,12 +18,72 @@ st.set_page_config(
 )
 
 
-df_raw = load_data()
-if df_raw is None or df_raw.empty:
+with st.sidebar:
+    live_mode = st.toggle(
+        "🔴 Mode live", value=False,
+        help=f"Interroge la source toutes les {LIVE_INTERVAL:.0f} s et ne met à jour que les stations modifiées.",
+    )
+    profile_mode = st.toggle(
+        "⏱️ Mesurer les performances", value=PROFILE_DEFAULT,
+        help="Chronomètre chaque étape du rendu (affiché dans l'encadré Performance en bas de page).",
+    )
+    exclude_suspects = st.toggle(
+        "🚩 Exclure les stations suspectes des indicateurs", value=False,
+        help="Les stations aux compteurs figés ou incohérents restent sur la carte et dans les tableaux, mais ne comptent plus dans les indicateurs clés.",
+    )
+
+perf_recorder = start_run(profile_mode)
+
+if live_mode:
+    live_feed = get_live_feed()
+    live_version, live_table, live_cube = live_feed.current()
+    if live_table.empty:
+        st.error(f"Mode live : aucune donnée reçue de {LIVE_SOURCE} ({live_feed.last_error or 'en attente'}).")
+        st.stop()
+    live_report = f"""
+    - **Mode live**: version {live_version} du tableau, {len(live_table)} stations.
+    - *Seules les stations modifiées depuis la dernière interrogation sont re-nettoyées.*
+    """
+    with span('snapshot (live)'):
+        snapshot = build_snapshot(
+            f"live-{id(live_feed)}-{live_version}", None, live_table, live_report, cube=live_cube, stream=f"live:{LIVE_SOURCE}",
+        )
+
+    @st.fragment(run_every=LIVE_INTERVAL)
+    def _watch_live_version():
+        if live_feed.version != live_version:
+            st.rerun()
+
+    _watch_live_version()
+else:
+    # Plusieurs réseaux configurés (data/feeds.json) : tableau fusionné, rafraîchi en tâche de fond.
+    multi_feed = get_multi_feed()
+    if multi_feed is not None:
+        feeds_version, feeds_table, feeds_report = multi_feed.current()
+        if feeds_table.empty:
+            st.error("Aucune donnée valide reçue des réseaux configurés (voir l'encadré Qualité des Données).")
+            quality_section(feeds_report, multi_feed=multi_feed)
+            st.stop()
+        with span('snapshot (réseaux)'):
+            snapshot = build_snapshot(
+                f"feeds-{id(multi_feed)}-{feeds_version}", None, feeds_table, feeds_report, stream=f"feeds:{id(multi_feed)}",
+            )
+
+        @st.fragment(run_every=multi_feed.interval)
+        def _watch_feeds_version():
+            if multi_feed.version != feeds_version:
+                st.rerun()
+
+        _watch_feeds_version()
+    else:
+        with span('snapshot'):
+            snapshot = load_snapshot()
+if snapshot.fingerprint is None:
     st.error("Échec du chargement des données initiales. Vérifiez le fichier 'data/velib_data.json'.")
     st.stop() 
 
-df_clean, data_quality_report = clean_data(df_raw)
+df_clean, data_quality_report = snapshot.df_clean, snapshot.data_quality_report
+anomalies = snapshot.anomalies
 if df_clean.empty:
     st.error("Aucune donnée valide n'a pu être traitée après le nettoyage. Vérifiez la structure du fichier JSON et le script de préparation.")
     st.info(data_quality_report) 
@@ -40,15 +105,7 @@ with st.sidebar:
    
     if not df_clean.empty:
         
-        commune_list = ['Toutes']
-        if 'Commune' in df_clean.columns:
-            try:
-               
-                unique_communes = sorted(df_clean['Commune'].unique())
-                commune_list.extend(unique_communes)
-            except Exception as e:
-                st.warning(f"Impossible de trier les communes: {e}")
-                commune_list.extend(df_clean['Commune'].unique())
+        commune_list = ['Toutes'] + snapshot.filter_index.commune_list
         
         commune_select = st.selectbox(
             "📍 Où cherchez-vous ?",
@@ -60,13 +117,11 @@ with st.sidebar:
         min_velos_dispo = 0
         max_val_velos = 10 
         if 'VelosDispoTotal' in df_clean.columns:
-            try:
-               max_val_velos = int(df_clean['VelosDispoTotal'].max())
-               
-               if max_val_velos < 0: max_val_velos = 0
-            except ValueError:
+            max_val_velos = snapshot.filter_index.max_velos
+            if max_val_velos is None:
                 st.warning("Impossible de déterminer le max de vélos disponibles, utilisation d'une valeur par défaut.")
                 max_val_velos = 50 
+            elif max_val_velos < 0: max_val_velos = 0
 
             min_velos_dispo = st.slider(
                 "Combien de vélos au minimum ?",
@@ -104,15 +159,13 @@ with st.sidebar:
 
 
 
-df_filtered = df_clean.copy()
-if 'Commune' in df_filtered.columns and commune_select != 'Toutes':
-    df_filtered = df_filtered[df_filtered['Commune'] == commune_select]
-if 'VelosDispoTotal' in df_filtered.columns:
-    df_filtered = df_filtered[df_filtered['VelosDispoTotal'] >= min_velos_dispo]
-if type_velo_select == 'Mécanique' and 'VelosMecaniques' in df_filtered.columns:
-    df_filtered = df_filtered[df_filtered['VelosMecaniques'] > 0]
-elif type_velo_select == 'Électrique' and 'VelosElectriques' in df_filtered.columns:
-    df_filtered = df_filtered[df_filtered['VelosElectriques'] > 0]
+filter_key = (commune_select, min_velos_dispo, type_velo_select)
+with span('filtres'):
+    filter_positions = snapshot.filter_index.select(commune_select, min_velos_dispo, type_velo_select)
+    if len(filter_positions) == len(df_clean):
+        df_filtered = df_clean
+    else:
+        df_filtered = df_clean.iloc[filter_positions]
 
 
 st.header(" La Situation Actuelle (selon vos filtres)")
@@ -121,14 +174,21 @@ if df_filtered.empty:
     st.warning(f"Malheureusement, aucune station ne correspond à vos critères (Commune: {commune_select}, Min. Vélos: {min_velos_dispo}, Type: {type_velo_select}).")
     
 else:
-    total_stations_filtrees = len(df_filtered)
-    total_velos_dispo = df_filtered['VelosDispoTotal'].sum() if 'VelosDispoTotal' in df_filtered.columns else 0
-    avg_taux_dispo = df_filtered['TauxDispo'].mean() if 'TauxDispo' in df_filtered.columns else 0.0
+    with span('kpis'):
+        kpi_cube = snapshot.cube
+        if exclude_suspects and anomalies is not None:
+            # Cube sans les stations signalées : retirées par différence, une fois par instantané.
+            kpi_cube = snapshot_cache.get_or_build(
+                snapshot.fingerprint, 'cube (sans suspectes)', lambda: reliable_cube(snapshot.cube, df_clean, anomalies)
+            )
+        total_stations_filtrees, total_velos_dispo, avg_taux_dispo = kpi_cube.lookup(
+            commune_select, min_velos_dispo, type_velo_select
+        )
 
     c1, c2, c3 = st.columns(3) 
     with c1:
         st.metric("Stations trouvées", f"{total_stations_filtrees}") 
-        st.caption("Nombre de stations répondant à vos critères.")
+        st.caption("Nombre de stations répondant à vos critères." + (" Stations suspectes exclues." if exclude_suspects and anomalies is not None else ""))
     with c2:
         st.metric("Vélos disponibles (total)", f"{total_velos_dispo}") 
         st.caption(f"Total de vélos ({type_velo_select if type_velo_select != 'Tous' else 'tous types'}) sur ces stations.")
@@ -142,11 +202,24 @@ else:
 
     st.subheader("🗺️ Où sont les vélos ? La Carte !") 
     st.markdown("Visualisez la répartition géographique. Les **grosses bulles vertes** sont vos meilleures amies ! Les **petites bulles rouges** indiquent une pénurie.")
-    gdf_filtered = make_geodataframe(df_filtered) 
-    if gdf_filtered is not None and not gdf_filtered.empty:
-        map_chart_dispo(gdf_filtered) 
-    else:
-        st.warning("Impossible d'afficher la carte (pas de données géographiques valides pour les filtres actuels).")
+    with span('carte'):
+        geometry = snapshot.geometry
+        if geometry is not None and not df_filtered.empty:
+            # La carte ne dépend que des coordonnées filtrées (sélection par position dans
+            # le tableau de coordonnées de l'instantané) : ses points agrégés sont mis en
+            # cache par combinaison de filtres.
+            map_bins = None
+            if {'TauxDispo', 'VelosDispoTotal'} <= set(df_filtered.columns):
+                map_bins = section_cache.get_or_build(
+                    snapshot.fingerprint, ('carte',) + filter_key,
+                    lambda: aggregate_map_bins(
+                        df_filtered, geometry=geometry if df_filtered is df_clean else geometry.take(filter_positions),
+                        suspects=None if anomalies is None else anomalies[df_filtered.index.to_numpy()] != 0,
+                    ),
+                )
+            map_chart_dispo(df_filtered, map_bins) 
+        else:
+            st.warning("Impossible d'afficher la carte (pas de données géographiques valides pour les filtres actuels).")
 
     st.divider()
 
@@ -156,12 +229,16 @@ else:
     with col1:
         st.markdown("**Capacité vs. Disponibilité : Est-ce qu'une grande station a toujours des vélos ?**")
         if all(col in df_filtered.columns for col in ['CapaciteTotal', 'VelosDispoTotal', 'TauxDispo', 'NomStation', 'Commune']):
-             scatter_chart = scatter_plot_capacite_vs_dispo(df_filtered)
-             st.altair_chart(scatter_chart, use_container_width=True)
+             scatter_chart = section_cache.get_or_build(
+                 snapshot.fingerprint, ('capacite',) + filter_key, lambda: scatter_plot_capacite_vs_dispo(df_filtered)
+             )
+             with span('st.altair_chart (capacité)'):
+                 st.altair_chart(scatter_chart, use_container_width=True)
              st.info("""
-             * **Points verts en haut à droite** : Grandes stations bien remplies 
-             * **Points rouges en bas** : Stations (grandes ou petites) presque vides 
-             * **Points loin de la diagonale** : Indiquent un déséquilibre (très pleine ou très vide par rapport à la capacité).
+             * **Cases vertes en haut à droite** : Grandes stations bien remplies 
+             * **Cases rouges en bas** : Stations (grandes ou petites) presque vides 
+             * **Cases loin de la diagonale** : Indiquent un déséquilibre (très pleine ou très vide par rapport à la capacité).
+             * **Opacité** : Plus la case est foncée, plus elle regroupe de stations.
              """)
         else:
             st.warning("Données insuffisantes pour afficher ce graphique.")
@@ -169,51 +246,42 @@ else:
     with col2:
         if commune_select == 'Toutes' and 'Commune' in df_filtered.columns:
             st.markdown("**Comparaison des Communes : Où est-ce le plus facile (en moyenne) ?**")
-            bar_chart = bar_chart_dispo_commune(df_filtered)
-            st.altair_chart(bar_chart, use_container_width=True)
+            # Le classement ne dépend que de l'agrégat filtré (seuil et type), pas de la commune.
+            bar_chart = section_cache.get_or_build(
+                snapshot.fingerprint, ('communes', min_velos_dispo, type_velo_select),
+                lambda: bar_chart_dispo_commune(
+                    df_filtered, df_agg=snapshot.cube.commune_ranking(min_velos_dispo, type_velo_select)
+                ),
+            )
+            with span('st.altair_chart (communes)'):
+                st.altair_chart(bar_chart, use_container_width=True)
             st.info("""
             Ce classement peut varier énormément ! Une commune avec beaucoup de gares ou de bureaux peut se vider le soir, tandis qu'une zone résidentielle peut se remplir. 
             Les zones très touristiques ou proches de grands lieux (comme Bercy/Accor Arena après un événement) peuvent aussi voir leur disponibilité chuter rapidement.
             """)
         elif commune_select != 'Toutes' and all(col in df_filtered.columns for col in ['NomStation', 'VelosDispoTotal', 'BornesLibres', 'TauxDispo']):
             st.markdown(f"**Zoom sur {commune_select} : Quelles stations choisir ?**")
-            df_commune = df_filtered.sort_values(by='TauxDispo', ascending=False)
-            display_cols_map = {
-                'NomStation':'Station', 
-                'VelosDispoTotal':'Vélos ', 
-                'BornesLibres':'Places ', 
-                'TauxDispo':'Dispo (%)'
-            }
-            display_cols = [display_cols_map[col] for col in display_cols_map if col in df_commune.columns]
-            df_display = df_commune[[col for col in display_cols_map if col in df_commune.columns]].rename(columns=display_cols_map)
-            
-            if 'Station' in df_display.columns:
-                df_display = df_display.set_index('Station')
-
-            column_config = {}
-            if 'Dispo (%)' in df_display.columns:
-                column_config["Dispo (%)"] = st.column_config.ProgressColumn(
-                        "Dispo (%)", format="%.1f%%", min_value=0, max_value=100,
-                    )
-
-            st.dataframe(df_display, column_config=column_config if column_config else None, height=300)
-            st.info(" Triez par Vélos ou Places en cliquant sur l'en-tête. La barre 'Dispo (%)' donne une vue rapide.")
+            zoom_commune_table(df_filtered, commune_select, anomalies)
         else:
              st.info("Sélectionnez 'Toutes' les communes pour la comparaison ou vérifiez les données.")
 
     st.divider()
 
 
-with st.expander(" Qualité des Données & Limites de l'Analyse"):
-    st.markdown("### Qualité des Données") 
-    st.info(data_quality_report) 
-    
-    st.markdown("### Limites")
-    st.warning("""
-    - **Instantanéité Volatile**: Les données Vélib' changent à chaque seconde ! Ce dashboard est une photo, pas un film. Rafraîchissez la page (F5) pour les données les plus récentes.
-    - **Pas de Boule de Cristal**: On voit l'état actuel, mais on ne prédit pas si la station sera vide dans 10 minutes.
-    - **Fiabilité des Capteurs**: L'analyse dépend de la précision des infos remontées par chaque station. Parfois, un vélo peut être marqué disponible alors qu'il est défectueux.
-    """) 
+if snapshot.spatial_index is not None:
+    secours_section(df_clean, snapshot.spatial_index, anomalies)
+
+
+forecast_section()
+episodes_section()
+
+
+quality_section(data_quality_report, live_feed if live_mode else None, multi_feed if not live_mode else None, anomalies)
+
+
+if perf_recorder is not None:
+    perf_recorder.log()
+    performance_section(perf_recorder)
 
 
 st.header("🏁 Ce qu'il faut retenir & Prochaines Étapes")
@@ -224,7 +292,6 @@ if df_filtered.empty:
      conclusion_recommendation = "Essayez de demander moins de vélos minimum, d'élargir la zone géographique ou d'accepter tous les types de vélos."
 else:
      
-     total_stations_filtrees = len(df_filtered) 
      type_texte = f"de type {type_velo_select.lower()}" if type_velo_select != 'Tous' else "tous types confondus"
      zone_texte = f"dans la commune de {commune_select}" if commune_select != 'Toutes' else "dans les zones sélectionnées"
      
@@ -0,0 +1,88 @@
+# benchmarks/bench_anomalies.py
+"""
+Détecteur de stations suspectes sur une suite d'instantanés synthétiques
+(tableaux au format nettoyé, un instantané toutes les `--step` minutes).
+
+    python -m benchmarks.bench_anomalies --stations 1500 100000 --snapshots 300 --step 5
+
+Une petite part des stations est faussée dès le départ : compteurs figés,
+mécaniques + électriques ≠ vélos, vélos + places au-delà de la capacité.
+Mesure le coût d'un instantané (il doit croître comme le nombre de stations)
+et compare les stations signalées à celles faussées.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.anomalies import ANOMALY_LABELS, CAPACITY, FROZEN, TYPES, StationAnomalyDetector
+
+
+def make_snapshots(n_stations, n_snapshots, step_minutes, faulty=0.01, seed=42):
+    """Instantanés successifs (générateur) et stations faussées par type d'anomalie."""
+    rng = np.random.default_rng(seed)
+    capacity = rng.integers(10, 70, n_stations)
+    bikes = (capacity * rng.random(n_stations)).astype(np.int64)
+    n_faulty = max(int(n_stations * faulty), 1)
+    faults = rng.permutation(n_stations)
+    truth = {FROZEN: faults[:n_faulty], TYPES: faults[n_faulty:2 * n_faulty], CAPACITY: faults[2 * n_faulty:3 * n_faulty]}
+    codes = np.arange(n_stations).astype(str)
+    start = pd.Timestamp('2025-10-01', tz='UTC')
+
+    def generate():
+        nonlocal bikes
+        for i in range(n_snapshots):
+            # Une station sur trois voit des vélos partir ou arriver à chaque pas.
+            moves = rng.integers(-3, 4, n_stations) * (rng.random(n_stations) < 0.33)
+            moves[truth[FROZEN]] = 0
+            bikes = np.clip(bikes + moves, 0, capacity)
+            docks = capacity - bikes
+            docks[truth[CAPACITY]] += 5 + capacity[truth[CAPACITY]] // 4
+            mechanical = bikes // 2
+            ebike = bikes - mechanical
+            ebike[truth[TYPES]] += 2
+            yield pd.DataFrame({
+                'stationcode': codes,
+                'CapaciteTotal': capacity,
+                'BornesLibres': docks,
+                'VelosDispoTotal': bikes,
+                'VelosMecaniques': mechanical,
+                'VelosElectriques': ebike,
+                'duedate': start + pd.Timedelta(minutes=i * step_minutes),
+            })
+
+    return generate(), truth
+
+
+def run(n_stations, n_snapshots, step_minutes, frozen_hours):
+    snapshots, truth = make_snapshots(n_stations, n_snapshots, step_minutes)
+    detector = StationAnomalyDetector(frozen_hours=frozen_hours)
+    timings = []
+    for df in snapshots:
+        start = time.perf_counter()
+        flags = detector.observe(df)
+        timings.append(time.perf_counter() - start)
+    timings = np.array(timings[1:]) * 1e3  # le premier instantané alloue les cases
+    print(f"\n{n_stations} stations, {n_snapshots} instantanés ({n_snapshots * step_minutes / 60:.0f} h) : "
+          f"{np.median(timings):.2f} ms par instantané (p95 {np.percentile(timings, 95):.2f} ms), "
+          f"{detector.nbytes / 1024:.0f} Ko d'état")
+    for flag, expected in truth.items():
+        found = np.flatnonzero(flags & flag)
+        hits = np.intersect1d(found, expected).size
+        print(f"  {ANOMALY_LABELS[flag]:<34} {hits}/{expected.size} faussées retrouvées, {found.size - hits} signalées à tort")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stations', type=int, nargs='+', default=[1500, 100_000])
+    parser.add_argument('--snapshots', type=int, default=300)
+    parser.add_argument('--step', type=int, default=5, help="Minutes entre deux instantanés.")
+    parser.add_argument('--frozen-hours', type=float, default=12)
+    args = parser.parse_args()
+    for n_stations in args.stations:
+        run(n_stations, args.snapshots, args.step, args.frozen_hours)
+
+
+if __name__ == '__main__':
+    main()
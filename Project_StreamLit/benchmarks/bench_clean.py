@@ -0,0 +1,85 @@
+# benchmarks/bench_clean.py
+"""
+Compare l'ancienne version de `clean_data` (apply ligne par ligne) à la
+version vectorisée sur des flux synthétiques.
+
+    python -m benchmarks.bench_clean --sizes 1500 100000 10000000
+"""
+import argparse
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import make_raw_feed
+from utils.prep import clean_data
+
+
+def clean_data_legacy(df_raw):
+    """Copie de `clean_data` avant vectorisation, conservée comme référence."""
+    df = df_raw.copy()
+    if 'coordonnees_geo' in df.columns and df['coordonnees_geo'].apply(lambda x: isinstance(x, dict)).any():
+        coords = pd.json_normalize(df['coordonnees_geo'])
+        df['lat'] = coords.get('lat', pd.NA)
+        df['lon'] = coords.get('lon', pd.NA)
+    else:
+        df['lat'] = pd.NA
+        df['lon'] = pd.NA
+    rename_map = {
+        'name': 'NomStation', 'nom_arrondissement_communes': 'Commune', 'capacity': 'CapaciteTotal',
+        'numdocksavailable': 'BornesLibres', 'numbikesavailable': 'VelosDispoTotal',
+        'mechanical': 'VelosMecaniques', 'ebike': 'VelosElectriques',
+        'is_renting': 'LocationPossible', 'is_returning': 'RetourPossible',
+    }
+    df = df.rename(columns=rename_map)
+    cols_to_keep = list(rename_map.values()) + ['lat', 'lon']
+    for col in df.columns:
+        if col not in cols_to_keep:
+            df = df.drop(columns=[col])
+    for col in ['Commune', 'NomStation']:
+        if col in df.columns:
+            if df[col].isnull().mean() * 100 > 50:
+                df = df.drop(columns=[col])
+            else:
+                df[col] = df[col].fillna('Inconnue').astype(str)
+    for col in ['CapaciteTotal', 'BornesLibres', 'VelosDispoTotal', 'VelosMecaniques', 'VelosElectriques']:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
+    df['lat'] = pd.to_numeric(df['lat'], errors='coerce')
+    df['lon'] = pd.to_numeric(df['lon'], errors='coerce')
+    df.dropna(subset=['lat', 'lon'], inplace=True)
+    for col in ['LocationPossible', 'RetourPossible']:
+        if col in df.columns:
+            df[col] = df[col].astype(str).apply(lambda x: True if x == 'OUI' else False)
+    df = df[(df['LocationPossible'] == True) | (df['RetourPossible'] == True)]
+    df['TauxDispo'] = df.apply(lambda row: (row['VelosDispoTotal'] / row['CapaciteTotal'] * 100) if row['CapaciteTotal'] > 0 else 0, axis=1)
+    return df
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1500, 100_000, 10_000_000])
+    parser.add_argument('--legacy-max-rows', type=int, default=1_000_000,
+                        help="Au-delà, l'ancienne version n'est pas exécutée (plusieurs minutes).")
+    args = parser.parse_args()
+
+    print(f"{'lignes':>12} {'ancienne (s)':>14} {'vectorisée (s)':>16} {'gain':>8}")
+    for n in args.sizes:
+        df_raw = make_raw_feed(n)
+        new, t_new = _timed(clean_data, df_raw)
+        new = new[0]
+        if n <= args.legacy_max_rows:
+            old, t_old = _timed(clean_data_legacy, df_raw)
+            pd.testing.assert_frame_equal(old, new)
+            print(f"{n:>12} {t_old:>14.3f} {t_new:>16.3f} {t_old / t_new:>7.1f}x")
+        else:
+            print(f"{n:>12} {'-':>14} {t_new:>16.3f} {'-':>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+# benchmarks/bench_episodes.py
+"""
+Temps de calcul des épisodes vides/pleins sur un historique synthétique
+(par défaut un mois de données à la minute pour 1 500 stations).
+
+    python -m benchmarks.bench_episodes --stations 1500 --days 30 --step 1
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import make_history_matrix
+from utils.episodes import episode_stats, station_states
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stations', type=int, default=1500)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--step', type=int, default=1, help="Pas de temps en minutes.")
+    args = parser.parse_args()
+
+    capacity, t0, bikes = make_history_matrix(args.stations, args.days, args.step)
+    state = station_states(bikes, capacity[:, None] - bikes)
+    del bikes
+    codes = np.arange(args.stations).astype(str)
+
+    start = time.perf_counter()
+    stats = episode_stats(codes, codes, state, t0, args.step)
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.stations} stations × {state.shape[1]} pas ({state.size / 1e6:.0f} M cases) : "
+          f"épisodes en {elapsed:.2f} s")
+    for kind in ('vide', 'pleine'):
+        print(f"{kind:<7} {stats.counts[kind].sum():>8} épisodes, "
+              f"p95 médian {np.nanmedian(stats.p95_minutes[kind]):.0f} min")
+    print(stats.ranking('vide', top=3).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+# benchmarks/bench_feeds.py
+"""
+Rafraîchissement de plusieurs réseaux servis par des serveurs HTTP locaux
+(un serveur par réseau, chacun avec sa latence), au format Vélib' ou GBFS.
+
+    python -m benchmarks.bench_feeds --feeds 6 --stations 1500 --latency 0.1 0.6
+    python -m benchmarks.bench_feeds --feeds 4 --failures
+
+Compare la durée d'un rafraîchissement concurrent à la somme et au maximum
+des latences, puis mesure un second rafraîchissement (réponses 304). Avec `--failures`, un serveur supplémentaire
+répond 503 et un autre dépasse le délai : les autres réseaux sont fusionnés
+quand même et les deux sources fautives passent en attente.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import make_raw_feed
+from utils.feeds import FeedSource, FeedSpec, FetchThreads, MultiFeed
+
+
+class _FeedHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.latency)
+        if server.fail:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = server.files.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        etag = '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # Client parti après son délai (serveur lent de --failures).
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def _velib_files(n_stations, seed):
+    body = make_raw_feed(n_stations, seed=seed).to_json(orient='records', force_ascii=False)
+    return {'/velib.json': body.encode()}
+
+
+def _gbfs_files(n_stations, seed, port):
+    df = make_raw_feed(n_stations, seed=seed)
+    coords = df['coordonnees_geo']
+    information = [
+        {'station_id': code, 'name': name, 'capacity': int(cap),
+         'lat': c['lat'] if c else None, 'lon': c['lon'] if c else None}
+        for code, name, cap, c in zip(df['stationcode'], df['name'], df['capacity'], coords)
+    ]
+    status = [
+        {'station_id': code, 'num_bikes_available': int(bikes), 'num_docks_available': int(docks),
+         'num_bikes_available_types': [{'mechanical': int(m)}, {'ebike': int(e)}],
+         'is_installed': 1, 'is_renting': int(r == 'OUI'), 'is_returning': int(t == 'OUI'),
+         'last_reported': 1761397000}
+        for code, bikes, docks, m, e, r, t in zip(
+            df['stationcode'], df['numbikesavailable'], df['numdocksavailable'], df['mechanical'],
+            df['ebike'], df['is_renting'], df['is_returning'],
+        )
+    ]
+    base = f'http://127.0.0.1:{port}'
+    discovery = {'data': {'fr': {'feeds': [
+        {'name': 'station_information', 'url': f'{base}/station_information.json'},
+        {'name': 'station_status', 'url': f'{base}/station_status.json'},
+    ]}}}
+    return {
+        '/gbfs.json': json.dumps(discovery).encode(),
+        '/station_information.json': json.dumps({'data': {'stations': information}}).encode(),
+        '/station_status.json': json.dumps({'data': {'stations': status}}).encode(),
+    }
+
+
+def serve(kind, n_stations, latency, seed=0, fail=False):
+    """Serveur local d'un réseau synthétique ; renvoie (serveur, FeedSpec)."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _FeedHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.fail = fail
+    port = server.server_address[1]
+    if kind == 'velib':
+        server.files = _velib_files(n_stations, seed)
+        spec = FeedSpec(f'Réseau {seed} (Vélib)', f'http://127.0.0.1:{port}/velib.json', 'velib')
+    else:
+        server.files = _gbfs_files(n_stations, seed, port)
+        # Un réseau GBFS sur deux passe par le fichier de découverte gbfs.json.
+        source = f'http://127.0.0.1:{port}/gbfs.json' if seed % 4 == 1 else f'http://127.0.0.1:{port}'
+        spec = FeedSpec(f'Réseau {seed} (GBFS)', source, 'gbfs')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, spec
+
+
+async def _sequential(specs, timeout):
+    """Référence : les mêmes sources interrogées l'une après l'autre."""
+    threads = FetchThreads()
+    start = time.perf_counter()
+    for spec in specs:
+        source = FeedSource(spec, timeout)
+        await source.poll(threads)
+        source.close()
+    threads.close()
+    return time.perf_counter() - start
+
+
+async def _run(specs, timeout):
+    feed = MultiFeed(specs, timeout=timeout)
+    timings = []
+    for _ in range(2):
+        start = time.perf_counter()
+        await feed.refresh()
+        timings.append(time.perf_counter() - start)
+    sequential = await _sequential(specs, timeout)
+    feed.close()
+    return feed, timings, sequential
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--feeds', type=int, default=6)
+    parser.add_argument('--stations', type=int, default=1500, help="Stations par réseau.")
+    parser.add_argument('--latency', type=float, nargs=2, default=(0.1, 0.6), help="Latences min et max (s).")
+    parser.add_argument('--timeout', type=float, default=2.0)
+    parser.add_argument('--failures', action='store_true')
+    args = parser.parse_args()
+
+    latencies = np.linspace(*args.latency, args.feeds)
+    servers = [
+        serve('velib' if i % 2 == 0 else 'gbfs', args.stations, latency, seed=i)
+        for i, latency in enumerate(latencies)
+    ]
+    if args.failures:
+        servers.append(serve('velib', args.stations, 0.05, seed=args.feeds, fail=True))
+        servers.append(serve('velib', args.stations, args.timeout * 2, seed=args.feeds + 1))
+    specs = [spec for _, spec in servers]
+
+    feed, timings, sequential = asyncio.run(_run(specs, args.timeout))
+    _, table, _ = feed.current()
+
+    # Les réseaux GBFS découverts via gbfs.json font deux allers-retours.
+    print(f"{len(specs)} réseaux, latences {latencies.min():.2f} à {latencies.max():.2f} s "
+          f"(somme {latencies.sum():.2f} s, découverte GBFS : deux allers-retours)")
+    print(f"Premier rafraîchissement   {timings[0]:6.2f} s")
+    print(f"Second (304)               {timings[1]:6.2f} s")
+    print(f"Séquentiel (référence)     {sequential:6.2f} s")
+    with pd.option_context('display.width', 160, 'display.max_columns', 10):
+        print(feed.status_frame().drop(columns=['Format']).to_string(index=False))
+        print(table.groupby('Reseau', observed=True).size().rename('stations').to_string())
+
+    for server, _ in servers:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
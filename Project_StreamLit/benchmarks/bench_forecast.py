@@ -0,0 +1,38 @@
+# benchmarks/bench_forecast.py
+"""
+Temps d'ajustement des prévisions par station sur un historique synthétique
+(par défaut un mois de données à la minute pour 1 500 stations).
+
+    python -m benchmarks.bench_forecast --stations 1500 --days 30 --step 1
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import make_history_matrix
+from utils.forecast import fit_forecasts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stations', type=int, default=1500)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--step', type=int, default=1, help="Pas de temps en minutes.")
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    capacity, t0, matrix = make_history_matrix(args.stations, args.days, args.step)
+    codes = np.arange(args.stations).astype(str)
+
+    start = time.perf_counter()
+    table = fit_forecasts(codes, codes, capacity, matrix, t0, args.step, workers=args.workers)
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.stations} stations × {matrix.shape[1]} pas ({matrix.size / 1e6:.0f} M valeurs) : "
+          f"ajustement en {elapsed:.2f} s")
+    print(f"P(≥5 vélos dans 30 min) station 0 : {table.probability('0', 5, 30):.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+# benchmarks/bench_memory.py
+"""
+Mesure l'empreinte mémoire du tableau des stations avant et après
+`compact_station_table`. Échoue (code de sortie 1) si le gain est inférieur
+au seuil demandé.
+
+    python -m benchmarks.bench_memory --rows 1000000 --min-ratio 4
+"""
+import argparse
+import sys
+
+from benchmarks.synthetic import make_raw_feed
+from utils.prep import clean_data, compact_station_table
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--network-size', type=int, default=1500,
+                        help="Nombre de stations distinctes (les lignes sont des instantanés successifs).")
+    parser.add_argument('--min-ratio', type=float, default=4.0)
+    args = parser.parse_args()
+
+    df_clean, _ = clean_data(make_raw_feed(args.rows, network_size=args.network_size))
+    before = df_clean.memory_usage(deep=True).sum()
+    df_compact = compact_station_table(df_clean)
+    after = df_compact.memory_usage(deep=True).sum()
+    ratio = before / after
+
+    print(f"{len(df_clean)} lignes : {before / 1024 ** 2:.1f} Mo → {after / 1024 ** 2:.1f} Mo (×{ratio:.1f})")
+    print(df_compact.memory_usage(deep=True).div(len(df_compact)).round(2).to_string())
+    if ratio < args.min_ratio:
+        print(f"ÉCHEC : gain ×{ratio:.1f} inférieur au seuil ×{args.min_ratio}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# benchmarks/bench_reruns.py
+"""
+Latence de rerun de l'application par interaction, mesurée avec l'AppTest de
+Streamlit (exécution sans navigateur), sur le fichier `data/velib_data.json`.
+
+    python -m benchmarks.bench_reruns --app app.py --rounds 5
+
+Chaque interaction est rejouée `--rounds` fois en alternant deux valeurs :
+les tours suivants profitent des sections mises en cache. AppTest ré-exécute
+le script entier même pour un widget placé dans un fragment : le gain des
+fragments dans le navigateur est donc sous-estimé ici.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import streamlit.logger as streamlit_logger
+from streamlit.testing.v1 import AppTest
+
+
+def _sidebar_slider(at):
+    return at.sidebar.slider[0]
+
+
+def _sidebar_selectbox(at):
+    return at.sidebar.selectbox[0]
+
+
+def _sidebar_radio(at):
+    return at.sidebar.radio[0]
+
+
+def _number_input(label):
+    return lambda at: next(w for w in at.number_input if w.label == label)
+
+
+INTERACTIONS = [
+    ('Seuil de vélos', _sidebar_slider, (3, 1)),
+    ('Commune', _sidebar_selectbox, ('Paris', 'Toutes')),
+    ('Type de vélo', _sidebar_radio, ('Électrique', 'Tous')),
+    ('Station de secours (latitude)', _number_input("Latitude de départ"), (48.85, 48.8584)),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--app', default=os.path.join(os.path.dirname(__file__), '..', 'app.py'))
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+    streamlit_logger.set_log_level('error')
+
+    at = AppTest.from_file(os.path.abspath(args.app), default_timeout=300)
+    start = time.perf_counter()
+    at.run()
+    print(f"{'Premier rendu':<32} {(time.perf_counter() - start) * 1e3:8.0f} ms")
+
+    for label, widget, values in INTERACTIONS:
+        timings = []
+        for i in range(args.rounds):
+            widget(at).set_value(values[i % 2])
+            start = time.perf_counter()
+            at.run()
+            timings.append(time.perf_counter() - start)
+            if at.exception:
+                raise RuntimeError(at.exception)
+        timings = np.array(timings) * 1e3
+        print(f"{label:<32} premier {timings[0]:6.0f} ms, médiane {np.median(timings):6.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# benchmarks/bench_shared.py
+"""
+Mémoire occupée par le tableau nettoyé quand plusieurs processus de
+l'application servent le même instantané (flux synthétique).
+
+    python -m benchmarks.bench_shared --stations 100000 --workers 4
+
+Chaque processus exécute `load_snapshot` sur le même fichier, puis tous
+mesurent en même temps leur mémoire proportionnelle (PSS, Linux : les pages
+partagées entre N processus comptent pour 1/N dans chacun). Comparaison entre
+copies privées (VELIB_SHARED=0) et génération partagée mappée en mémoire.
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+
+def _pss_bytes():
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            if line.startswith('Pss:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def _worker(path, shared_root, shared, loaded, barrier, results):
+    os.environ['VELIB_SHARED'] = '1' if shared else '0'
+    os.environ['VELIB_ARTIFACT'] = '0'
+    import streamlit.logger as streamlit_logger
+    import utils.shared
+    from utils.io import load_snapshot
+
+    # Modules chargés à la demande par load_snapshot : importés avant la mesure.
+    import utils.artifact, utils.cube, utils.filters, utils.geometry, utils.prep, utils.spatial  # noqa: F401
+
+    streamlit_logger.set_log_level('error')
+    utils.shared.SHARED_ENABLED = shared
+    utils.shared.shared_store = utils.shared.SharedSnapshotStore(shared_root)
+    before = _pss_bytes()
+    start = time.perf_counter()
+    snapshot = load_snapshot(path, streaming=False)
+    elapsed = time.perf_counter() - start
+    loaded.set()
+    # Mesure simultanée : tous les processus tiennent leur tableau au même moment.
+    barrier.wait()
+    results.put((_pss_bytes() - before, elapsed, len(snapshot.df_clean)))
+    barrier.wait()
+
+
+def _run(path, shared_root, shared, workers):
+    ctx = multiprocessing.get_context('spawn')
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    loaded = ctx.Event()
+    procs = [
+        ctx.Process(target=_worker, args=(path, shared_root, shared, loaded, barrier, results))
+        for _ in range(workers)
+    ]
+    # Le premier processus publie la génération, les suivants s'y attachent.
+    procs[0].start()
+    loaded.wait()
+    for proc in procs[1:]:
+        proc.start()
+    out = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+    return out
+
+
+def main():
+    from benchmarks.synthetic import write_raw_feed
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stations', type=int, default=100_000)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_raw_feed(os.path.join(tmp, 'velib_data.json'), args.stations)
+        for label, shared in (("copies privées", False), ("génération partagée", True)):
+            out = _run(path, os.path.join(tmp, 'shared'), shared, args.workers)
+            pss = sorted(r[0] / 1024 ** 2 for r in out)
+            times = sorted(r[1] for r in out)
+            print(f"{label:<20} PSS ajoutée : {sum(pss):7.1f} Mo pour {args.workers} processus "
+                  f"({' / '.join(f'{x:.0f}' for x in pss)} Mo), chargement {times[0]:.2f} à {times[-1]:.2f} s")
+
+if __name__ == '__main__':
+    main()
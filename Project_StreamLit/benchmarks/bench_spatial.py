@@ -0,0 +1,57 @@
+# benchmarks/bench_spatial.py
+"""
+Compare la requête « k stations les plus proches avec au moins N vélos » de
+`StationSpatialIndex` à un calcul haversine exhaustif.
+
+    python -m benchmarks.bench_spatial --stations 100000 --queries 1000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import make_raw_feed
+from utils.prep import clean_data
+from utils.spatial import StationSpatialIndex, nearest_bruteforce
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stations', type=int, default=100_000)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('-k', type=int, default=5)
+    parser.add_argument('--min-velos', type=int, default=3)
+    args = parser.parse_args()
+
+    df, _ = clean_data(make_raw_feed(args.stations))
+    lat, lon = df['lat'].to_numpy(), df['lon'].to_numpy()
+    velos = df['VelosDispoTotal'].to_numpy()
+
+    start = time.perf_counter()
+    index = StationSpatialIndex.from_frame(df)
+    t_build = time.perf_counter() - start
+
+    rng = np.random.default_rng(0)
+    queries = np.column_stack([rng.uniform(lat.min(), lat.max(), args.queries),
+                               rng.uniform(lon.min(), lon.max(), args.queries)])
+    mask = velos >= args.min_velos
+
+    t_index = t_brute = 0.0
+    for q_lat, q_lon in queries:
+        start = time.perf_counter()
+        pos, dist = index.nearest(q_lat, q_lon, args.k, min_velos=args.min_velos)
+        t_index += time.perf_counter() - start
+
+        start = time.perf_counter()
+        ref_pos, ref_dist = nearest_bruteforce(lat, lon, q_lat, q_lon, args.k, mask)
+        t_brute += time.perf_counter() - start
+
+        np.testing.assert_allclose(dist, ref_dist)
+
+    print(f"{len(df)} stations, construction de l'index : {t_build * 1e3:.1f} ms")
+    print(f"index spatial : {t_index / args.queries * 1e3:.3f} ms / requête")
+    print(f"force brute   : {t_brute / args.queries * 1e3:.3f} ms / requête")
+
+
+if __name__ == '__main__':
+    main()
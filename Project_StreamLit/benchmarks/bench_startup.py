@@ -0,0 +1,99 @@
+# benchmarks/bench_startup.py
+"""
+Démarrage à froid de l'application : chaque mesure lance un interpréteur neuf
+qui exécute une fois `app.py` avec l'AppTest de Streamlit.
+
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --app /chemin/vers/autre/app.py
+
+Sont mesurés, par sous-processus : le temps d'import des bibliothèques de base
+(pandas, streamlit), puis le premier rendu complet (time-to-first-render).
+Le premier rendu est mesuré sans artefact (VELIB_ARTIFACT=0, lecture du JSON)
+puis avec l'artefact Arrow `data/velib_snapshot.arrow`, régénéré avant la
+mesure s'il est absent ou ne correspond plus au JSON (mesure sautée s'il ne
+peut pas être produit).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+
+_CHILD = r"""
+import json, os, sys, time
+start = time.perf_counter()
+import pandas, streamlit
+import streamlit.logger as streamlit_logger
+from streamlit.testing.v1 import AppTest
+imports = time.perf_counter() - start
+streamlit_logger.set_log_level('error')
+at = AppTest.from_file(sys.argv[1], default_timeout=300)
+start = time.perf_counter()
+at.run()
+render = time.perf_counter() - start
+if at.exception:
+    raise SystemExit(str(at.exception))
+print(json.dumps({'imports': imports, 'render': render, 'modules': len(sys.modules)}))
+"""
+
+
+# Artefact à jour pour le JSON de l'application, (re)généré sinon : imprime 'ok' ou 'built'.
+_ENSURE_ARTIFACT = r"""
+from utils.artifact import TABLE_VERSION, artifact_metadata, write_artifact
+from utils.cache import file_fingerprint
+from utils.io import DATA_PATH
+meta = artifact_metadata() or {}
+if meta.get('version') == TABLE_VERSION and meta.get('source_fingerprint') == file_fingerprint(DATA_PATH):
+    print('ok')
+else:
+    write_artifact()
+    print('built')
+"""
+
+
+def _ensure_artifact(app):
+    """True si l'artefact de l'application est à jour (au besoin régénéré), False s'il ne peut pas être produit."""
+    out = subprocess.run(
+        [sys.executable, '-c', _ENSURE_ARTIFACT], cwd=os.path.dirname(app), capture_output=True, text=True,
+    )
+    if out.returncode != 0:
+        error = (out.stderr.strip().splitlines() or ['erreur inconnue'])[-1]
+        print(f"artefact Arrow    mesure sautée : artefact impossible à produire ({error}).")
+        return False
+    if out.stdout.strip().splitlines()[-1] == 'built':
+        print("artefact Arrow    absent ou périmé : régénéré avant la mesure.")
+    return True
+
+
+def _run_child(app, artifact):
+    # Sans génération partagée (data/shared) : la mesure JSON relit et nettoie vraiment le JSON.
+    env = dict(os.environ, VELIB_ARTIFACT='1' if artifact else '0', VELIB_SHARED='0')
+    out = subprocess.run(
+        [sys.executable, '-c', _CHILD, app], cwd=os.path.dirname(app), env=env,
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--app', default=os.path.join(os.path.dirname(__file__), '..', 'app.py'))
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+    app = os.path.abspath(args.app)
+
+    for label, artifact in (("JSON", False), ("artefact Arrow", True)):
+        if artifact and not _ensure_artifact(app):
+            continue
+        results = [_run_child(app, artifact) for _ in range(args.runs)]
+        imports = np.median([r['imports'] for r in results]) * 1e3
+        render = np.median([r['render'] for r in results]) * 1e3
+        print(f"{label:<16} imports {imports:6.0f} ms, premier rendu {render:6.0f} ms, "
+              f"{results[-1]['modules']} modules chargés (médianes sur {args.runs} démarrages)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+# benchmarks/suite.py
+"""
+Suite de benchmarks du pipeline de l'application, étape par étape
+(chargement, nettoyage, coordonnées, filtres, graphiques), sur des flux
+synthétiques de plusieurs tailles. Pour chaque étape : temps médian et pic
+mémoire Python (tracemalloc, mesuré à part pour ne pas fausser les temps).
+
+Un premier passage complet, non chronométré, chauffe les imports, caches et
+allocations. Chaque étape est ensuite exécutée au moins `--repeat` fois, et
+tant que le temps cumulé n'atteint pas `--min-time` secondes : les étapes de
+quelques millisecondes sont mesurées sur des centaines d'exécutions plutôt
+que sur trois.
+
+    python -m benchmarks.suite --save benchmarks/baseline.json
+    python -m benchmarks.suite --compare benchmarks/baseline.json --threshold 0.25
+
+En mode comparaison, le code de sortie est 1 si une étape est plus lente (ou
+plus gourmande en mémoire) que la référence au-delà du seuil. Une régression
+doit se confirmer : les tailles concernées sont mesurées une seconde fois et
+chaque étape garde le meilleur de ses deux temps.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import streamlit.logger as streamlit_logger
+
+from benchmarks.synthetic import write_raw_feed
+from utils.cache import snapshot_cache
+from utils.cube import AvailabilityCube
+from utils.filters import StationFilterIndex
+from utils.geometry import StationGeometry
+from utils.io import load_data
+from utils.prep import clean_data, compact_station_table, make_geodataframe
+from utils.viz import aggregate_map_bins, bar_chart_dispo_commune, map_chart_dispo, scatter_plot_capacite_vs_dispo
+
+
+# Temps cumulé minimal mesuré par étape (s).
+MIN_STAGE_SECONDS = 0.5
+# Écarts de temps absolus en dessous desquels une variation relative n'est pas une régression (bruit).
+MIN_DELTA_SECONDS = 0.005
+MIN_DELTA_MB = 1.0
+
+
+def _load(path):
+    snapshot_cache.invalidate(path)
+    return load_data(path)
+
+
+def _filter_block(state):
+    """Bloc de filtres de app.py : sélection des stations, KPIs et classement des communes."""
+    positions = state['filter_index'].select('Toutes', 3, 'Électrique')
+    df_filtered = state['df_compact'].iloc[positions]
+    kpis = state['cube'].lookup('Toutes', 3, 'Électrique')
+    ranking = state['cube'].commune_ranking(3, 'Électrique')
+    return df_filtered, kpis, ranking, state['geometry'].take(positions)
+
+
+def pipeline(path):
+    """
+    Étapes dans l'ordre de l'application : (nom, fonction(state) -> valeur,
+    clé sous laquelle ranger la valeur dans `state`).
+    """
+    return [
+        ('load_data', lambda s: _load(path), 'df_raw'),
+        ('clean_data', lambda s: clean_data(s['df_raw'])[0], 'df_clean'),
+        ('compact_station_table', lambda s: compact_station_table(s['df_clean']), 'df_compact'),
+        ('station_geometry', lambda s: StationGeometry.from_frame(s['df_compact']), 'geometry'),
+        ('make_geodataframe', lambda s: make_geodataframe(s['df_compact']), None),
+        ('filter_index', lambda s: StationFilterIndex(s['df_compact']), 'filter_index'),
+        ('aggregate_cube', lambda s: AvailabilityCube.from_frame(s['df_compact']), 'cube'),
+        ('filter_block', _filter_block, 'filtered'),
+        ('bar_chart_dispo_commune',
+         lambda s: bar_chart_dispo_commune(s['filtered'][0], s['filtered'][2]).to_dict(), None),
+        ('scatter_plot_capacite_vs_dispo',
+         lambda s: scatter_plot_capacite_vs_dispo(s['filtered'][0]).to_dict(), None),
+        ('map_chart_dispo', lambda s: map_chart_dispo(
+            s['filtered'][0], aggregate_map_bins(s['filtered'][0], geometry=s['filtered'][3])
+        ), None),
+    ]
+
+
+def _run_stages(stages, step):
+    """Passage complet : `step(name, func, state)` renvoie la valeur de chaque étape."""
+    state = {}
+    for name, func, key in stages:
+        value = step(name, func, state)
+        if key is not None:
+            state[key] = value
+        # Libéré ici, hors chronomètre, plutôt qu'au début de l'étape suivante.
+        value = None
+
+
+def run_size(n_stations, repeat, workdir, min_time=MIN_STAGE_SECONDS):
+    path = write_raw_feed(os.path.join(workdir, f'velib-{n_stations}.json'), n_stations)
+    stages = pipeline(path)
+    timings = {name: [] for name, _, _ in stages}
+    peaks = {}
+
+    def measure_time(name, func, state):
+        samples = timings[name]
+        # Comme timeit : ramasse-miettes coupé pendant les mesures, passé entre deux étapes.
+        gc.collect()
+        gc.disable()
+        try:
+            while len(samples) < repeat or sum(samples) < min_time:
+                value = None  # valeur précédente libérée hors chronomètre
+                start = time.perf_counter()
+                value = func(state)
+                samples.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+        return value
+
+    def measure_memory(name, func, state):
+        tracemalloc.start()
+        value = func(state)
+        peaks[name] = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        tracemalloc.stop()
+        return value
+
+    _run_stages(stages, lambda name, func, state: func(state))  # chauffe, non mesurée
+    _run_stages(stages, measure_time)
+    # Dernier passage : pic mémoire sous tracemalloc, sans compter le temps.
+    _run_stages(stages, measure_memory)
+
+    return {
+        f'{name}@{n_stations}': {
+            'seconds': float(np.median(timings[name])),
+            'min_seconds': float(np.min(timings[name])),
+            'runs': len(timings[name]),
+            'peak_mb': round(peaks[name], 3),
+        }
+        for name, _, _ in stages
+    }
+
+
+def compare(results, baseline, threshold, memory_threshold):
+    """Lignes de comparaison et liste des régressions."""
+    rows, regressions = [], []
+    for key, current in results.items():
+        ref = baseline.get(key)
+        if ref is None:
+            rows.append(f"{key:<45} {current['seconds'] * 1e3:10.1f} ms   (nouvelle étape)")
+            continue
+        ratio = current['seconds'] / ref['seconds'] if ref['seconds'] > 0 else float('inf')
+        mem_ratio = current['peak_mb'] / ref['peak_mb'] if ref['peak_mb'] > 0 else 1.0
+        slower = ratio > 1 + threshold and current['seconds'] - ref['seconds'] > MIN_DELTA_SECONDS
+        heavier = mem_ratio > 1 + memory_threshold and current['peak_mb'] - ref['peak_mb'] > MIN_DELTA_MB
+        flag = ' RÉGRESSION' if slower or heavier else ''
+        rows.append(
+            f"{key:<45} {current['seconds'] * 1e3:10.1f} ms (×{ratio:.2f})"
+            f" {current['peak_mb']:9.1f} Mo (×{mem_ratio:.2f}){flag}"
+        )
+        if flag:
+            regressions.append(key)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stations', type=int, nargs='+', default=[1500, 100_000],
+                        help="Tailles de flux synthétiques à mesurer.")
+    parser.add_argument('--repeat', type=int, default=10, help="Exécutions minimales par étape.")
+    parser.add_argument('--min-time', type=float, default=MIN_STAGE_SECONDS,
+                        help="Temps cumulé minimal mesuré par étape (s).")
+    parser.add_argument('--save', help="Écrit les résultats dans ce fichier JSON (référence).")
+    parser.add_argument('--compare', help="Compare les résultats au fichier JSON de référence.")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="Ralentissement relatif toléré avant d'échouer (0.25 = +25 %%).")
+    parser.add_argument('--memory-threshold', type=float, default=0.25)
+    args = parser.parse_args()
+
+    # Les graphiques appellent st.* hors de `streamlit run` : on coupe les avertissements du mode « bare ».
+    streamlit_logger.set_log_level('error')
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for n_stations in args.stations:
+            results.update(run_size(n_stations, args.repeat, workdir, args.min_time))
+
+        if args.compare:
+            with open(args.compare, encoding='utf-8') as f:
+                baseline = json.load(f)['results']
+            _, regressions = compare(results, baseline, args.threshold, args.memory_threshold)
+            # Seconde mesure des tailles en régression : un ralentissement passager de la machine ne fait pas échouer.
+            for n_stations in sorted({int(key.rsplit('@', 1)[1]) for key in regressions}):
+                print(f"Régression à confirmer sur {n_stations} stations : nouvelle mesure...")
+                for key, value in run_size(n_stations, args.repeat, workdir, args.min_time).items():
+                    if value['seconds'] < results[key]['seconds']:
+                        results[key] = value
+
+    report = {
+        'meta': {
+            'date': pd.Timestamp.now(tz='UTC').isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'repeat': args.repeat,
+            'min_time': args.min_time,
+        },
+        'results': results,
+    }
+
+    if args.compare:
+        rows, regressions = compare(results, baseline, args.threshold, args.memory_threshold)
+        print('\n'.join(rows))
+        if regressions:
+            print(f"ÉCHEC : {len(regressions)} étape(s) en régression au-delà de {args.threshold:.0%}.")
+    else:
+        regressions = []
+        for key, value in results.items():
+            print(f"{key:<45} {value['seconds'] * 1e3:10.1f} ms {value['peak_mb']:9.1f} Mo")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+# benchmarks/synthetic.py
+import numpy as np
+import pandas as pd
+
+
+PARIS_CENTER = (48.8566, 2.3522)
+
+
+def make_raw_feed(n_stations, n_communes=67, missing_coords=0.01, not_renting=0.02,
+                  network_size=None, seed=42):
+    """
+    Génère un DataFrame brut au format du JSON Vélib' (mêmes colonnes que
+    `pd.read_json(DATA_PATH)`), avec une part configurable de coordonnées
+    manquantes et de stations en 'NON'.
+
+    Avec `network_size`, les lignes parcourent un réseau de `network_size`
+    stations distinctes (plusieurs instantanés mis bout à bout) au lieu d'avoir
+    une station différente par ligne.
+    """
+    rng = np.random.default_rng(seed)
+
+    capacity = rng.integers(0, 80, n_stations)
+    bikes = (capacity * rng.random(n_stations)).astype(np.int64)
+    mechanical = (bikes * rng.random(n_stations)).astype(np.int64)
+    ebike = bikes - mechanical
+    docks = capacity - bikes
+
+    lat = PARIS_CENTER[0] + rng.normal(0, 0.05, n_stations)
+    lon = PARIS_CENTER[1] + rng.normal(0, 0.08, n_stations)
+    if network_size:
+        lat = lat[np.arange(n_stations) % network_size]
+        lon = lon[np.arange(n_stations) % network_size]
+    has_coords = rng.random(n_stations) >= missing_coords
+    coords = np.empty(n_stations, dtype=object)
+    coords[:] = [
+        {'lon': x, 'lat': y} if ok else None
+        for x, y, ok in zip(lon.tolist(), lat.tolist(), has_coords.tolist())
+    ]
+
+    communes = np.array([f"Commune {i}" for i in range(n_communes)], dtype=object)
+    flags = np.array(['OUI', 'NON'], dtype=object)
+    codes = np.arange(n_stations)
+    if network_size:
+        codes = codes % network_size
+
+    return pd.DataFrame({
+        'stationcode': codes.astype(str),
+        'name': np.char.add('Station ', codes.astype(str)).astype(object),
+        'is_installed': flags[(rng.random(n_stations) < not_renting / 2).astype(int)],
+        'capacity': capacity,
+        'numdocksavailable': docks,
+        'numbikesavailable': bikes,
+        'mechanical': mechanical,
+        'ebike': ebike,
+        'is_renting': flags[(rng.random(n_stations) < not_renting).astype(int)],
+        'is_returning': flags[(rng.random(n_stations) < not_renting).astype(int)],
+        'duedate': '2025-10-25T12:56:01+00:00',
+        'coordonnees_geo': coords,
+        'nom_arrondissement_communes': communes[rng.integers(0, n_communes, n_stations)],
+        'code_insee_commune': '75056',
+        'station_opening_hours': None,
+    })
+
+
+def write_raw_feed(path, n_stations, **kwargs):
+    """Écrit un flux synthétique au format du fichier `data/velib_data.json` (tableau JSON d'enregistrements)."""
+    make_raw_feed(n_stations, **kwargs).to_json(path, orient='records', force_ascii=False)
+    return path
+
+
+def make_history_matrix(n_stations, days, step_minutes=1, start='2025-09-01', seed=42):
+    """
+    Historique synthétique stations × pas de temps (float32) : profil
+    journalier propre à chaque station (vide le matin, pleine le soir ou
+    l'inverse) plus un bruit autocorrélé. Renvoie (capacités, t0, matrice).
+    """
+    rng = np.random.default_rng(seed)
+    n_steps = days * 24 * 60 // step_minutes
+    capacity = rng.integers(10, 70, n_stations).astype(np.float32)
+    hours = (np.arange(n_steps) * step_minutes / 60.0) % 24
+    phase = rng.uniform(0, 2 * np.pi, n_stations).astype(np.float32)
+
+    matrix = np.empty((n_stations, n_steps), dtype=np.float32)
+    noise = np.zeros(n_stations, dtype=np.float32)
+    block = 1440 // step_minutes
+    for a in range(0, n_steps, block):
+        b = min(a + block, n_steps)
+        daily = 0.5 + 0.4 * np.sin(2 * np.pi * hours[a:b][None, :] / 24 + phase[:, None])
+        shocks = rng.normal(0, 0.03, (n_stations, b - a)).astype(np.float32)
+        # Bruit AR(1) : cumul amorti des chocs sur le bloc.
+        decay = np.float32(0.98) ** np.arange(b - a, dtype=np.float32)
+        noise_block = np.cumsum(shocks / decay, axis=1) * decay + noise[:, None] * decay
+        noise = noise_block[:, -1]
+        matrix[:, a:b] = np.clip(np.round((daily + noise_block) * capacity[:, None]), 0, capacity[:, None])
+    return capacity, pd.Timestamp(start, tz='UTC'), matrix
+
+
+def write_history(store, n_stations, days, step_minutes=5, start='2025-09-01', seed=42):
+    """
+    Remplit un `SnapshotStore` avec l'historique synthétique de
+    `make_history_matrix` (un instantané par pas de temps, écrit jour par
+    jour). Renvoie le nombre de lignes écrites.
+    """
+    capacity, t0, matrix = make_history_matrix(n_stations, days, step_minutes, start, seed)
+    codes = np.arange(n_stations).astype(str).astype(object)
+    per_day = 1440 // step_minutes
+    n_rows = 0
+    for a in range(0, matrix.shape[1], per_day):
+        bikes = matrix[:, a:a + per_day]
+        n_steps = bikes.shape[1]
+        times = t0 + pd.to_timedelta((a + np.arange(n_steps)) * step_minutes, unit='min')
+        bikes = bikes.ravel(order='F')
+        cap = np.tile(capacity, n_steps)
+        n_rows += store.write_clean(pd.DataFrame({
+            'stationcode': np.tile(codes, n_steps),
+            'duedate': np.repeat(times, n_stations),
+            'NomStation': np.tile(np.char.add('Station ', codes.astype(str)).astype(object), n_steps),
+            'Commune': 'Paris',
+            'CapaciteTotal': cap,
+            'BornesLibres': cap - bikes,
+            'VelosDispoTotal': bikes,
+            'VelosMecaniques': bikes,
+            'VelosElectriques': 0,
+            'LocationPossible': True,
+            'RetourPossible': True,
+            'lat': PARIS_CENTER[0],
+            'lon': PARIS_CENTER[1],
+        }), f'synthetic-{seed}-{a}')
+    return n_rows
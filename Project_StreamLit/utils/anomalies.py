@@ -0,0 +1,253 @@
+# utils/anomalies.py
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.perf import traced
+
+
+# Drapeaux d'anomalie (masque de bits, un octet par station).
+FROZEN, TYPES, CAPACITY = 1, 2, 4
+ANOMALY_LABELS = {
+    FROZEN: 'compteurs figés',
+    TYPES: 'mécaniques + électriques ≠ vélos',
+    CAPACITY: 'vélos + places ≠ capacité',
+}
+# Compteurs inchangés depuis au moins FROZEN_HOURS heures : station figée.
+FROZEN_HOURS = float(os.environ.get('VELIB_FROZEN_HOURS', 12))
+# Incohérence relevée sur PERSIST_SNAPSHOTS instantanés consécutifs avant d'être signalée.
+PERSIST_SNAPSHOTS = 2
+# Écart toléré entre vélos + places libres et capacité (bornes en panne) : le plus grand des deux.
+CAPACITY_TOLERANCE_DOCKS = 3
+CAPACITY_TOLERANCE_SHARE = 0.2
+
+COUNT_COLUMNS = ['VelosDispoTotal', 'BornesLibres', 'VelosMecaniques', 'VelosElectriques']
+_STREAK_MAX = np.iinfo(np.uint16).max
+
+
+def station_keys(df_clean):
+    """
+    Clé de chaque station (uint64) : empreinte de `stationcode`, et du réseau
+    si plusieurs réseaux sont fusionnés. Hachage vectorisé (les colonnes en
+    catégorie sont hachées sur leur dictionnaire puis reportées par code) :
+    aucune chaîne Python n'est créée ni gardée par station.
+    """
+    cols = ['Reseau', 'stationcode'] if 'Reseau' in df_clean.columns else ['stationcode']
+    # Identifiants uniques : les factoriser d'abord (categorize) ne ferait que doubler le travail.
+    return pd.util.hash_pandas_object(df_clean[cols], index=False, categorize=False).to_numpy()
+
+
+def snapshot_time(df_clean):
+    """Heure de l'instantané (secondes epoch) : dernière remontée `duedate`, l'heure courante à défaut."""
+    if 'duedate' in df_clean.columns:
+        latest = df_clean['duedate'].max()
+        if pd.notna(latest):
+            return int(latest.timestamp())
+    return int(time.time())
+
+
+class StationAnomalyDetector:
+    """
+    Détection en flux des stations suspectes, instantané après instantané.
+    L'état de chaque station tient dans quelques tableaux de taille fixe
+    (une case par station, agrandis par doublement quand de nouvelles
+    stations apparaissent) : chaque instantané coûte O(stations), sans objet
+    Python par station.
+
+    - FROZEN : vélos, places, mécaniques et électriques inchangés depuis au
+      moins `frozen_hours` heures ;
+    - TYPES : mécaniques + électriques différent du nombre de vélos ;
+    - CAPACITY : vélos + places libres dépassent la capacité, ou s'en
+      écartent de plus que la tolérance (quelques bornes en panne sont
+      normales).
+
+    TYPES et CAPACITY doivent persister sur `persist` instantanés consécutifs.
+    """
+
+    def __init__(self, frozen_hours=FROZEN_HOURS, persist=PERSIST_SNAPSHOTS,
+                 tolerance_docks=CAPACITY_TOLERANCE_DOCKS, tolerance_share=CAPACITY_TOLERANCE_SHARE, size=1024):
+        self.frozen_seconds = int(frozen_hours * 3600)
+        self.persist = persist
+        self.tolerance_docks = tolerance_docks
+        self.tolerance_share = tolerance_share
+        self.keys = pd.Index([], dtype=np.uint64)
+        self.counts = np.zeros((size, len(COUNT_COLUMNS)), dtype=np.int32)
+        self.changed_at = np.zeros(size, dtype=np.int64)
+        self.seen = np.zeros(size, dtype=np.uint16)
+        self.types_streak = np.zeros(size, dtype=np.uint16)
+        self.capacity_streak = np.zeros(size, dtype=np.uint16)
+        self.last_at = None
+        self.snapshots = 0
+
+    @property
+    def nbytes(self):
+        arrays = (self.counts, self.changed_at, self.seen, self.types_streak, self.capacity_streak)
+        return int(self.keys.nbytes + sum(a.nbytes for a in arrays))
+
+    def _slots(self, keys):
+        """Case de chaque clé ; les clés inconnues reçoivent de nouvelles cases."""
+        slots = self.keys.get_indexer(keys)
+        missing = slots < 0
+        if missing.any():
+            new_keys = pd.unique(keys[missing])
+            self.keys = self.keys.append(pd.Index(new_keys, dtype=np.uint64))
+            self._reserve(len(self.keys))
+            slots[missing] = self.keys.get_indexer(keys[missing])
+        return slots
+
+    def _reserve(self, n):
+        size = len(self.changed_at)
+        if n <= size:
+            return
+        while size < n:
+            size *= 2
+        for name in ('counts', 'changed_at', 'seen', 'types_streak', 'capacity_streak'):
+            old = getattr(self, name)
+            new = np.zeros((size,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    @traced('StationAnomalyDetector.update')
+    def update(self, keys, counts, capacity, at):
+        """
+        Intègre un instantané : `keys` (clés uint64, voir `station_keys`), `counts` (stations × 4,
+        colonnes COUNT_COLUMNS), `capacity`, `at` (secondes epoch). Un
+        instantané déjà vu (même `at` ou plus ancien) ne modifie pas l'état.
+        Renvoie les drapeaux de chaque station (uint8, alignés sur `keys`).
+        """
+        slots = self._slots(keys)
+        counts = np.asarray(counts, dtype=np.int32)
+        if self.last_at is None or at > self.last_at:
+            new = self.seen[slots] == 0
+            changed = new | (self.counts[slots] != counts).any(axis=1)
+            self.changed_at[slots[changed]] = at
+            self.counts[slots] = counts
+            self.seen[slots] = np.minimum(self.seen[slots].astype(np.int64) + 1, _STREAK_MAX)
+
+            bikes, docks, mechanical, ebike = counts.T
+            capacity = np.asarray(capacity, dtype=np.int64)
+            gap = capacity - (bikes.astype(np.int64) + docks)
+            tolerance = np.maximum(self.tolerance_docks, self.tolerance_share * capacity)
+            self._streak(self.types_streak, slots, mechanical.astype(np.int64) + ebike != bikes)
+            self._streak(self.capacity_streak, slots, (gap < 0) | (gap > tolerance))
+            self.last_at = at
+            self.snapshots += 1
+        return self.flags(slots, at)
+
+    @staticmethod
+    def _streak(streak, slots, bad):
+        streak[slots] = np.where(bad, np.minimum(streak[slots].astype(np.int64) + 1, _STREAK_MAX), 0)
+
+    def flags(self, slots, at):
+        seen = self.seen[slots]
+        flags = np.zeros(len(slots), dtype=np.uint8)
+        flags[(seen >= 2) & (at - self.changed_at[slots] >= self.frozen_seconds)] |= FROZEN
+        flags[self.types_streak[slots] >= self.persist] |= TYPES
+        flags[self.capacity_streak[slots] >= self.persist] |= CAPACITY
+        return flags
+
+    def observe(self, df_clean, at=None):
+        """`update` sur un tableau nettoyé (avec `stationcode`) ; None sans identifiant de station."""
+        if df_clean.empty or 'stationcode' not in df_clean.columns:
+            return None
+        counts = np.column_stack([
+            df_clean[col].to_numpy(dtype=np.int32) if col in df_clean.columns else np.zeros(len(df_clean), np.int32)
+            for col in COUNT_COLUMNS
+        ])
+        return self.update(
+            station_keys(df_clean), counts, df_clean['CapaciteTotal'].to_numpy(dtype=np.int64),
+            snapshot_time(df_clean) if at is None else at,
+        )
+
+
+def anomaly_labels(flags):
+    """Libellé de chaque station ('' si rien à signaler), pour les tableaux."""
+    flags = np.asarray(flags, dtype=np.uint8)
+    labels = np.full(len(flags), '', dtype=object)
+    for flag, label in ANOMALY_LABELS.items():
+        hit = (flags & flag) != 0
+        labels[hit] = np.where(labels[hit] == '', '🚩 ' + label, labels[hit] + ', ' + label)
+    return labels
+
+
+def anomaly_summary(flags):
+    """Nombre de stations par type d'anomalie, et au total."""
+    flags = np.asarray(flags, dtype=np.uint8)
+    summary = {label: int(((flags & flag) != 0).sum()) for flag, label in ANOMALY_LABELS.items()}
+    summary['total'] = int((flags != 0).sum())
+    return summary
+
+
+_detectors = {}
+_detectors_lock = threading.Lock()
+
+
+def observe_snapshot(stream, df_clean):
+    """
+    Passe un instantané au détecteur du flux `stream` (fichier local, mode
+    live, réseaux fusionnés), partagé par toutes les sessions. Renvoie les
+    drapeaux alignés sur les lignes de `df_clean`, None s'il n'a pas de
+    `stationcode`.
+    """
+    with _detectors_lock:
+        detector = _detectors.get(stream)
+        if detector is None:
+            detector = _detectors[stream] = StationAnomalyDetector()
+        return detector.observe(df_clean)
+
+
+def get_detector(stream):
+    return _detectors.get(stream)
+
+
+def reliable_cube(cube, df_clean, flags):
+    """Cube d'agrégats sans les stations signalées (mise à jour par différence, O(stations signalées))."""
+    suspects = np.asarray(flags) != 0
+    if not suspects.any():
+        return cube
+    return cube.apply_delta(df_clean[suspects], None)
+
+
+def main():
+    from utils.batch import list_snapshots
+    from utils.io import _read_raw
+    from utils.prep import clean_data
+
+    parser = argparse.ArgumentParser(
+        description="Rejoue une série d'instantanés JSON (fichiers ou dossiers) et liste les stations suspectes.",
+    )
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--frozen-hours', type=float, default=FROZEN_HOURS)
+    parser.add_argument('--top', type=int, default=30)
+    args = parser.parse_args()
+
+    detector = StationAnomalyDetector(frozen_hours=args.frozen_hours)
+    frames = []
+    for path in list_snapshots(args.paths):
+        df_clean, _ = clean_data(_read_raw(path), keep_keys=True)
+        if not df_clean.empty:
+            frames.append((snapshot_time(df_clean), path, df_clean))
+    if not frames:
+        raise SystemExit("Aucun instantané valide.")
+
+    start = time.perf_counter()
+    for at, _, df_clean in sorted(frames, key=lambda frame: frame[0]):
+        flags = detector.observe(df_clean, at)
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(frames)} instantanés, {len(detector.keys)} stations suivies "
+          f"({detector.nbytes / 1024:.0f} Ko d'état) en {elapsed * 1e3:.0f} ms.")
+    for label, n in anomaly_summary(flags).items():
+        print(f"  {label:<36} {n}")
+    suspects = flags != 0
+    df_suspects = df_clean.loc[suspects, ['stationcode', 'NomStation'] + COUNT_COLUMNS + ['CapaciteTotal']]
+    with pd.option_context('display.width', 160, 'display.max_columns', 12):
+        print(df_suspects.assign(Anomalie=anomaly_labels(flags[suspects])).head(args.top).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
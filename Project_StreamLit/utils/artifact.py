@@ -0,0 +1,149 @@
+# utils/artifact.py
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from utils.cache import file_fingerprint
+from utils.io import DATA_PATH
+from utils.perf import traced
+
+
+ARTIFACT_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'velib_snapshot.arrow')
+# VELIB_ARTIFACT=0 force la lecture du JSON même si un artefact à jour existe.
+ARTIFACT_ENABLED = os.environ.get('VELIB_ARTIFACT', '1').lower() not in ('0', 'false', 'non')
+
+_META_KEY = b'velib'
+# Version du schéma des tableaux écrits : un fichier d'une autre version est ignoré (relu depuis le JSON).
+TABLE_VERSION = 2
+
+
+def write_artifact(path=DATA_PATH, artifact_path=ARTIFACT_PATH):
+    """
+    Nettoie et compacte l'instantané JSON `path` puis l'écrit au format Arrow
+    IPC (Feather v2, non compressé pour être lu par mappage mémoire).
+    L'empreinte du JSON source et le rapport de qualité sont rangés dans les
+    métadonnées du schéma. Renvoie le nombre de stations écrites.
+    """
+    from utils.io import _compact, _read_raw
+    from utils.prep import clean_data
+
+    df_raw = _read_raw(path)
+    if df_raw.empty:
+        raise ValueError(f"{path} : aucune donnée brute.")
+    df_clean, data_quality_report = _compact(clean_data(df_raw, keep_keys=True))
+    if df_clean.empty:
+        raise ValueError(f"{path} : aucune station valide après nettoyage.")
+
+    meta = {
+        'source': os.path.basename(path),
+        'source_fingerprint': file_fingerprint(path),
+        'report': data_quality_report,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+    write_table(df_clean, artifact_path, meta)
+    return len(df_clean)
+
+
+def write_table(df, path, meta):
+    """
+    Écrit `df` dans un fichier Arrow IPC lisible sans copie par `map_table` :
+    non compressé, en un seul bloc de lignes, booléens rangés en octets (Arrow
+    les compacte en bits, ce qui forcerait une copie à la lecture). `meta` (dict
+    JSON) est rangé dans les métadonnées du schéma. Le fichier apparaît d'un
+    coup (écriture à côté puis renommage) : il n'est jamais lu à moitié écrit.
+    """
+    bool_columns = [col for col in df.columns if pd.api.types.is_bool_dtype(df[col])]
+    df = df.astype({col: np.uint8 for col in bool_columns})
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    meta = {**meta, 'bool_columns': bool_columns, 'version': TABLE_VERSION}
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}), _META_KEY: json.dumps(meta, ensure_ascii=False).encode(),
+    })
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    feather.write_feather(table, tmp_path, compression='uncompressed', chunksize=max(len(df), 1))
+    os.replace(tmp_path, path)
+
+
+def map_table(path):
+    """
+    (tableau, métadonnées) d'un fichier écrit par `write_table`, mappé en
+    mémoire : colonnes numériques, booléennes et catégorielles sont des vues
+    en lecture seule sur le fichier, partagées par tous les processus qui le
+    mappent.
+    """
+    table = feather.read_table(path, memory_map=True)
+    meta = json.loads(table.schema.metadata[_META_KEY])
+    bool_columns = set(meta.get('bool_columns', []))
+    df = pd.DataFrame(
+        {name: _column(table.column(name), name in bool_columns) for name in table.column_names},
+        copy=False,
+    )
+    return df, meta
+
+
+def _column(chunked, is_bool):
+    """Colonne pandas sur une colonne Arrow : vue sur le fichier pour les nombres et les catégorielles."""
+    if chunked.num_chunks != 1:
+        return chunked.to_pandas()
+    array = chunked.chunk(0)
+    if pa.types.is_dictionary(array.type) and pa.types.is_large_string(array.type.value_type):
+        # Sans repasser par des objets Python : codes et libellés restent des vues.
+        categories = pd.Index(pd.array(array.dictionary, dtype=pd.StringDtype(storage='pyarrow', na_value=np.nan)))
+        return pd.Categorical.from_codes(
+            array.indices.to_numpy(zero_copy_only=True),
+            dtype=pd.CategoricalDtype(categories, ordered=array.type.ordered),
+            validate=False,
+        )
+    if (pa.types.is_integer(array.type) or pa.types.is_floating(array.type)) and array.null_count == 0:
+        values = array.to_numpy(zero_copy_only=True)
+        return values.view(np.bool_) if is_bool else values
+    return chunked.to_pandas()
+
+
+def artifact_metadata(artifact_path=ARTIFACT_PATH):
+    """Métadonnées de l'artefact (dict), None s'il est absent ou illisible."""
+    try:
+        schema = pa.ipc.open_file(pa.memory_map(artifact_path)).schema
+        return json.loads(schema.metadata[_META_KEY])
+    except (OSError, KeyError, TypeError, ValueError, pa.ArrowInvalid):
+        return None
+
+
+@traced()
+def read_artifact(fingerprint, artifact_path=ARTIFACT_PATH):
+    """
+    (tableau nettoyé, rapport de qualité) lus depuis l'artefact s'il a été
+    produit à partir de l'instantané d'empreinte `fingerprint` ; None sinon
+    (absent, périmé ou illisible : on repasse alors par le JSON).
+    """
+    if not ARTIFACT_ENABLED or not os.path.exists(artifact_path):
+        return None
+    meta = artifact_metadata(artifact_path)
+    if meta is None or meta.get('source_fingerprint') != fingerprint or meta.get('version') != TABLE_VERSION:
+        return None
+    df, meta = map_table(artifact_path)
+    return df, meta['report']
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Produit l'artefact Arrow IPC nettoyé lu au démarrage de l'application.",
+    )
+    parser.add_argument('path', nargs='?', default=DATA_PATH, help="Instantané JSON source.")
+    parser.add_argument('--out', default=ARTIFACT_PATH, help="Fichier .arrow à écrire.")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    n_rows = write_artifact(args.path, args.out)
+    print(f"{args.out} : {n_rows} stations, {os.path.getsize(args.out) / 1024:.0f} Ko "
+          f"en {time.perf_counter() - start:.2f} s.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+# utils/batch.py
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from utils.cache import file_fingerprint
+from utils.history import HISTORY_PATH, SnapshotStore
+from utils.io import STREAM_BATCH_SIZE, iter_raw_batches
+from utils.prep import clean_data
+
+
+BATCH_REPORT_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'batch')
+
+# Sommes par commune accumulées lot par lot ; les moyennes sont calculées à la fin.
+SUM_COLUMNS = ['CapaciteTotal', 'BornesLibres', 'VelosDispoTotal', 'VelosMecaniques', 'VelosElectriques', 'TauxDispo']
+
+
+def list_snapshots(paths):
+    """Fichiers .json à traiter : les fichiers donnés et le contenu des dossiers donnés, triés."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(root, name)
+                for root, _, names in os.walk(path) for name in names if name.endswith('.json')
+            )
+        elif os.path.isfile(path):
+            files.append(path)
+    return sorted(files)
+
+
+def _commune_sums(df_clean):
+    cols = [col for col in SUM_COLUMNS if col in df_clean.columns]
+    grouped = df_clean.groupby('Commune', observed=True)
+    sums = grouped[cols].sum()
+    sums['Stations'] = grouped.size()
+    return sums
+
+
+def process_snapshot(path, out_root, batch_size=STREAM_BATCH_SIZE):
+    """
+    Traite un instantané dans un processus du pool : lecture en flux, nettoyage,
+    écriture dans l'historique Parquet et agrégats par commune. Seuls des
+    résumés (quelques Ko) reviennent au processus principal.
+    """
+    start = time.perf_counter()
+    summary = {'Fichier': path, 'Empreinte': None, 'LignesBrutes': 0, 'LignesValides': 0,
+               'LignesEcrites': 0, 'Horodatage': pd.NaT, 'Statut': 'ok', 'Secondes': 0.0}
+    communes = None
+    try:
+        snapshot_id = file_fingerprint(path)
+        summary['Empreinte'] = snapshot_id
+        store = SnapshotStore(out_root)
+        already = store.contains(snapshot_id)
+        sums = []
+        for i, df_batch in enumerate(iter_raw_batches(path, batch_size)):
+            df_clean, _ = clean_data(df_batch, keep_keys=True)
+            summary['LignesBrutes'] += len(df_batch)
+            summary['LignesValides'] += len(df_clean)
+            if df_clean.empty:
+                continue
+            if not already:
+                summary['LignesEcrites'] += store.write_clean(df_clean, f'{snapshot_id}-{i}')
+            latest = df_clean['duedate'].max() if 'duedate' in df_clean.columns else pd.NaT
+            if pd.notna(latest) and (pd.isna(summary['Horodatage']) or latest > summary['Horodatage']):
+                summary['Horodatage'] = latest
+            if 'Commune' in df_clean.columns:
+                sums.append(_commune_sums(df_clean))
+        if already:
+            summary['Statut'] = 'déjà dans l\'historique'
+        else:
+            store.mark_done(snapshot_id)
+        if sums:
+            communes = pd.concat(sums).groupby(level=0).sum()
+            communes['TauxDispo'] = communes['TauxDispo'] / communes['Stations']
+            communes = communes.reset_index()
+            communes.insert(0, 'Horodatage', summary['Horodatage'])
+            communes.insert(0, 'Empreinte', snapshot_id)
+    except Exception as e:
+        summary['Statut'] = f"erreur : {type(e).__name__}: {e}"
+    summary['Secondes'] = time.perf_counter() - start
+    return summary, communes
+
+
+def run_batch(paths, out_root=HISTORY_PATH, report_dir=BATCH_REPORT_PATH, workers=None,
+              batch_size=STREAM_BATCH_SIZE, progress=print):
+    """
+    Traite tous les instantanés sur un pool de processus (un fichier par tâche)
+    puis écrit dans `report_dir` :
+
+    - `qualite.csv` : résumé de qualité par fichier ;
+    - `communes.parquet` : agrégats par instantané et par commune.
+
+    Les lignes nettoyées sont ajoutées à l'historique Parquet `out_root`.
+    Renvoie (résumé de qualité, agrégats, débit).
+    """
+    files = list_snapshots(paths)
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    summaries, communes = [], []
+
+    if workers == 1 or len(files) <= 1:
+        results = (process_snapshot(path, out_root, batch_size) for path in files)
+        for n, (summary, df_communes) in enumerate(results, 1):
+            summaries.append(summary)
+            if df_communes is not None:
+                communes.append(df_communes)
+            progress(f"[{n}/{len(files)}] {summary['Fichier']} : {summary['Statut']}")
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(process_snapshot, path, out_root, batch_size) for path in files]
+            for n, future in enumerate(as_completed(futures), 1):
+                summary, df_communes = future.result()
+                summaries.append(summary)
+                if df_communes is not None:
+                    communes.append(df_communes)
+                progress(f"[{n}/{len(files)}] {summary['Fichier']} : {summary['Statut']}")
+    elapsed = time.perf_counter() - start
+
+    df_quality = pd.DataFrame(summaries, columns=[
+        'Fichier', 'Empreinte', 'LignesBrutes', 'LignesValides', 'LignesEcrites', 'Horodatage', 'Statut', 'Secondes',
+    ]).sort_values('Fichier', ignore_index=True)
+    df_quality['PctRetirees'] = np.where(
+        df_quality['LignesBrutes'] > 0,
+        (1 - df_quality['LignesValides'] / df_quality['LignesBrutes'].clip(lower=1)) * 100, 0.0,
+    ).round(2)
+    df_communes = (
+        pd.concat(communes, ignore_index=True).sort_values(['Horodatage', 'Commune'], ignore_index=True)
+        if communes else pd.DataFrame()
+    )
+
+    os.makedirs(report_dir, exist_ok=True)
+    df_quality.to_csv(os.path.join(report_dir, 'qualite.csv'), index=False)
+    if not df_communes.empty:
+        df_communes.to_parquet(os.path.join(report_dir, 'communes.parquet'), index=False)
+
+    throughput = {
+        'fichiers': len(files),
+        'secondes': elapsed,
+        'instantanes_par_s': len(files) / elapsed if elapsed > 0 else float('nan'),
+        'lignes_par_s': df_quality['LignesBrutes'].sum() / elapsed if elapsed > 0 else float('nan'),
+        'workers': workers,
+    }
+    return df_quality, df_communes, throughput
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Nettoie et agrège en parallèle des instantanés JSON Vélib' archivés.",
+    )
+    parser.add_argument('paths', nargs='+', help="Fichiers JSON ou dossiers d'instantanés.")
+    parser.add_argument('--out', default=HISTORY_PATH, help="Dossier de l'historique Parquet.")
+    parser.add_argument('--report', default=BATCH_REPORT_PATH, help="Dossier des résumés (qualité, agrégats).")
+    parser.add_argument('--workers', type=int, default=None, help="Nombre de processus (défaut : nombre de cœurs).")
+    parser.add_argument('--batch-size', type=int, default=STREAM_BATCH_SIZE)
+    args = parser.parse_args()
+
+    df_quality, _, throughput = run_batch(args.paths, args.out, args.report, args.workers, args.batch_size)
+    errors = df_quality['Statut'].str.startswith('erreur').sum()
+    print(
+        f"{throughput['fichiers']} instantanés en {throughput['secondes']:.1f} s sur {throughput['workers']} processus : "
+        f"{throughput['instantanes_par_s']:.2f} instantanés/s, {throughput['lignes_par_s']:,.0f} lignes/s"
+        f" ({errors} en erreur)."
+    )
+
+
+if __name__ == '__main__':
+    main()
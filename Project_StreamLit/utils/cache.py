@@ -0,0 +1,172 @@
+# utils/cache.py
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+
+def file_fingerprint(path, _memo={}):
+    """
+    Empreinte du contenu d'un fichier (blake2b). Le hash n'est recalculé que
+    si la taille ou la date de modification du fichier a changé.
+    """
+    stat = os.stat(path)
+    stat_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    digest = _memo.get(stat_key)
+    if digest is None:
+        h = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+        _memo.clear()
+        _memo[stat_key] = digest
+    return digest
+
+
+def _estimate_size(value):
+    """Taille mémoire approximative (en octets) d'un objet mis en cache."""
+    try:
+        return int(value.memory_usage(deep=True).sum())
+    except Exception:
+        pass
+    nbytes = getattr(value, 'nbytes', None)
+    if isinstance(nbytes, int):
+        return nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(_estimate_size(v) for v in value)
+    if isinstance(value, str):
+        return len(value)
+    if type(value).__module__.startswith('altair.'):
+        # Graphique Altair : le poids est celui des données attachées, à lui et à ses calques.
+        size = _estimate_size(getattr(value, 'data', None))
+        for attr in ('layer', 'hconcat', 'vconcat', 'concat'):
+            sub = getattr(value, attr, None)
+            if isinstance(sub, list):
+                size += sum(_estimate_size(chart) for chart in sub)
+        return size
+    return 0
+
+
+class SnapshotCache:
+    """
+    Cache LRU partagé entre toutes les sessions Streamlit du processus.
+
+    Les entrées sont indexées par (empreinte du fichier, étape du pipeline) et
+    bornées en nombre et en mémoire. Quand l'empreinte d'un fichier change, les
+    entrées de l'ancien instantané sont invalidées explicitement.
+    """
+
+    def __init__(self, max_entries=16, max_bytes=512 * 1024 ** 2):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._current = {}
+        self._build_locks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def fingerprint(self, path):
+        """Empreinte courante du fichier ; invalide l'ancien instantané si elle a changé."""
+        fp = file_fingerprint(path)
+        path = os.path.abspath(path)
+        with self._lock:
+            previous = self._current.get(path)
+            self._current[path] = fp
+            if previous is not None and previous != fp:
+                self._drop_fingerprint(previous)
+        return fp
+
+    def get_or_build(self, fingerprint, stage, builder):
+        """
+        Renvoie la valeur en cache pour (fingerprint, stage) ou l'obtient via
+        `builder()`. Une seule construction a lieu même si plusieurs sessions
+        demandent la même entrée en même temps. Les valeurs `None` ou vides ne
+        sont pas conservées.
+        """
+        key = (fingerprint, stage)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        with build_lock:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key]
+                self.misses += 1
+
+            value = builder()
+
+            with self._lock:
+                self._build_locks.pop(key, None)
+                if not _is_empty(value):
+                    self._entries[key] = value
+                    self._sizes[key] = _estimate_size(value)
+                    self._evict()
+        return value
+
+    def invalidate(self, path=None):
+        """Vide le cache pour un fichier donné, ou entièrement si `path` est None."""
+        with self._lock:
+            if path is None:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                self._sizes.clear()
+                self._current.clear()
+                return
+            fp = self._current.pop(os.path.abspath(path), None)
+            if fp is not None:
+                self._drop_fingerprint(fp)
+
+    def stats(self):
+        """Compteurs du cache, pour le panneau de qualité des données."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'entries': len(self._entries),
+                'bytes': sum(self._sizes.values()),
+            }
+
+    def _drop_fingerprint(self, fingerprint):
+        for key in [k for k in self._entries if k[0] == fingerprint]:
+            del self._entries[key]
+            self._sizes.pop(key, None)
+            self.invalidations += 1
+
+    def _evict(self):
+        while self._entries and (
+            len(self._entries) > self.max_entries
+            or sum(self._sizes.values()) > self.max_bytes
+        ):
+            key, _ = self._entries.popitem(last=False)
+            self._sizes.pop(key, None)
+            self.evictions += 1
+
+
+def _is_empty(value):
+    if value is None:
+        return True
+    empty = getattr(value, 'empty', None)
+    return bool(empty) if isinstance(empty, bool) else False
+
+
+snapshot_cache = SnapshotCache()
+
+# Sections de la page (données de la carte, graphiques) pour une combinaison de
+# filtres : petites entrées nombreuses, gardées à part pour ne pas évincer les
+# étapes coûteuses de l'instantané.
+section_cache = SnapshotCache(max_entries=64, max_bytes=128 * 1024 ** 2)
@@ -0,0 +1,130 @@
+# utils/cube.py
+import numpy as np
+import pandas as pd
+
+from utils.filters import TYPE_VELO_COLUMNS
+from utils.perf import traced
+
+
+TYPE_VELO_KEYS = ['Tous'] + list(TYPE_VELO_COLUMNS)
+MEASURES = ['Stations', 'VelosDispoTotal', 'TauxDispoSomme']
+
+
+class AvailabilityCube:
+    """
+    Cube d'agrégats matérialisé : commune × type de vélo × nombre de vélos
+    disponibles, avec pour chaque case le nombre de stations, la somme des
+    vélos et la somme des TauxDispo.
+
+    Les KPIs d'une combinaison de filtres (commune, seuil minimum de vélos,
+    type) se lisent dans les sommes cumulées « au moins N vélos » : aucune
+    ligne n'est parcourue. Le cube se met à jour par différences (`apply_delta`)
+    quand un nouvel instantané arrive.
+    """
+
+    def __init__(self, communes=(), max_velos=0):
+        self.communes = list(communes)
+        self._commune_pos = {commune: i for i, commune in enumerate(self.communes)}
+        self.data = np.zeros((len(MEASURES), len(self.communes), len(TYPE_VELO_KEYS), max_velos + 1))
+        self._at_least = None
+
+    @classmethod
+    @traced('AvailabilityCube.from_frame')
+    def from_frame(cls, df_clean):
+        communes = sorted(df_clean['Commune'].astype(str).unique()) if 'Commune' in df_clean.columns else []
+        max_velos = int(df_clean['VelosDispoTotal'].max()) if len(df_clean) else 0
+        cube = cls(communes, max(max_velos, 0))
+        cube._accumulate(df_clean, 1.0)
+        return cube
+
+    @property
+    def nbytes(self):
+        return int(self.data.nbytes + (self._at_least.nbytes if self._at_least is not None else 0))
+
+    def copy(self):
+        cube = AvailabilityCube()
+        cube.communes = list(self.communes)
+        cube._commune_pos = dict(self._commune_pos)
+        cube.data = self.data.copy()
+        return cube
+
+    def _grow(self, communes, max_velos):
+        new_communes = [c for c in dict.fromkeys(communes) if c not in self._commune_pos]
+        extra_velos = max_velos + 1 - self.data.shape[3]
+        if not new_communes and extra_velos <= 0:
+            return
+        for commune in new_communes:
+            self._commune_pos[commune] = len(self.communes)
+            self.communes.append(commune)
+        self.data = np.pad(self.data, ((0, 0), (0, len(new_communes)), (0, 0), (0, max(extra_velos, 0))))
+
+    def _accumulate(self, df, sign):
+        if df is None or df.empty:
+            return
+        communes = df['Commune'].astype(str).to_numpy() if 'Commune' in df.columns else np.full(len(df), 'Inconnue')
+        velos = np.maximum(df['VelosDispoTotal'].to_numpy(dtype=np.int64), 0)
+        self._grow(communes, int(velos.max()))
+
+        n_communes, n_types, n_velos = self.data.shape[1:]
+        commune_idx = pd.Categorical(communes, categories=self.communes).codes.astype(np.int64)
+        taux = df['TauxDispo'].to_numpy(dtype=np.float64)
+        weights = [np.ones(len(df)), velos.astype(np.float64), taux]
+
+        for t, type_velo in enumerate(TYPE_VELO_KEYS):
+            col = TYPE_VELO_COLUMNS.get(type_velo)
+            mask = df[col].to_numpy() > 0 if col in df.columns else np.ones(len(df), dtype=bool)
+            flat = (commune_idx[mask] * n_types + t) * n_velos + velos[mask]
+            for m, w in enumerate(weights):
+                self.data[m] += sign * np.bincount(
+                    flat, weights=w[mask], minlength=n_communes * n_types * n_velos
+                ).reshape(n_communes, n_types, n_velos)
+        self._at_least = None
+
+    @traced('AvailabilityCube.apply_delta')
+    def apply_delta(self, old_rows, new_rows):
+        """Nouveau cube où `old_rows` sont retirées et `new_rows` ajoutées (le cube courant est inchangé)."""
+        cube = self.copy()
+        cube._accumulate(old_rows, -1.0)
+        cube._accumulate(new_rows, 1.0)
+        return cube
+
+    def _cumulative(self):
+        if self._at_least is None:
+            # at_least[..., v] = somme des cases ayant au moins v vélos.
+            self._at_least = np.flip(np.cumsum(np.flip(self.data, axis=3), axis=3), axis=3)
+        return self._at_least
+
+    @traced('AvailabilityCube.lookup')
+    def lookup(self, commune='Toutes', min_velos=0, type_velo='Tous'):
+        """(nombre de stations, vélos disponibles, TauxDispo moyen) pour une combinaison de filtres."""
+        at_least = self._cumulative()
+        t = TYPE_VELO_KEYS.index(type_velo) if type_velo in TYPE_VELO_KEYS else 0
+        v = max(int(min_velos), 0)
+        if v >= at_least.shape[3]:
+            return 0, 0, float('nan')
+        if commune == 'Toutes':
+            values = at_least[:, :, t, v].sum(axis=1)
+        elif commune in self._commune_pos:
+            values = at_least[:, self._commune_pos[commune], t, v]
+        else:
+            return 0, 0, float('nan')
+        stations = int(round(values[0]))
+        mean_taux = values[2] / values[0] if stations > 0 else float('nan')
+        return stations, int(round(values[1])), mean_taux
+
+    @traced('AvailabilityCube.commune_ranking')
+    def commune_ranking(self, min_velos=0, type_velo='Tous', top=20):
+        """Classement des communes par TauxDispo moyen pour le seuil et le type donnés."""
+        at_least = self._cumulative()
+        t = TYPE_VELO_KEYS.index(type_velo) if type_velo in TYPE_VELO_KEYS else 0
+        v = max(int(min_velos), 0)
+        if v >= at_least.shape[3] or not self.communes:
+            return pd.DataFrame(columns=['Commune', 'TauxDispo', 'Stations'])
+        stations = at_least[0, :, t, v]
+        present = stations > 0.5
+        df_agg = pd.DataFrame({
+            'Commune': np.array(self.communes, dtype=object)[present],
+            'TauxDispo': at_least[2, present, t, v] / stations[present],
+            'Stations': np.round(stations[present]).astype(np.int64),
+        })
+        return df_agg.sort_values(by='TauxDispo', ascending=False, kind='stable').head(top).reset_index(drop=True)
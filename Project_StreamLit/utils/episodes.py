@@ -0,0 +1,288 @@
+# utils/episodes.py
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.cache import snapshot_cache
+from utils.forecast import SLOTS_PER_WEEK, hour_of_week
+from utils.history import HISTORY_PATH, SnapshotStore, grid_positions
+from utils.perf import traced
+
+
+UNKNOWN, OK, EMPTY, FULL = -1, 0, 1, 2
+# Situations suivies : libellé affiché → état dans la matrice.
+KINDS = {'vide': EMPTY, 'pleine': FULL}
+JOURS = ['lundi', 'mardi', 'mercredi', 'jeudi', 'vendredi', 'samedi', 'dimanche']
+# Stations traitées ensemble : borne la mémoire des matrices intermédiaires.
+CHUNK_STATIONS = 256
+
+
+def station_states(bikes, docks):
+    """
+    État de chaque case d'une grille stations × pas de temps : EMPTY (aucun
+    vélo), FULL (aucune place libre, `BornesLibres == 0`), OK sinon, UNKNOWN
+    si la station n'a pas été relevée.
+    """
+    state = np.full(bikes.shape, OK, dtype=np.int8)
+    state[docks == 0] = FULL
+    state[bikes == 0] = EMPTY
+    state[np.isnan(bikes) | np.isnan(docks)] = UNKNOWN
+    return state
+
+
+def _ffill_states(state):
+    """Prolonge le dernier état relevé sur les cases inconnues qui suivent."""
+    idx = np.where(state != UNKNOWN, np.arange(state.shape[1], dtype=np.int32), 0)
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    return np.take_along_axis(state, idx, axis=1)
+
+
+def run_lengths(mask):
+    """
+    Encodage par plages de toutes les lignes d'une matrice booléenne à la
+    fois : (ligne, début, longueur) de chaque suite de True, dans l'ordre des
+    lignes puis des colonnes.
+    """
+    padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    return rows, starts, ends - starts
+
+
+def grouped_percentile(groups, values, n_groups, q):
+    """Percentile `q` (0-1, interpolation linéaire comme np.percentile) de `values` par groupe ; NaN si groupe vide."""
+    order = np.lexsort((values, groups))
+    values = np.asarray(values, dtype=np.float64)[order]
+    counts = np.bincount(groups, minlength=n_groups)
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    result = np.full(n_groups, np.nan)
+    has = counts > 0
+    pos = (counts[has] - 1) * q
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.ceil(pos).astype(np.int64)
+    v_lo = values[offsets[has] + lo]
+    v_hi = values[offsets[has] + hi]
+    result[has] = v_lo + (v_hi - v_lo) * (pos - lo)
+    return result
+
+
+class EpisodeStats:
+    """
+    Épisodes « station vide » et « station pleine » de chaque station sur une
+    fenêtre d'historique : nombre, durée totale et p95 (minutes), et part du
+    temps passé dans chaque situation par créneau heure-de-la-semaine.
+
+    Les épisodes en cours au début ou à la fin de la fenêtre sont tronqués.
+    """
+
+    def __init__(self, stationcodes, names, step_minutes, start, end, counts, total_minutes, p95_minutes,
+                 slot_minutes, observed_minutes):
+        self.stationcodes = np.asarray(stationcodes)
+        self.names = np.asarray(names, dtype=object)
+        self.step_minutes = step_minutes
+        self.start = start
+        self.end = end
+        # Par situation (clés de KINDS) : tableaux par station, et stations × créneaux.
+        self.counts = counts
+        self.total_minutes = total_minutes
+        self.p95_minutes = p95_minutes
+        self.slot_minutes = slot_minutes
+        self.observed_minutes = observed_minutes
+        self._pos = {code: i for i, code in enumerate(self.stationcodes)}
+
+    @property
+    def nbytes(self):
+        arrays = [self.observed_minutes, *self.counts.values(), *self.total_minutes.values(),
+                  *self.p95_minutes.values(), *self.slot_minutes.values()]
+        return int(sum(a.nbytes for a in arrays))
+
+    def summary_frame(self, kind):
+        """Une ligne par station : nombre d'épisodes, durée totale et p95, part du temps."""
+        observed = self.observed_minutes.sum(axis=1)
+        return pd.DataFrame({
+            'Station': self.names,
+            'Épisodes': self.counts[kind],
+            'Durée totale (h)': self.total_minutes[kind] / 60,
+            'Durée p95 (min)': self.p95_minutes[kind],
+            'Part du temps (%)': 100 * self.total_minutes[kind] / np.maximum(observed, 1),
+        }, index=pd.Index(self.stationcodes, name='stationcode'))
+
+    def heatmap_frame(self, kind, stationcode=None):
+        """
+        Part du temps passé dans la situation `kind` par jour et heure (heure de
+        Paris), pour une station ou pour tout le réseau (`stationcode=None`).
+        """
+        if stationcode is None:
+            in_kind = self.slot_minutes[kind].sum(axis=0, dtype=np.float64)
+            observed = self.observed_minutes.sum(axis=0, dtype=np.float64)
+        else:
+            i = self._pos[str(stationcode)]
+            in_kind = self.slot_minutes[kind][i].astype(np.float64)
+            observed = self.observed_minutes[i].astype(np.float64)
+        slots = np.arange(SLOTS_PER_WEEK)
+        return pd.DataFrame({
+            'Jour': np.array(JOURS)[slots // 24],
+            'Heure': slots % 24,
+            'Part (%)': np.where(observed > 0, 100 * in_kind / np.maximum(observed, 1), np.nan),
+        })
+
+    def ranking(self, kind, top=20, min_observed_hours=None):
+        """
+        Stations le plus souvent dans la situation `kind` à un même créneau de
+        la semaine (« vide le lundi à 9h ») : créneau le plus touché de chaque
+        station, classé par part du temps sur ce créneau puis sur toute la
+        fenêtre. Les créneaux observés moins de `min_observed_hours` heures
+        sont ignorés ; par défaut, moins de la moitié du créneau le mieux
+        couvert de la station (2 h sur quatre semaines complètes, 30 min sur une).
+        """
+        observed = self.observed_minutes
+        if min_observed_hours is None:
+            min_minutes = 0.5 * observed.max(axis=1, keepdims=True)
+        else:
+            min_minutes = min_observed_hours * 60
+        share = np.where(
+            (observed >= min_minutes) & (observed > 0), self.slot_minutes[kind] / np.maximum(observed, 1), -1.0
+        )
+        worst_slot = share.argmax(axis=1)
+        worst_share = share[np.arange(len(share)), worst_slot]
+        overall = self.total_minutes[kind] / np.maximum(observed.sum(axis=1), 1)
+        order = np.lexsort((-overall, -worst_share))
+        order = order[worst_share[order] > 0][:top]
+        slots = worst_slot[order]
+        return pd.DataFrame({
+            'Station': self.names[order],
+            'Créneau': [f"{JOURS[s // 24]} {s % 24}h-{s % 24 + 1}h" for s in slots],
+            'Part du créneau (%)': 100 * worst_share[order],
+            'Part du temps (%)': 100 * overall[order],
+            'Épisodes': self.counts[kind][order],
+            'Durée p95 (min)': self.p95_minutes[kind][order],
+        })
+
+
+@traced()
+def episode_stats(stationcodes, names, state, t0, step_minutes):
+    """
+    Épisodes vides et pleins de toutes les stations à partir d'une matrice
+    d'états (stations × pas de temps, voir `station_states`) commençant à
+    `t0`. Les cases inconnues prolongent le dernier état relevé. Traité par
+    paquets de CHUNK_STATIONS stations, chaque paquet entièrement vectorisé.
+    """
+    n_stations, n_steps = state.shape
+    t0 = pd.Timestamp(t0)
+    # Créneau heure-de-la-semaine de chaque pas, puis indicatrice pas → créneau.
+    times = t0 + pd.to_timedelta(np.arange(n_steps) * step_minutes, unit='min')
+    step_slots = hour_of_week(times)
+    # Les pas d'une même heure sont contigus : on somme d'abord par plage de même
+    # créneau (np.add.reduceat), puis on ventile les plages sur les 168 créneaux.
+    bounds = np.flatnonzero(np.diff(step_slots, prepend=-1))
+    one_hot = np.zeros((len(bounds), SLOTS_PER_WEEK), dtype=np.float32)
+    one_hot[np.arange(len(bounds)), step_slots[bounds]] = step_minutes
+
+    counts = {kind: np.zeros(n_stations, dtype=np.int64) for kind in KINDS}
+    total = {kind: np.zeros(n_stations, dtype=np.float64) for kind in KINDS}
+    p95 = {kind: np.full(n_stations, np.nan) for kind in KINDS}
+    slot_minutes = {kind: np.zeros((n_stations, SLOTS_PER_WEEK), dtype=np.float32) for kind in KINDS}
+    observed_minutes = np.zeros((n_stations, SLOTS_PER_WEEK), dtype=np.float32)
+
+    for a in range(0, n_stations, CHUNK_STATIONS):
+        b = min(a + CHUNK_STATIONS, n_stations)
+        chunk = _ffill_states(state[a:b])
+        observed = np.add.reduceat(chunk != UNKNOWN, bounds, axis=1, dtype=np.int32)
+        observed_minutes[a:b] = observed @ one_hot
+        for kind, code in KINDS.items():
+            mask = chunk == code
+            rows, _, lengths = run_lengths(mask)
+            counts[kind][a:b] = np.bincount(rows, minlength=b - a)
+            total[kind][a:b] = np.bincount(rows, weights=lengths, minlength=b - a) * step_minutes
+            p95[kind][a:b] = grouped_percentile(rows, lengths, b - a, 0.95) * step_minutes
+            slot_minutes[kind][a:b] = np.add.reduceat(mask, bounds, axis=1, dtype=np.int32) @ one_hot
+
+    end = t0 + pd.Timedelta(minutes=n_steps * step_minutes)
+    return EpisodeStats(stationcodes, names, step_minutes, t0, end, counts, total, p95, slot_minutes, observed_minutes)
+
+
+def build_state_matrix(store, days=28, step_minutes=5):
+    """
+    Range les `days` derniers jours de l'historique dans une matrice d'états
+    stations × pas de temps (int8, voir `station_states`), en lisant
+    l'historique par lots. Renvoie (stationcodes, noms, t0, matrice) ou None.
+    """
+    extent = store.extent()
+    if extent is None:
+        return None
+    codes, dataset_end = extent
+
+    step = pd.Timedelta(minutes=step_minutes)
+    end = dataset_end.floor(step)
+    start = end - pd.Timedelta(days=days)
+    n_steps = int((end - start) / step) + 1
+
+    state = np.full((len(codes), n_steps), UNKNOWN, dtype=np.int8)
+    for batch in store.scan(
+        columns=['stationcode', 'duedate', 'VelosDispoTotal', 'BornesLibres'], start=start, end=end + step,
+    ):
+        rows, cols, ok = grid_positions(batch, codes, start, step, n_steps)
+        state[rows, cols] = station_states(
+            batch.column('VelosDispoTotal').to_numpy(zero_copy_only=False)[ok].astype(np.float32),
+            batch.column('BornesLibres').to_numpy(zero_copy_only=False)[ok].astype(np.float32),
+        )
+
+    seen = (state != UNKNOWN).any(axis=1)
+    stationcodes = np.asarray(codes.to_pylist(), dtype=object)[seen]
+    names = store.latest_names(stationcodes, since=end - pd.Timedelta(days=1))
+    return stationcodes, names, start, state[seen]
+
+
+@traced()
+def episodes_from_store(store=None, days=28, step_minutes=5):
+    """Épisodes vides/pleins sur l'historique ; None si l'historique est vide."""
+    store = store or SnapshotStore()
+    built = build_state_matrix(store, days, step_minutes)
+    if built is None:
+        return None
+    stationcodes, names, t0, state = built
+    return episode_stats(stationcodes, names, state, t0, step_minutes)
+
+
+@traced()
+def load_episodes(store=None, days=28, step_minutes=5):
+    """
+    Épisodes mis en cache par empreinte de l'historique : recalculés
+    seulement quand un nouvel instantané a été ingéré. None si l'historique est vide.
+    """
+    store = store or SnapshotStore()
+    fingerprint = store.fingerprint()
+    if fingerprint is None:
+        return None
+    return snapshot_cache.get_or_build(
+        fingerprint, f'episodes-{days}d-{step_minutes}min',
+        lambda: episodes_from_store(store, days, step_minutes),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Épisodes de stations vides et pleines sur l'historique.")
+    parser.add_argument('--root', default=HISTORY_PATH, help="Dossier de l'historique.")
+    parser.add_argument('--days', type=int, default=28)
+    parser.add_argument('--step', type=int, default=5, help="Pas de temps en minutes.")
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    stats = episodes_from_store(SnapshotStore(args.root), args.days, args.step)
+    if stats is None:
+        raise SystemExit(f"{args.root} : historique vide.")
+    print(f"{len(stats.stationcodes)} stations du {stats.start:%d/%m %H:%M} au {stats.end:%d/%m %H:%M} "
+          f"en {time.perf_counter() - start:.2f} s")
+    with pd.option_context('display.width', 160, 'display.max_columns', 10):
+        for kind in KINDS:
+            print(f"\nStations le plus souvent {kind}s :")
+            print(stats.ranking(kind, top=args.top).to_string(index=False, float_format='{:.0f}'.format))
+
+
+if __name__ == '__main__':
+    main()
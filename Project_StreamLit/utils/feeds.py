@@ -0,0 +1,424 @@
+# utils/feeds.py
+import argparse
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import pandas as pd
+
+from utils.io import _compact
+from utils.live import FileFeedSource, HttpFeedSource
+from utils.prep import clean_data, quality_report
+
+
+# Fichier de configuration des réseaux suivis ensemble (absent : le JSON local seul).
+FEEDS_CONFIG = os.environ.get('VELIB_FEEDS', os.path.join(os.path.dirname(__file__), '..', 'data', 'feeds.json'))
+FEEDS_INTERVAL = float(os.environ.get('VELIB_FEEDS_INTERVAL', 60))
+FEED_TIMEOUT = 10.0
+# Attente après un échec : BACKOFF_BASE s, doublée à chaque échec consécutif, au plus BACKOFF_MAX s.
+BACKOFF_BASE = 5.0
+BACKOFF_MAX = 300.0
+
+FEED_FORMATS = ('velib', 'gbfs')
+
+FeedSpec = namedtuple('FeedSpec', ['network', 'source', 'format'])
+
+
+def load_config(path=FEEDS_CONFIG):
+    """
+    Réseaux décrits dans un fichier JSON : liste de {"network", "source",
+    "format"} (format 'velib' par défaut, ou 'gbfs'). Les chemins relatifs sont
+    résolus depuis le dossier du fichier. None si le fichier n'existe pas.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        entries = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    specs = []
+    for entry in entries:
+        source = entry['source']
+        if not _is_http(source):
+            source = os.path.normpath(os.path.join(base, source))
+        fmt = entry.get('format', 'velib')
+        if fmt not in FEED_FORMATS:
+            raise ValueError(f"{path} : format '{fmt}' inconnu pour {entry['network']} (attendu : {', '.join(FEED_FORMATS)}).")
+        specs.append(FeedSpec(entry['network'], source, fmt))
+    return specs
+
+
+def _is_http(source):
+    return source.startswith(('http://', 'https://'))
+
+
+class FetchThreads:
+    """
+    Threads qui exécutent les interrogations bloquantes des sources
+    (`utils.live`) pour la boucle asyncio : au plus `per_host` requêtes
+    simultanées vers un même hôte, toutes sources confondues. Réserve propre
+    aux réseaux : une source lente ou dépassée n'occupe pas les threads par
+    défaut de la boucle (dimensionnés sur le nombre de processeurs).
+    """
+
+    def __init__(self, per_host=4, max_workers=32):
+        self.per_host = per_host
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='velib-feed')
+        self._slots = {}
+
+    async def fetch(self, url, source):
+        """`source.fetch()` dans un thread, sous la limite de l'hôte de `url` (aucune pour un fichier)."""
+        loop = asyncio.get_running_loop()
+        if not _is_http(url):
+            return await loop.run_in_executor(self._executor, source.fetch)
+        # Sémaphores liés à la boucle d'événements qui les utilise.
+        slot = self._slots.setdefault(urlsplit(url).netloc, asyncio.Semaphore(self.per_host))
+        async with slot:
+            return await loop.run_in_executor(self._executor, source.fetch)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def normalize_velib(body, network):
+    """
+    Instantané au format Vélib' Opendata (liste d'enregistrements, ou réponse
+    de l'API avec une clé 'results') → (tableau `clean_data`, stations brutes).
+    """
+    records = json.loads(body)
+    if isinstance(records, dict):
+        records = records.get('results', [])
+    df_raw = pd.DataFrame(records)
+    return _clean(df_raw, network), len(df_raw)
+
+
+def _gbfs_stations(body):
+    return pd.DataFrame(json.loads(body)['data']['stations'])
+
+
+def _gbfs_text(values):
+    """Champ texte GBFS : chaîne (v2) ou liste de traductions [{text, language}] (v3)."""
+    return values.map(lambda v: v[0]['text'] if isinstance(v, list) and v else v)
+
+
+def _gbfs_flag(values):
+    """Booléen GBFS (true/false ou 1/0) → 'OUI'/'NON' comme dans le JSON Vélib'."""
+    return values.map(lambda v: 'OUI' if v in (True, 1, '1', 'true') else 'NON')
+
+
+def normalize_gbfs(information_body, status_body, network):
+    """
+    Fichiers GBFS station_information et station_status → (tableau
+    `clean_data`, stations brutes). Vélos mécaniques/électriques lus dans
+    `num_bikes_available_types` s'il est publié (tous mécaniques sinon) ;
+    la commune est le nom du réseau.
+    """
+    info = _gbfs_stations(information_body)
+    status = _gbfs_stations(status_body)
+    for df in (info, status):
+        df['station_id'] = df['station_id'].astype(str)
+    df = info.merge(status, on='station_id', how='inner', suffixes=('', '_status'))
+    if df.empty:
+        return pd.DataFrame(), 0
+
+    bikes = pd.to_numeric(df.get('num_bikes_available', df.get('num_vehicles_available')), errors='coerce')
+    docks = pd.to_numeric(df['num_docks_available'], errors='coerce')
+    if 'num_bikes_available_types' in df.columns:
+        types = df['num_bikes_available_types'].map(
+            lambda v: {k: n for item in v for k, n in item.items()} if isinstance(v, list) else {}
+        )
+        mechanical = types.str.get('mechanical')
+        ebike = types.str.get('ebike')
+    else:
+        mechanical, ebike = bikes, 0
+    reported = df['last_reported'] if 'last_reported' in df.columns else pd.Series(pd.NaT, index=df.index)
+    if pd.api.types.is_numeric_dtype(reported):
+        reported = pd.to_datetime(reported, unit='s', utc=True)
+
+    df_raw = pd.DataFrame({
+        'stationcode': df['station_id'],
+        'name': _gbfs_text(df['name']),
+        'capacity': pd.to_numeric(df['capacity'], errors='coerce') if 'capacity' in df.columns else bikes + docks,
+        'numdocksavailable': docks,
+        'numbikesavailable': bikes,
+        'mechanical': mechanical,
+        'ebike': ebike,
+        'is_renting': _gbfs_flag(df['is_renting']) if 'is_renting' in df.columns else 'OUI',
+        'is_returning': _gbfs_flag(df['is_returning']) if 'is_returning' in df.columns else 'OUI',
+        'duedate': reported,
+        'lat': df['lat'],
+        'lon': df['lon'],
+        'nom_arrondissement_communes': network,
+    })
+    return _clean(df_raw, network), len(df_raw)
+
+
+def _clean(df_raw, network):
+    df_clean, _ = clean_data(df_raw, keep_keys=True)
+    if df_clean.empty:
+        return df_clean
+    return df_clean.assign(Reseau=network)
+
+
+def _gbfs_feed_urls(body):
+    """URLs des fichiers d'un gbfs.json (v2 : par langue, v3 : liste directe)."""
+    data = json.loads(body)['data']
+    feeds = data.get('feeds')
+    if feeds is None:
+        feeds = next(iter(data.values()))['feeds']
+    return {feed['name']: feed['url'] for feed in feeds}
+
+
+class FeedSource:
+    """
+    Un réseau : récupération (HTTP conditionnel ou fichier surveillé, une
+    source de `utils.live` par URL, interrogée dans un thread), normalisation
+    vers le schéma de `clean_data` et attente croissante après chaque échec
+    (le dernier tableau valide est conservé en attendant).
+    """
+
+    def __init__(self, spec, timeout=FEED_TIMEOUT):
+        self.spec = spec
+        self.timeout = timeout
+        self.frame = None
+        self.n_raw = 0
+        self.status = 'en attente'
+        self.fetch_ms = None
+        self.failures = 0
+        self.retry_at = 0.0
+        self.last_error = None
+        self._clients = {}
+        self._bodies = {}
+        self._gbfs_urls = None
+
+    async def poll(self, threads):
+        """Interroge la source si elle n'est pas en attente ; True si son tableau a changé."""
+        now = time.monotonic()
+        if now < self.retry_at:
+            self.status = 'en attente (échecs)'
+            return False
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(self._fetch(threads), self.timeout)
+        except Exception as e:
+            # Un thread dépassé peut encore utiliser ses connexions : sources neuves au prochain essai.
+            self._clients = {}
+            self.failures += 1
+            delay = min(BACKOFF_BASE * 2 ** (self.failures - 1), BACKOFF_MAX)
+            # Gigue : des sources tombées ensemble ne sont pas réessayées en même temps.
+            self.retry_at = time.monotonic() + delay * random.uniform(0.8, 1.2)
+            self.last_error = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+            self.status = 'erreur'
+            self.fetch_ms = (time.perf_counter() - start) * 1e3
+            return False
+        self.fetch_ms = (time.perf_counter() - start) * 1e3
+        self.failures = 0
+        self.retry_at = 0.0
+        self.last_error = None
+        if result is None:
+            self.status = 'inchangé'
+            return False
+        self.frame, self.n_raw = result
+        self.status = 'mis à jour'
+        return True
+
+    async def _fetch(self, threads):
+        if self.spec.format == 'velib':
+            body = await self._get(threads, self.spec.source)
+            if body is None:
+                return None
+            return await asyncio.to_thread(normalize_velib, body, self.spec.network)
+
+        urls = await self._resolve_gbfs(threads)
+        bodies = await asyncio.gather(*(self._get(threads, url) for url in urls))
+        if all(body is None for body in bodies):
+            return None
+        information, status = (self._bodies[url] for url in urls)
+        return await asyncio.to_thread(normalize_gbfs, information, status, self.spec.network)
+
+    async def _resolve_gbfs(self, threads):
+        """station_information et station_status : via gbfs.json, ou voisins de la source sinon."""
+        if self._gbfs_urls is None:
+            source = self.spec.source
+            if source.endswith('gbfs.json'):
+                await self._get(threads, source)
+                feeds = _gbfs_feed_urls(self._bodies[source])
+                self._gbfs_urls = (feeds['station_information'], feeds['station_status'])
+            else:
+                base = source.rstrip('/')
+                join = (lambda name: f'{base}/{name}') if _is_http(source) else (lambda name: os.path.join(base, name))
+                self._gbfs_urls = (join('station_information.json'), join('station_status.json'))
+        return self._gbfs_urls
+
+    async def _get(self, threads, url):
+        """Corps de `url` (HTTP ou fichier), None s'il n'a pas changé depuis le dernier appel."""
+        source = self._clients.get(url)
+        if source is None:
+            source = self._clients[url] = HttpFeedSource(url, self.timeout) if _is_http(url) else FileFeedSource(url)
+        body = await threads.fetch(url, source)
+        if body is not None:
+            self._bodies[url] = body
+        return body
+
+    def close(self):
+        for source in self._clients.values():
+            if isinstance(source, HttpFeedSource):
+                source.close()
+        self._clients = {}
+
+    def describe(self):
+        """État de la source, pour le panneau de qualité et la ligne de commande."""
+        retry_in = max(self.retry_at - time.monotonic(), 0.0)
+        return {
+            'Réseau': self.spec.network,
+            'Format': self.spec.format,
+            'Statut': self.status,
+            'Stations': 0 if self.frame is None else len(self.frame),
+            'Durée (ms)': None if self.fetch_ms is None else round(self.fetch_ms),
+            'Échecs': self.failures,
+            'Prochain essai (s)': round(retry_in) if retry_in else None,
+            'Erreur': self.last_error,
+        }
+
+
+class MultiFeed:
+    """
+    Plusieurs réseaux interrogés ensemble sur une boucle asyncio tournant dans
+    un thread : à chaque rafraîchissement, toutes les sources sont interrogées
+    en parallèle (la durée suit la source la plus lente, pas leur somme), puis
+    leurs tableaux sont fusionnés en un seul, étiqueté par réseau (`Reseau`).
+    """
+
+    def __init__(self, specs, interval=FEEDS_INTERVAL, timeout=FEED_TIMEOUT):
+        self.sources = [FeedSource(spec, timeout) for spec in specs]
+        self.interval = interval
+        self.version = 0
+        self.table = pd.DataFrame()
+        self.report = ""
+        self.refresh_ms = None
+        self.refreshed = threading.Event()
+        self._threads = None
+        self._lock = threading.Lock()
+        self._loop = None
+        self._task = None
+        self._thread = None
+
+    async def refresh(self):
+        """Un rafraîchissement de toutes les sources ; renvoie True si le tableau fusionné a changé."""
+        if self._threads is None:
+            self._threads = FetchThreads()
+        start = time.perf_counter()
+        changed = await asyncio.gather(*(source.poll(self._threads) for source in self.sources))
+        if any(changed):
+            table, report = await asyncio.to_thread(self._merge)
+            with self._lock:
+                self.table, self.report = table, report
+                self.version += 1
+        self.refresh_ms = (time.perf_counter() - start) * 1e3
+        self.refreshed.set()
+        return any(changed)
+
+    def _merge(self):
+        frames = [source.frame for source in self.sources if source.frame is not None and not source.frame.empty]
+        if not frames:
+            return pd.DataFrame(), "Aucune donnée valide reçue des réseaux."
+        df_clean = pd.concat(frames, ignore_index=True)
+        report = quality_report(sum(source.n_raw for source in self.sources if source.frame is not None), len(df_clean))
+        report += "".join(
+            f"- **{source.spec.network}**: {0 if source.frame is None else len(source.frame)} stations ({source.status}).\n    "
+            for source in self.sources
+        )
+        return _compact((df_clean, report))
+
+    def current(self):
+        """(version, tableau fusionné, rapport de qualité) — objets en lecture seule."""
+        with self._lock:
+            return self.version, self.table, self.report
+
+    def status_frame(self):
+        return pd.DataFrame([source.describe() for source in self.sources])
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._thread_main, name='velib-feeds', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._loop is not None and self._task is not None:
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _thread_main(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._task = self._loop.create_task(self._run())
+            self._loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.close()
+            self._loop.close()
+
+    def close(self):
+        """Ferme les connexions des sources et libère les threads d'interrogation."""
+        for source in self.sources:
+            source.close()
+        if self._threads is not None:
+            self._threads.close()
+            self._threads = None
+
+    async def _run(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.interval)
+
+
+_feeds = {}
+_feeds_lock = threading.Lock()
+
+
+def get_multi_feed(config=FEEDS_CONFIG, interval=FEEDS_INTERVAL, timeout=FEED_TIMEOUT):
+    """
+    Réseaux du fichier `config`, partagés par toutes les sessions et rafraîchis
+    en tâche de fond (premier rafraîchissement attendu). None sans configuration.
+    """
+    specs = load_config(config)
+    if not specs:
+        return None
+    with _feeds_lock:
+        feed = _feeds.get(config)
+        if feed is None:
+            feed = _feeds[config] = MultiFeed(specs, interval, timeout).start()
+    feed.refreshed.wait(timeout + 5)
+    return feed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Interroge une fois tous les réseaux configurés et affiche le tableau fusionné.")
+    parser.add_argument('--config', default=FEEDS_CONFIG, help="Fichier JSON des réseaux.")
+    parser.add_argument('--timeout', type=float, default=FEED_TIMEOUT)
+    args = parser.parse_args()
+
+    specs = load_config(args.config)
+    if not specs:
+        raise SystemExit(f"{args.config} : aucun réseau configuré.")
+    feed = MultiFeed(specs, timeout=args.timeout)
+    asyncio.run(feed.refresh())
+    feed.close()
+    _, table, _ = feed.current()
+    with pd.option_context('display.width', 160, 'display.max_columns', 10):
+        print(feed.status_frame().to_string(index=False))
+    print(f"\n{len(table)} stations fusionnées en {feed.refresh_ms:.0f} ms.")
+    if not table.empty:
+        print(table.groupby('Reseau', observed=True)['VelosDispoTotal'].agg(['size', 'sum']).to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# utils/filters.py
+import numpy as np
+
+from utils.perf import traced
+
+
+TYPE_VELO_COLUMNS = {
+    'Mécanique': 'VelosMecaniques',
+    'Électrique': 'VelosElectriques',
+}
+
+
+class StationFilterIndex:
+    """
+    Index de filtrage construit une fois par instantané sur `df_clean`.
+
+    - commune → positions des stations, triées par `VelosDispoTotal` ;
+    - index trié global sur `VelosDispoTotal` ;
+    - masques de présence de vélos mécaniques / électriques.
+
+    `select` renvoie les positions (au sens `iloc`) des stations retenues,
+    sans copier le DataFrame : le seuil de vélos est résolu par recherche
+    dichotomique, puis intersecté avec le masque du type de vélo.
+    """
+
+    @traced('StationFilterIndex')
+    def __init__(self, df_clean):
+        self.n_rows = len(df_clean)
+
+        if 'VelosDispoTotal' in df_clean.columns:
+            self.velos = df_clean['VelosDispoTotal'].to_numpy()
+        else:
+            self.velos = None
+        self.order = self._sorted_positions(np.arange(self.n_rows))
+        self.sorted_velos = self.velos[self.order] if self.velos is not None else None
+
+        self.communes = {}
+        self.commune_list = []
+        if 'Commune' in df_clean.columns:
+            codes, uniques = df_clean['Commune'].factorize(sort=True)
+            by_code = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[by_code], np.arange(len(uniques) + 1))
+            for i, commune in enumerate(uniques):
+                positions = self._sorted_positions(by_code[bounds[i]:bounds[i + 1]])
+                sorted_velos = self.velos[positions] if self.velos is not None else None
+                self.communes[commune] = (positions, sorted_velos)
+            self.commune_list = list(uniques)
+
+        self.type_masks = {
+            type_velo: df_clean[col].to_numpy() > 0
+            for type_velo, col in TYPE_VELO_COLUMNS.items()
+            if col in df_clean.columns
+        }
+
+    def _sorted_positions(self, positions):
+        if self.velos is None:
+            return positions
+        return positions[np.argsort(self.velos[positions], kind='stable')]
+
+    @property
+    def max_velos(self):
+        if self.sorted_velos is None or len(self.sorted_velos) == 0:
+            return None
+        return int(self.sorted_velos[-1])
+
+    @property
+    def nbytes(self):
+        arrays = [self.order, self.velos, self.sorted_velos, *self.type_masks.values()]
+        for positions, sorted_velos in self.communes.values():
+            arrays.extend([positions, sorted_velos])
+        return int(sum(a.nbytes for a in arrays if a is not None))
+
+    @traced('StationFilterIndex.select')
+    def select(self, commune='Toutes', min_velos=0, type_velo='Tous'):
+        """Positions triées des stations correspondant à la combinaison de filtres."""
+        if commune != 'Toutes' and self.communes:
+            positions, sorted_velos = self.communes.get(commune, (np.empty(0, dtype=np.intp), None))
+        else:
+            positions, sorted_velos = self.order, self.sorted_velos
+
+        if sorted_velos is not None:
+            positions = positions[np.searchsorted(sorted_velos, min_velos, side='left'):]
+
+        mask = self.type_masks.get(type_velo)
+        if mask is not None:
+            positions = positions[mask[positions]]
+
+        return np.sort(positions)
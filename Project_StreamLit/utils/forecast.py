@@ -0,0 +1,250 @@
+# utils/forecast.py
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utils.cache import snapshot_cache
+from utils.history import HISTORY_PATH, SnapshotStore, grid_positions
+from utils.perf import traced
+
+
+HORIZONS_MIN = (10, 30, 60)
+SLOTS_PER_WEEK = 7 * 24
+# Au-delà de ce nombre de cases (stations × pas de temps), l'ajustement est
+# réparti sur un pool de processus.
+PARALLEL_MIN_CELLS = 20_000_000
+
+
+def _norm_sf(z):
+    """P(Z > z) pour une loi normale centrée réduite (Abramowitz & Stegun 7.1.26)."""
+    x = np.abs(z) / np.sqrt(2.0)
+    t = 1.0 / (1.0 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erfc = poly * np.exp(-x * x)
+    return np.where(z >= 0, 0.5 * erfc, 1.0 - 0.5 * erfc)
+
+
+def _ffill(matrix):
+    """Propage la dernière valeur observée le long des colonnes (vectorisé)."""
+    observed = ~np.isnan(matrix)
+    idx = np.where(observed, np.arange(matrix.shape[1]), 0)
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    return np.take_along_axis(matrix, idx, axis=1)
+
+
+def hour_of_week(times):
+    """Créneau horaire de la semaine (0 = lundi 0h) pour des instants UTC convertis en heure de Paris."""
+    local = pd.DatetimeIndex(times).tz_convert('Europe/Paris')
+    return (local.dayofweek * 24 + local.hour).to_numpy()
+
+
+def fit_matrix(matrix, slots, future_slots, capacity, horizon_steps, alpha=0.5, smoothing_steps=12):
+    """
+    Ajuste un modèle par station, toutes stations à la fois :
+
+    - profil heure-de-la-semaine : moyenne des vélos par créneau ;
+    - résidu autour du profil modélisé en AR(1) (coefficient et variance
+      estimés par station), niveau courant obtenu par lissage exponentiel des
+      derniers résidus.
+
+    `matrix` (stations × pas de temps) contient les vélos disponibles (NaN si
+    inconnu). Renvoie un tableau (stations × horizons × N+1) de P(vélos ≥ N).
+    """
+    n_stations = matrix.shape[0]
+    filled = _ffill(np.asarray(matrix, dtype=np.float32))
+    observed = ~np.isnan(filled)
+    values = np.where(observed, filled, np.float32(0))
+    del filled
+
+    # Profil : sommes et effectifs par créneau, via un produit avec l'indicatrice des créneaux.
+    one_hot = np.zeros((len(slots), SLOTS_PER_WEEK), dtype=np.float32)
+    one_hot[np.arange(len(slots)), slots] = 1.0
+    sums = values @ one_hot
+    counts = observed.astype(np.float32) @ one_hot
+    n_observed = observed.sum(axis=1)
+    station_mean = values.sum(axis=1, dtype=np.float64) / np.maximum(n_observed, 1)
+    profile = np.where(counts > 0, sums / np.maximum(counts, 1), station_mean[:, None]).astype(np.float32)
+
+    residual = values - profile[:, slots]
+    residual[~observed] = 0
+    lag_prod = np.einsum('ij,ij->i', residual[:, 1:], residual[:, :-1], dtype=np.float64)
+    sq = np.einsum('ij,ij->i', residual, residual, dtype=np.float64)
+    lag_sq = sq - residual[:, -1].astype(np.float64) ** 2
+    phi = np.clip(lag_prod / np.maximum(lag_sq, 1e-9), 0.0, 0.999)
+    sigma2 = sq / np.maximum(n_observed, 1)
+
+    k = min(smoothing_steps, residual.shape[1])
+    weights = alpha * (1 - alpha) ** np.arange(k)[::-1]
+    level = residual[:, -k:] @ (weights / weights.sum())
+
+    max_n = int(max(np.nanmax(capacity) if n_stations else 0, 0))
+    thresholds = np.arange(max_n + 1)
+    prob = np.empty((n_stations, len(horizon_steps), max_n + 1), dtype=np.float32)
+    for j, (h, slot) in enumerate(zip(horizon_steps, future_slots)):
+        decay = phi ** h
+        mu = np.clip(profile[:, slot] + decay * level, 0, capacity)
+        sd = np.sqrt(sigma2 * (1 - decay ** 2) + 0.25)
+        z = (thresholds[None, :] - 0.5 - mu[:, None]) / sd[:, None]
+        prob[:, j, :] = _norm_sf(z)
+    prob[:, :, 0] = 1.0
+    return prob
+
+
+def _fit_chunk(args):
+    return fit_matrix(*args)
+
+
+class ForecastTable:
+    """
+    Table de prévisions précalculée : P(vélos ≥ N) pour chaque station, chaque
+    horizon et chaque seuil N, émise à l'instant `issued_at`.
+    """
+
+    def __init__(self, stationcodes, names, horizons, prob, issued_at):
+        self.stationcodes = np.asarray(stationcodes)
+        self.names = np.asarray(names, dtype=object)
+        self.horizons = tuple(horizons)
+        self.prob = prob
+        self.issued_at = issued_at
+        self._pos = {code: i for i, code in enumerate(self.stationcodes)}
+
+    @property
+    def nbytes(self):
+        return int(self.prob.nbytes)
+
+    def probability(self, stationcode, min_velos, horizon):
+        """P(au moins `min_velos` vélos à la station dans `horizon` minutes)."""
+        i = self._pos.get(str(stationcode))
+        if i is None or horizon not in self.horizons:
+            return None
+        n = max(int(min_velos), 0)
+        if n >= self.prob.shape[2]:
+            return 0.0
+        return float(self.prob[i, self.horizons.index(horizon), n])
+
+    def station_frame(self, stationcode, min_velos):
+        """Probabilités d'une station pour tous les horizons, prêtes à afficher."""
+        return pd.DataFrame({
+            'Horizon': [f"{h} min" for h in self.horizons],
+            'Probabilité': [self.probability(stationcode, min_velos, h) for h in self.horizons],
+        })
+
+
+def fit_forecasts(stationcodes, names, capacity, matrix, t0, step_minutes=5,
+                  horizons=HORIZONS_MIN, workers=None):
+    """
+    Ajuste les modèles sur une matrice stations × temps (pas `step_minutes`,
+    première colonne à `t0`). Répartit les stations sur un pool de processus
+    si la matrice est grande.
+    """
+    n_stations, n_steps = matrix.shape
+    times = pd.Timestamp(t0) + pd.to_timedelta(np.arange(n_steps) * step_minutes, unit='min')
+    slots = hour_of_week(times)
+    issued_at = times[-1]
+    horizon_steps = [max(int(round(h / step_minutes)), 1) for h in horizons]
+    future_slots = hour_of_week([issued_at + pd.Timedelta(minutes=h) for h in horizons])
+    capacity = np.asarray(capacity, dtype=np.float64)
+
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+    if workers > 1 and matrix.size >= PARALLEL_MIN_CELLS:
+        bounds = np.linspace(0, n_stations, workers + 1).astype(int)
+        chunks = [
+            (matrix[a:b], slots, future_slots, capacity[a:b], horizon_steps)
+            for a, b in zip(bounds[:-1], bounds[1:]) if b > a
+        ]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_fit_chunk, chunks))
+        width = max(p.shape[2] for p in parts)
+        prob = np.concatenate([
+            np.pad(p, ((0, 0), (0, 0), (0, width - p.shape[2]))) for p in parts
+        ])
+    else:
+        prob = fit_matrix(matrix, slots, future_slots, capacity, horizon_steps)
+
+    return ForecastTable(stationcodes, names, horizons, prob, issued_at)
+
+
+def build_matrix(store, days=28, step_minutes=5):
+    """
+    Range les `days` derniers jours de l'historique dans une matrice
+    stations × pas de temps (float32, NaN si non observé), en lisant
+    l'historique par lots. Renvoie (stationcodes, noms, capacités, t0, matrice).
+    """
+    extent = store.extent()
+    if extent is None:
+        return None
+    codes, dataset_end = extent
+
+    step = pd.Timedelta(minutes=step_minutes)
+    end = dataset_end.floor(step)
+    start = end - pd.Timedelta(days=days)
+    n_steps = int((end - start) / step) + 1
+
+    matrix = np.full((len(codes), n_steps), np.nan, dtype=np.float32)
+    capacity = np.zeros(len(codes))
+    for batch in store.scan(
+        columns=['stationcode', 'duedate', 'VelosDispoTotal', 'CapaciteTotal'], start=start, end=end + step,
+    ):
+        rows, cols, ok = grid_positions(batch, codes, start, step, n_steps)
+        matrix[rows, cols] = batch.column('VelosDispoTotal').to_numpy()[ok]
+        np.maximum.at(capacity, rows, batch.column('CapaciteTotal').to_numpy()[ok])
+
+    # Stations absentes de la fenêtre : rien à ajuster.
+    seen = ~np.isnan(matrix).all(axis=1)
+    stationcodes = np.asarray(codes.to_pylist(), dtype=object)[seen]
+    matrix, capacity = matrix[seen], capacity[seen]
+    names = store.latest_names(stationcodes, since=end - pd.Timedelta(days=1))
+    return stationcodes, names, capacity, start, matrix
+
+
+@traced()
+def fit_from_store(store=None, days=28, step_minutes=5, workers=None):
+    """Ajuste les prévisions sur l'historique ; None si l'historique est vide."""
+    store = store or SnapshotStore()
+    built = build_matrix(store, days, step_minutes)
+    if built is None:
+        return None
+    stationcodes, names, capacity, t0, matrix = built
+    return fit_forecasts(stationcodes, names, capacity, matrix, t0, step_minutes, workers=workers)
+
+
+@traced()
+def load_forecasts(store=None, days=28, step_minutes=5):
+    """
+    Prévisions mises en cache par empreinte de l'historique : le modèle n'est
+    réajusté que lorsqu'un nouvel instantané a été ingéré. None si l'historique
+    est vide.
+    """
+    store = store or SnapshotStore()
+    fingerprint = store.fingerprint()
+    if fingerprint is None:
+        return None
+    return snapshot_cache.get_or_build(
+        fingerprint, f'forecast-{days}d-{step_minutes}min',
+        lambda: fit_from_store(store, days, step_minutes),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ajuste les prévisions de disponibilité sur l'historique.")
+    parser.add_argument('--root', default=HISTORY_PATH, help="Dossier de l'historique.")
+    parser.add_argument('--days', type=int, default=28)
+    parser.add_argument('--step', type=int, default=5, help="Pas de temps en minutes.")
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    table = fit_from_store(SnapshotStore(args.root), args.days, args.step, args.workers)
+    if table is None:
+        print("Historique vide.")
+        return
+    print(f"{len(table.stationcodes)} stations ajustées en {time.perf_counter() - start:.1f} s "
+          f"(prévision émise à {table.issued_at}).")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# utils/geometry.py
+import importlib
+
+import numpy as np
+import pandas as pd
+
+from utils.perf import traced
+
+
+def import_geopandas():
+    """Importe geopandas à la demande : la dépendance n'est nécessaire que pour les opérations spatiales."""
+    try:
+        return importlib.import_module('geopandas')
+    except ImportError as e:
+        raise ImportError(
+            "geopandas n'est pas installé : il n'est requis que pour les opérations spatiales "
+            "(pip install geopandas)."
+        ) from e
+
+
+class StationGeometry:
+    """
+    Coordonnées des stations d'un instantané, rangées une fois pour toutes
+    dans un tableau (n × 2, lon/lat en float64) aligné sur les lignes du
+    tableau nettoyé. Le filtrage se fait par sélection de positions ; une
+    GeoSeries shapely n'est construite qu'à la demande (`geoseries()`).
+    """
+
+    def __init__(self, coords, valid=None, positions=None):
+        self.coords = np.ascontiguousarray(coords, dtype=np.float64).reshape(-1, 2)
+        n = len(self.coords)
+        self.valid = np.isfinite(self.coords).all(axis=1) if valid is None else np.asarray(valid, dtype=bool)
+        # Positions (iloc) des lignes dans le tableau des stations d'origine.
+        self.positions = np.arange(n) if positions is None else np.asarray(positions)
+        self._geoseries = None
+
+    @classmethod
+    @traced('StationGeometry.from_frame')
+    def from_frame(cls, df):
+        """Coordonnées des lignes de `df` (lat/lon non numériques ou manquantes : ligne invalide)."""
+        if df.empty or 'lat' not in df.columns or 'lon' not in df.columns:
+            return None
+        coords = np.empty((len(df), 2), dtype=np.float64)
+        for j, col in enumerate(('lon', 'lat')):
+            values = df[col]
+            if not pd.api.types.is_numeric_dtype(values):
+                values = pd.to_numeric(values, errors='coerce')
+            coords[:, j] = values.to_numpy(dtype=np.float64, na_value=np.nan)
+        return cls(coords)
+
+    def __len__(self):
+        return len(self.coords)
+
+    @property
+    def lon(self):
+        return self.coords[:, 0]
+
+    @property
+    def lat(self):
+        return self.coords[:, 1]
+
+    @property
+    def nbytes(self):
+        return int(self.coords.nbytes + self.valid.nbytes + self.positions.nbytes)
+
+    def take(self, positions):
+        """Sous-ensemble des stations aux positions (iloc) données, sans copier le tableau d'origine."""
+        positions = np.asarray(positions)
+        return StationGeometry(self.coords[positions], self.valid[positions], self.positions[positions])
+
+    def geoseries(self):
+        """GeoSeries de points (EPSG:4326) des stations valides, construite au premier appel."""
+        if self._geoseries is None:
+            gpd = import_geopandas()
+            coords = self.coords[self.valid]
+            self._geoseries = gpd.GeoSeries(
+                gpd.points_from_xy(coords[:, 0], coords[:, 1]), index=self.positions[self.valid], crs="EPSG:4326",
+            )
+        return self._geoseries
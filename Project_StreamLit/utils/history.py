@@ -0,0 +1,269 @@
+# utils/history.py
+import argparse
+import functools
+import hashlib
+import operator
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+
+from utils.cache import file_fingerprint
+from utils.io import HISTORY_PATH, STREAM_BATCH_SIZE, iter_raw_batches
+from utils.prep import clean_data
+
+
+HISTORY_COLUMNS = [
+    'stationcode', 'duedate', 'NomStation', 'Commune',
+    'CapaciteTotal', 'BornesLibres', 'VelosDispoTotal', 'VelosMecaniques', 'VelosElectriques',
+    'LocationPossible', 'RetourPossible', 'lat', 'lon',
+]
+
+HISTORY_SCHEMA = pa.schema([
+    ('stationcode', pa.string()),
+    ('duedate', pa.timestamp('s', tz='UTC')),
+    ('NomStation', pa.string()),
+    ('Commune', pa.string()),
+    ('CapaciteTotal', pa.int16()),
+    ('BornesLibres', pa.int16()),
+    ('VelosDispoTotal', pa.int16()),
+    ('VelosMecaniques', pa.int16()),
+    ('VelosElectriques', pa.int16()),
+    ('LocationPossible', pa.bool_()),
+    ('RetourPossible', pa.bool_()),
+    ('lat', pa.float32()),
+    ('lon', pa.float32()),
+])
+
+_PARTITIONING = ds.partitioning(pa.schema([('date', pa.string())]), flavor='hive')
+# Journal des écritures et des instantanés complets, à la racine (préfixe '_' : ignoré par pyarrow.dataset).
+_MANIFEST = '_manifest'
+
+
+class SnapshotStore:
+    """
+    Historique des instantanés Vélib', en ajout seul.
+
+    Chaque instantané est écrit en Parquet, partitionné par jour de `duedate`
+    (`date=AAAA-MM-JJ/`), trié par `stationcode` puis `duedate`. La relecture
+    passe par des fichiers mappés en mémoire et n'ouvre que les partitions,
+    groupes de lignes et colonnes utiles.
+
+    Chaque écriture ajoute une ligne au manifeste (`_manifest`), dont la
+    taille sert d'empreinte à l'historique. Un instantané n'est complet
+    qu'une fois sa ligne `done` ajoutée, après l'écriture de tous ses
+    fichiers : une ingestion interrompue est reprise, ses fichiers réécrits
+    sous les mêmes noms.
+    """
+
+    def __init__(self, root=HISTORY_PATH):
+        self.root = os.path.abspath(root)
+        self._fs = pafs.LocalFileSystem(use_mmap=True)
+
+    def ingest(self, df_raw, snapshot_id):
+        """
+        Ajoute un instantané brut (format du JSON Vélib') à l'historique.
+        `snapshot_id` nomme les fichiers écrits : ré-ingérer le même
+        instantané n'ajoute pas de doublon. Renvoie le nombre de lignes écrites.
+        """
+        if self.contains(snapshot_id):
+            return 0
+        df, _ = clean_data(df_raw, keep_keys=True)
+        n_rows = self.write_clean(df, snapshot_id)
+        self.mark_done(snapshot_id)
+        return n_rows
+
+    def write_clean(self, df, snapshot_id):
+        """
+        Écrit un tableau déjà nettoyé (`clean_data(..., keep_keys=True)`).
+        Des processus différents peuvent écrire en même temps des instantanés
+        différents : chaque fichier porte l'identifiant de son instantané.
+        """
+        if df.empty or 'stationcode' not in df.columns or 'duedate' not in df.columns:
+            return 0
+        df = df.dropna(subset=['duedate'])
+
+        df = df.reindex(columns=HISTORY_COLUMNS).sort_values(['stationcode', 'duedate'])
+        table = pa.Table.from_pandas(df, schema=HISTORY_SCHEMA, preserve_index=False, safe=False)
+        table = table.append_column('date', pa.array(df['duedate'].dt.strftime('%Y-%m-%d'), pa.string()))
+
+        ds.write_dataset(
+            table,
+            self.root,
+            format='parquet',
+            partitioning=_PARTITIONING,
+            basename_template=f'snapshot-{snapshot_id}-{{i}}.parquet',
+            existing_data_behavior='overwrite_or_ignore',
+        )
+        self._log('write', snapshot_id, table.num_rows)
+        return table.num_rows
+
+    def ingest_file(self, path, batch_size=STREAM_BATCH_SIZE):
+        """
+        Ingère un fichier JSON d'instantané, identifié par l'empreinte de son
+        contenu. Le fichier est lu en flux, lot par lot.
+        """
+        snapshot_id = file_fingerprint(path)
+        if self.contains(snapshot_id):
+            return 0
+        # Lots déjà complets (ingestion interrompue) : sautés par `ingest`.
+        n_rows = sum(
+            self.ingest(df_batch, f'{snapshot_id}-{i}')
+            for i, df_batch in enumerate(iter_raw_batches(path, batch_size))
+        )
+        self.mark_done(snapshot_id)
+        return n_rows
+
+    def mark_done(self, snapshot_id):
+        """Déclare l'instantané complet : à appeler une fois tous ses fichiers écrits."""
+        self._log('done', snapshot_id)
+
+    def _log(self, *fields):
+        os.makedirs(self.root, exist_ok=True)
+        # Une ligne courte en mode ajout : une seule écriture, sûre entre processus.
+        with open(os.path.join(self.root, _MANIFEST), 'a', encoding='utf-8') as f:
+            f.write('\t'.join(map(str, fields)) + '\n')
+
+    def contains(self, snapshot_id):
+        """True si l'instantané a été entièrement écrit (voir `mark_done`)."""
+        try:
+            with open(os.path.join(self.root, _MANIFEST), encoding='utf-8') as f:
+                return any(line.rstrip('\n') == f'done\t{snapshot_id}' for line in f)
+        except FileNotFoundError:
+            return False
+
+    def fingerprint(self):
+        """
+        Empreinte de l'historique : taille et date du manifeste, qui grandit à
+        chaque écriture (un seul appel à stat, quel que soit le nombre de
+        fichiers). None si l'historique est vide.
+        """
+        try:
+            stat = os.stat(os.path.join(self.root, _MANIFEST))
+        except FileNotFoundError:
+            return self._scan_fingerprint()
+        return f'history-{stat.st_size}-{stat.st_mtime_ns}'
+
+    def _scan_fingerprint(self):
+        """Empreinte d'un historique écrit avant le manifeste : noms, tailles et dates de tous les fichiers."""
+        if not os.path.isdir(self.root):
+            return None
+        digest = hashlib.blake2b(digest_size=16)
+        n_files = 0
+        for partition in sorted(os.listdir(self.root)):
+            part_dir = os.path.join(self.root, partition)
+            if not os.path.isdir(part_dir):
+                continue
+            for name in sorted(os.listdir(part_dir)):
+                stat = os.stat(os.path.join(part_dir, name))
+                digest.update(f'{partition}/{name}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+                n_files += 1
+        return f'history-{digest.hexdigest()}' if n_files else None
+
+    def dataset(self):
+        return ds.dataset(
+            self.root, format='parquet', partitioning=_PARTITIONING, filesystem=self._fs,
+        )
+
+    def _filter(self, start=None, end=None, stationcodes=None):
+        conditions = []
+        if start is not None:
+            start = _utc(start)
+            conditions.append(ds.field('date') >= start.strftime('%Y-%m-%d'))
+            conditions.append(ds.field('duedate') >= _ts_scalar(start))
+        if end is not None:
+            end = _utc(end)
+            conditions.append(ds.field('date') <= end.strftime('%Y-%m-%d'))
+            conditions.append(ds.field('duedate') < _ts_scalar(end))
+        if stationcodes is not None:
+            conditions.append(ds.field('stationcode').isin([str(code) for code in stationcodes]))
+        return functools.reduce(operator.and_, conditions) if conditions else None
+
+    def scan(self, columns=None, start=None, end=None, stationcodes=None, batch_size=1 << 17):
+        """
+        Itère sur l'historique par lots `pyarrow.RecordBatch`, sans le charger
+        entièrement : seules les colonnes demandées et la fenêtre
+        [start, end[ sont lues.
+        """
+        if not os.path.isdir(self.root):
+            return iter(())
+        scanner = self.dataset().scanner(
+            columns=columns or HISTORY_COLUMNS,
+            filter=self._filter(start, end, stationcodes),
+            batch_size=batch_size,
+        )
+        return scanner.to_batches()
+
+    def extent(self):
+        """
+        Stations connues (tableau Arrow) et dernier instant de l'historique,
+        obtenus par lots en ne lisant que deux colonnes. None si l'historique est vide.
+        """
+        end = None
+        codes = None
+        for batch in self.scan(columns=['stationcode', 'duedate']):
+            if batch.num_rows == 0:
+                continue
+            batch_end = pc.max(batch.column('duedate')).as_py()
+            end = batch_end if end is None else max(end, batch_end)
+            batch_codes = pc.unique(batch.column('stationcode'))
+            codes = batch_codes if codes is None else pc.unique(pa.concat_arrays([codes, batch_codes]))
+        if end is None:
+            return None
+        return codes, pd.Timestamp(end)
+
+    def latest_names(self, stationcodes, since):
+        """Dernier nom connu de chaque station depuis `since` ('Inconnue' à défaut)."""
+        latest = self.read(columns=['stationcode', 'NomStation'], start=since)
+        names = latest.drop_duplicates('stationcode', keep='last').set_index('stationcode')['NomStation']
+        return names.reindex(stationcodes).fillna('Inconnue').to_numpy()
+
+    def read(self, columns=None, start=None, end=None, stationcodes=None):
+        """Lit une fenêtre de l'historique sous forme de DataFrame."""
+        columns = columns or HISTORY_COLUMNS
+        if not os.path.isdir(self.root):
+            return pd.DataFrame(columns=columns)
+        table = self.dataset().to_table(columns=columns, filter=self._filter(start, end, stationcodes))
+        return table.to_pandas()
+
+
+def grid_positions(batch, codes, start, step, n_steps):
+    """
+    Case de chaque relevé d'un lot dans une grille stations × pas de temps
+    (lignes dans l'ordre de `codes`, colonne 0 à `start`, pas `step`).
+    Renvoie (lignes, colonnes, masque des relevés tombant dans la grille) :
+    lignes et colonnes ne concernent que les relevés retenus.
+    """
+    rows = pc.index_in(batch.column('stationcode'), value_set=codes).to_numpy(zero_copy_only=False)
+    ts = batch.column('duedate').cast(pa.timestamp('ns', tz='UTC')).to_numpy().astype(np.int64)
+    cols = (ts - pd.Timestamp(start).value) // pd.Timedelta(step).value
+    ok = (cols >= 0) & (cols < n_steps)
+    return rows[ok].astype(np.int64), cols[ok], ok
+
+
+def _utc(ts):
+    ts = pd.Timestamp(ts)
+    return ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+
+
+def _ts_scalar(ts):
+    return pa.scalar(ts.to_pydatetime(), pa.timestamp('s', tz='UTC'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ajoute des instantanés JSON Vélib' à l'historique Parquet.")
+    parser.add_argument('paths', nargs='+', help="Fichiers JSON d'instantanés.")
+    parser.add_argument('--root', default=HISTORY_PATH, help="Dossier de l'historique.")
+    args = parser.parse_args()
+
+    store = SnapshotStore(args.root)
+    for path in args.paths:
+        print(f"{path}: {store.ingest_file(path)} lignes ajoutées")
+
+
+if __name__ == '__main__':
+    main()
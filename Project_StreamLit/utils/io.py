@@ -1,17 +1,31 @@
-
 import streamlit as st
+import numpy as np
 import pandas as pd
+import json
 import os
+from collections import Counter, namedtuple
+
+from utils.cache import snapshot_cache
+from utils.perf import traced
 
 
 DATA_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'velib_data.json')
-def load_data():
-    """
-    Charge et met en cache les données brutes depuis le JSON local.
-    """
+HISTORY_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'history')
+
+# Au-delà de cette taille, `load_snapshot` passe en ingestion en flux.
+STREAMING_MIN_BYTES = 64 * 1024 ** 2
+STREAM_BATCH_SIZE = 50_000
+
+_JSON_SEPARATORS = ' \t\r\n,[]'
+
+Snapshot = namedtuple('Snapshot', ['df_raw', 'df_clean', 'data_quality_report', 'geometry', 'filter_index', 'spatial_index', 'cube', 'fingerprint', 'anomalies'])
+
+
+@traced('pd.read_json')
+def _read_raw(path):
     try:
         
-        df_raw = pd.read_json(DATA_PATH)
+        df_raw = pd.read_json(path)
         
         if df_raw.empty:
             st.error("Le jeu de données JSON est vide.")
@@ -20,11 +34,238 @@ def load_data():
         return df_raw
         
     except FileNotFoundError:
-        st.error(f"Erreur : Le fichier {DATA_PATH} est introuvable. Assurez-vous qu'il est bien dans le dossier 'data'.")
+        st.error(f"Erreur : Le fichier {path} est introuvable. Assurez-vous qu'il est bien dans le dossier 'data'.")
         return pd.DataFrame()
     except ValueError as ve:
         st.error(f"Erreur lors de la lecture du JSON : {ve}. Assurez-vous que le fichier est correctement formaté.")
         return pd.DataFrame()
     except Exception as e:
         st.error(f"Erreur inattendue lors du chargement des données : {e}")
-        return pd.DataFrame()
\ No newline at end of file
+        return pd.DataFrame()
+
+
+def load_data(path=DATA_PATH):
+    """
+    Charge et met en cache les données brutes depuis le JSON local.
+    Le cache est indexé sur l'empreinte du contenu du fichier : il est
+    invalidé dès que l'instantané change sur le disque.
+    """
+    try:
+        fingerprint = snapshot_cache.fingerprint(path)
+    except FileNotFoundError:
+        st.error(f"Erreur : Le fichier {path} est introuvable. Assurez-vous qu'il est bien dans le dossier 'data'.")
+        return pd.DataFrame()
+
+    return snapshot_cache.get_or_build(fingerprint, 'raw', lambda: _read_raw(path))
+
+
+def iter_station_records(path, chunk_size=1 << 20):
+    """
+    Lit les stations une par une depuis un fichier JSON, sans construire tout
+    l'arbre d'objets en mémoire. Accepte un tableau JSON, plusieurs tableaux
+    concaténés (archives journalières mises bout à bout) ou du JSON ligne par ligne.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    with open(path, 'r', encoding='utf-8') as f:
+        while True:
+            while pos < len(buffer) and buffer[pos] in _JSON_SEPARATORS:
+                pos += 1
+            if pos < len(buffer):
+                try:
+                    record, pos = decoder.raw_decode(buffer, pos)
+                    yield record
+                    continue
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+            elif eof:
+                return
+
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+
+def _records_to_frame(records):
+    """Construit un lot brut en aplatissant `coordonnees_geo` en colonnes lat/lon typées."""
+    geo = [record.pop('coordonnees_geo', None) for record in records]
+    df = pd.DataFrame.from_records(records)
+    for axis in ('lat', 'lon'):
+        values = pd.Series([g.get(axis) if isinstance(g, dict) else None for g in geo], dtype=object)
+        df[axis] = pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64)
+    return df
+
+
+def iter_raw_batches(path, batch_size=STREAM_BATCH_SIZE):
+    """Découpe le flux de stations en DataFrames bruts d'au plus `batch_size` lignes."""
+    records = []
+    for record in iter_station_records(path):
+        records.append(record)
+        if len(records) >= batch_size:
+            yield _records_to_frame(records)
+            records = []
+    if records:
+        yield _records_to_frame(records)
+
+
+@traced()
+def load_clean_streaming(path=DATA_PATH, batch_size=STREAM_BATCH_SIZE, keep_keys=False):
+    """
+    Charge et nettoie un fichier JSON lot par lot : la mémoire de pointe est
+    bornée par la taille d'un lot brut plus le tableau nettoyé final.
+    Renvoie (df_clean, data_quality_report) comme `clean_data`.
+    """
+    from utils.prep import (
+        clean_data, count_missing_text, drop_sparse_columns, quality_report, sparse_text_columns,
+    )
+
+    n_initial = 0
+    missing = Counter()
+    batches = []
+    for df_batch in iter_raw_batches(path, batch_size):
+        n_initial += len(df_batch)
+        missing.update(count_missing_text(df_batch))
+        # La suppression des colonnes texte trop incomplètes se décide sur tout le fichier, après coup.
+        df_clean, _ = clean_data(df_batch, keep_keys=keep_keys, sparse_columns=())
+        if not df_clean.empty:
+            batches.append(df_clean)
+
+    if not batches:
+        if n_initial == 0:
+            return pd.DataFrame(), "Les données brutes sont vides."
+        return pd.DataFrame(), "Aucune donnée valide restante après nettoyage."
+    df_clean = pd.concat(batches, ignore_index=True)
+    df_clean = drop_sparse_columns(df_clean, sparse_text_columns(missing, n_initial))
+    return df_clean, quality_report(n_initial, len(df_clean))
+
+
+def _compact(cleaned):
+    """Compacte le résultat de `clean_data` et complète le rapport de qualité."""
+    from utils.prep import compact_station_table, memory_report
+
+    df_clean, data_quality_report = cleaned
+    if df_clean.empty:
+        return df_clean, data_quality_report
+    bytes_before = int(df_clean.memory_usage(deep=True).sum())
+    df_compact = compact_station_table(df_clean)
+    data_quality_report = f"{data_quality_report.rstrip()}\n    {memory_report(bytes_before, df_compact)}\n    "
+    return df_compact, data_quality_report
+
+
+def _attach_shared(fingerprint):
+    from utils.shared import SHARED_ENABLED, shared_store
+
+    return shared_store.attach(fingerprint) if SHARED_ENABLED else None
+
+
+def _publish_shared(fingerprint, cleaned):
+    """
+    Publie le tableau nettoyé pour les autres processus et renvoie la version
+    mappée en mémoire ; garde la copie privée si la publication est coupée ou
+    impossible (dossier en lecture seule...).
+    """
+    from utils.shared import SHARED_ENABLED, shared_store
+
+    df_clean, data_quality_report = cleaned
+    if not SHARED_ENABLED or df_clean.empty:
+        return cleaned
+    try:
+        return shared_store.publish(fingerprint, df_clean, data_quality_report) or cleaned
+    except OSError as e:
+        st.warning(f"Instantané partagé indisponible ({e}) : ce processus garde sa propre copie.")
+        return cleaned
+
+
+@traced()
+def load_snapshot(path=DATA_PATH, streaming=None):
+    """
+    Exécute (ou lit depuis le cache) tout le pipeline chargement → nettoyage →
+    structures dérivées pour l'instantané courant. Les objets renvoyés sont partagés
+    entre les sessions : ne pas les modifier en place.
+
+    Avec `streaming=True` (par défaut au-delà de STREAMING_MIN_BYTES), le JSON
+    est lu et nettoyé par lots et `df_raw` vaut None ; de même quand le tableau
+    nettoyé est lu depuis l'artefact Arrow (voir utils/artifact.py).
+    """
+    from utils.prep import clean_data
+
+    failed = Snapshot(pd.DataFrame(), pd.DataFrame(), "Les données brutes sont vides.", None, None, None, None, None, None)
+    try:
+        fingerprint = snapshot_cache.fingerprint(path)
+    except FileNotFoundError:
+        st.error(f"Erreur : Le fichier {path} est introuvable. Assurez-vous qu'il est bien dans le dossier 'data'.")
+        return failed
+    if streaming is None:
+        streaming = os.path.getsize(path) >= STREAMING_MIN_BYTES
+
+    # Artefact Arrow pré-nettoyé (python -m utils.artifact) ou génération déjà
+    # publiée par un autre processus (utils/shared.py) : lus par mappage mémoire
+    # au lieu de relire et nettoyer le JSON, s'ils correspondent à ce fichier.
+    from utils.artifact import read_artifact
+    prebuilt = snapshot_cache.get_or_build(
+        fingerprint, 'clean', lambda: read_artifact(fingerprint) or _attach_shared(fingerprint)
+    )
+    if prebuilt is not None:
+        df_clean, data_quality_report = prebuilt
+        return build_snapshot(fingerprint, None, df_clean, data_quality_report, stream=path)
+
+    if streaming:
+        df_raw = None
+        try:
+            df_clean, data_quality_report = snapshot_cache.get_or_build(
+                fingerprint, 'clean', lambda: _publish_shared(fingerprint, _compact(load_clean_streaming(path, keep_keys=True)))
+            )
+        except ValueError as ve:
+            st.error(f"Erreur lors de la lecture du JSON : {ve}. Assurez-vous que le fichier est correctement formaté.")
+            return failed
+    else:
+        df_raw = load_data(path)
+        if df_raw is None or df_raw.empty:
+            return failed
+        df_clean, data_quality_report = snapshot_cache.get_or_build(
+            fingerprint, 'clean', lambda: _publish_shared(fingerprint, _compact(clean_data(df_raw, keep_keys=True)))
+        )
+
+    return build_snapshot(fingerprint, df_raw, df_clean, data_quality_report, stream=path)
+
+
+@traced()
+def build_snapshot(fingerprint, df_raw, df_clean, data_quality_report, cube=None, stream=None):
+    """
+    Construit (ou lit depuis le cache) les structures dérivées d'un tableau
+    nettoyé : coordonnées des stations, index de filtrage, index spatial et cube
+    d'agrégats. `fingerprint` identifie la version du tableau (empreinte de
+    fichier, version live...). Un cube déjà maintenu (mode live) peut être fourni.
+
+    Avec `stream` (source dont les versions successives forment un flux), le
+    tableau passe une fois par version dans le détecteur de stations suspectes
+    (utils/anomalies.py) : `anomalies` porte leurs drapeaux, alignés sur les
+    lignes de `df_clean`.
+    """
+    from utils.geometry import StationGeometry
+    from utils.filters import StationFilterIndex
+    from utils.spatial import StationSpatialIndex
+    from utils.cube import AvailabilityCube
+
+    geometry = None
+    filter_index = None
+    spatial_index = None
+    anomalies = None
+    if not df_clean.empty:
+        geometry = snapshot_cache.get_or_build(fingerprint, 'geo', lambda: StationGeometry.from_frame(df_clean))
+        filter_index = snapshot_cache.get_or_build(fingerprint, 'filters', lambda: StationFilterIndex(df_clean))
+        if cube is None:
+            cube = snapshot_cache.get_or_build(fingerprint, 'cube', lambda: AvailabilityCube.from_frame(df_clean))
+        if geometry is not None and geometry.valid.all():
+            spatial_index = snapshot_cache.get_or_build(
+                fingerprint, 'spatial', lambda: StationSpatialIndex.from_frame(df_clean)
+            )
+        if stream is not None:
+            from utils.anomalies import observe_snapshot
+
+            anomalies = snapshot_cache.get_or_build(fingerprint, 'anomalies', lambda: observe_snapshot(stream, df_clean))
+    return Snapshot(df_raw, df_clean, data_quality_report, geometry, filter_index, spatial_index, cube, fingerprint, anomalies)
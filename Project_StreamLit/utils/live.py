@@ -0,0 +1,291 @@
+# utils/live.py
+import http.client
+import json
+import os
+import threading
+import time
+from collections import deque, namedtuple
+from urllib.parse import urlsplit
+
+import numpy as np
+import pandas as pd
+
+from utils.cube import AvailabilityCube
+from utils.io import DATA_PATH
+from utils.prep import clean_data, count_missing_text, sparse_text_columns
+
+
+LIVE_SOURCE = os.environ.get('VELIB_LIVE_SOURCE', DATA_PATH)
+LIVE_INTERVAL = float(os.environ.get('VELIB_LIVE_INTERVAL', 60))
+
+# Colonnes brutes comparées d'un instantané à l'autre (duedate change à chaque
+# remontée de la station même sans mouvement de vélos : elle est ignorée).
+DIFF_COLUMNS = [
+    'name', 'nom_arrondissement_communes', 'capacity', 'numdocksavailable', 'numbikesavailable',
+    'mechanical', 'ebike', 'is_renting', 'is_returning', 'lat', 'lon',
+]
+
+PollMetrics = namedtuple('PollMetrics', [
+    'timestamp', 'status', 'fetch_ms', 'apply_ms', 'total_ms', 'changed', 'added', 'removed', 'bytes',
+])
+
+
+class HttpFeedSource:
+    """
+    Source HTTP(S) interrogée avec une connexion persistante et des requêtes
+    conditionnelles (ETag / If-Modified-Since). `fetch` renvoie None si le
+    serveur répond 304.
+    """
+
+    def __init__(self, url, timeout=10):
+        self.url = url
+        parts = urlsplit(url)
+        self._conn_cls = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self._host = parts.netloc
+        self._path = parts.path or '/'
+        if parts.query:
+            self._path += '?' + parts.query
+        self.timeout = timeout
+        self._conn = None
+        self.etag = None
+        self.last_modified = None
+
+    def fetch(self):
+        headers = {'Accept-Encoding': 'identity', 'Connection': 'keep-alive'}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+
+        for attempt in range(2):
+            if self._conn is None:
+                self._conn = self._conn_cls(self._host, timeout=self.timeout)
+            try:
+                self._conn.request('GET', self._path, headers=headers)
+                response = self._conn.getresponse()
+                body = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError, OSError):
+                # Connexion fermée par le serveur entre deux interrogations : on en rouvre une.
+                self.close()
+                if attempt:
+                    raise
+
+        if response.status == 304:
+            return None
+        if response.status != 200:
+            raise http.client.HTTPException(f"{self.url} : HTTP {response.status}")
+        self.etag = response.getheader('ETag') or self.etag
+        self.last_modified = response.getheader('Last-Modified') or self.last_modified
+        return body
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class FileFeedSource:
+    """
+    Fichier JSON surveillé, ou dossier dont on lit le fichier .json le plus
+    récent. `fetch` renvoie None si rien n'a changé depuis le dernier appel.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._last = None
+
+    def _current_file(self):
+        if not os.path.isdir(self.path):
+            return self.path
+        candidates = [
+            os.path.join(self.path, name) for name in os.listdir(self.path) if name.endswith('.json')
+        ]
+        return max(candidates, key=os.path.getmtime) if candidates else None
+
+    def fetch(self):
+        path = self._current_file()
+        if path is None:
+            return None
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        if key == self._last:
+            return None
+        with open(path, 'rb') as f:
+            body = f.read()
+        self._last = key
+        return body
+
+    def close(self):
+        pass
+
+
+def make_source(source):
+    """Source HTTP si `source` est une URL, fichier/dossier surveillé sinon."""
+    if source.startswith(('http://', 'https://')):
+        return HttpFeedSource(source)
+    return FileFeedSource(source)
+
+
+def _raw_frame(body):
+    """
+    Instantané brut indexé par `stationcode`. Un corps vide ou illisible lève
+    ValueError : l'interrogation échoue et l'état précédent est conservé,
+    au lieu de marquer toutes les stations comme supprimées.
+    """
+    records = json.loads(body) if body.strip() else None
+    if not isinstance(records, list) or not records:
+        raise ValueError("instantané vide ou illisible")
+    df_raw = pd.DataFrame(records)
+    if 'stationcode' not in df_raw.columns:
+        raise ValueError("instantané sans colonne 'stationcode'")
+    df_raw['stationcode'] = df_raw['stationcode'].astype(str)
+    df_raw = df_raw.drop_duplicates('stationcode', keep='last').set_index('stationcode', drop=False)
+    if 'coordonnees_geo' in df_raw.columns:
+        df_raw['lat'] = pd.to_numeric(df_raw['coordonnees_geo'].str.get('lat'), errors='coerce')
+        df_raw['lon'] = pd.to_numeric(df_raw['coordonnees_geo'].str.get('lon'), errors='coerce')
+        df_raw = df_raw.drop(columns=['coordonnees_geo'])
+    return df_raw
+
+
+class LiveFeed:
+    """
+    Interroge une source en tâche de fond et maintient le tableau nettoyé par
+    différences : à chaque nouvel instantané, seules les stations dont une
+    valeur a changé (comparaison par `stationcode`) sont re-nettoyées, puis
+    remplacées dans le tableau et dans le cube d'agrégats.
+    """
+
+    def __init__(self, source=LIVE_SOURCE, interval=LIVE_INTERVAL, history=200):
+        self.source = make_source(source) if isinstance(source, str) else source
+        self.interval = interval
+        self.version = 0
+        self.table = pd.DataFrame()
+        self.cube = AvailabilityCube()
+        self.metrics = deque(maxlen=history)
+        self.last_error = None
+        self._raw = None
+        self._sparse = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='velib-live', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+        self.source.close()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+
+    def current(self):
+        """(version, tableau nettoyé, cube d'agrégats) — objets en lecture seule."""
+        with self._lock:
+            return self.version, self.table, self.cube
+
+    def poll(self):
+        """Une interrogation de la source ; renvoie les métriques de l'appel."""
+        start = time.perf_counter()
+        body = self.source.fetch()
+        fetched = time.perf_counter()
+
+        if body is None:
+            metrics = PollMetrics(time.time(), 'inchangé', (fetched - start) * 1e3, 0.0,
+                                  (fetched - start) * 1e3, 0, 0, 0, 0)
+        else:
+            changed, added, removed = self._apply(_raw_frame(body))
+            done = time.perf_counter()
+            metrics = PollMetrics(time.time(), 'mis à jour' if changed + added + removed else 'identique',
+                                  (fetched - start) * 1e3, (done - fetched) * 1e3, (done - start) * 1e3,
+                                  changed, added, removed, len(body))
+        self.metrics.append(metrics)
+        self.last_error = None
+        return metrics
+
+    def _apply(self, df_raw):
+        previous = self._raw
+        if previous is None:
+            previous = pd.DataFrame(columns=df_raw.columns, index=pd.Index([], name='stationcode'))
+
+        added = df_raw.index.difference(previous.index)
+        removed = previous.index.difference(df_raw.index)
+        common = df_raw.index.intersection(previous.index)
+        cols = [col for col in DIFF_COLUMNS if col in df_raw.columns and col in previous.columns]
+        old_values = previous.loc[common, cols]
+        new_values = df_raw.loc[common, cols]
+        differs = ~((old_values == new_values) | (old_values.isna() & new_values.isna())).all(axis=1)
+        changed = common[differs.to_numpy()]
+
+        # Suppression des colonnes texte trop incomplètes : décidée sur tout
+        # l'instantané ; si la décision change, tout le tableau est re-nettoyé.
+        sparse = sparse_text_columns(count_missing_text(df_raw), len(df_raw))
+        if sparse != self._sparse:
+            changed = common
+
+        if len(changed) == 0 and len(added) == 0 and len(removed) == 0:
+            self._raw = df_raw
+            return 0, 0, 0
+
+        with self._lock:
+            table = self.table
+        touched = changed.union(removed)
+        old_rows = table[table['stationcode'].isin(touched)] if not table.empty else table
+
+        updates = changed.union(added)
+        new_rows, _ = clean_data(df_raw.loc[updates].reset_index(drop=True), keep_keys=True, sparse_columns=sparse)
+
+        keep = table[~table['stationcode'].isin(touched)] if not table.empty else table
+        keep = keep.drop(columns=sparse, errors='ignore')
+        new_table = pd.concat([keep, new_rows], ignore_index=True) if not new_rows.empty else keep.reset_index(drop=True)
+
+        cube = self.cube.apply_delta(old_rows, new_rows)
+
+        with self._lock:
+            self.table = new_table
+            self.cube = cube
+            self.version += 1
+        self._raw = df_raw
+        self._sparse = sparse
+        return len(changed), len(added), len(removed)
+
+    def latency_summary(self):
+        """Latence des dernières interrogations (ms) : médiane, p95, max."""
+        totals = np.array([m.total_ms for m in self.metrics])
+        if len(totals) == 0:
+            return None
+        return {
+            'polls': len(totals),
+            'p50_ms': float(np.percentile(totals, 50)),
+            'p95_ms': float(np.percentile(totals, 95)),
+            'max_ms': float(totals.max()),
+        }
+
+
+_feeds = {}
+_feeds_lock = threading.Lock()
+
+
+def get_live_feed(source=LIVE_SOURCE, interval=LIVE_INTERVAL):
+    """Flux live partagé par toutes les sessions pour une source donnée (démarré à la demande)."""
+    with _feeds_lock:
+        feed = _feeds.get(source)
+        if feed is None:
+            feed = _feeds[source] = LiveFeed(source, interval)
+            try:
+                feed.poll()
+            except Exception as e:
+                feed.last_error = f"{type(e).__name__}: {e}"
+            feed.start()
+        return feed
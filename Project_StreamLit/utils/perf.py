@@ -0,0 +1,147 @@
+# utils/perf.py
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+import pandas as pd
+
+
+PROFILE_DEFAULT = os.environ.get('VELIB_PROFILE', '').lower() in ('1', 'true', 'oui')
+
+logger = logging.getLogger('velib.perf')
+
+_state = threading.local()
+_NOOP = nullcontext()
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def _rss_bytes():
+    """Mémoire résidente du processus (Linux), 0 si indisponible."""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class Span:
+    __slots__ = ('name', 'start', 'end', 'depth', 'rss_start', 'rss_end', 'thread', 'attrs')
+
+    @property
+    def duration_ms(self):
+        return (self.end - self.start) * 1e3
+
+    @property
+    def rss_delta_mb(self):
+        return (self.rss_end - self.rss_start) / 1024 ** 2
+
+
+class _SpanContext:
+    __slots__ = ('recorder', 'span')
+
+    def __init__(self, recorder, name, attrs):
+        self.recorder = recorder
+        self.span = Span()
+        self.span.name = name
+        self.span.attrs = attrs
+
+    def __enter__(self):
+        span = self.span
+        span.depth = self.recorder.depth
+        span.thread = threading.get_ident()
+        self.recorder.depth += 1
+        span.rss_start = _rss_bytes()
+        span.start = time.perf_counter()
+        return span
+
+    def __exit__(self, *exc):
+        span = self.span
+        span.end = time.perf_counter()
+        span.rss_end = _rss_bytes()
+        self.recorder.depth -= 1
+        self.recorder.spans.append(span)
+        return False
+
+
+class PerfRecorder:
+    """Spans d'une exécution du script (une par rerun et par session)."""
+
+    def __init__(self):
+        self.spans = []
+        self.depth = 0
+        self.origin = time.perf_counter()
+
+    def frame(self):
+        """Tableau des spans dans l'ordre de début : étape, durée, delta de mémoire résidente."""
+        spans = sorted(self.spans, key=lambda s: s.start)
+        return pd.DataFrame({
+            'Étape': ['  ' * s.depth + s.name for s in spans],
+            'Début (ms)': [round((s.start - self.origin) * 1e3, 1) for s in spans],
+            'Durée (ms)': [round(s.duration_ms, 2) for s in spans],
+            'Δ RSS (Mo)': [round(s.rss_delta_mb, 2) for s in spans],
+        })
+
+    def chrome_trace(self):
+        """Spans au format Chrome Trace Event (chrome://tracing, Perfetto)."""
+        pid = os.getpid()
+        events = [
+            {
+                'name': s.name, 'ph': 'X', 'pid': pid, 'tid': s.thread,
+                'ts': round((s.start - self.origin) * 1e6, 1), 'dur': round((s.end - s.start) * 1e6, 1),
+                'args': {'rss_delta_mb': round(s.rss_delta_mb, 3), **s.attrs},
+            }
+            for s in sorted(self.spans, key=lambda s: s.start)
+        ]
+        return json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'})
+
+    def log(self):
+        """Une ligne JSON par span sur le logger `velib.perf`."""
+        for s in sorted(self.spans, key=lambda s: s.start):
+            logger.info(json.dumps({
+                'span': s.name, 'depth': s.depth, 'duration_ms': round(s.duration_ms, 3),
+                'rss_delta_mb': round(s.rss_delta_mb, 3), **s.attrs,
+            }, ensure_ascii=False, default=str))
+
+
+def start_run(enabled):
+    """
+    Démarre l'enregistrement des spans pour l'exécution en cours du thread
+    (ou le coupe si `enabled` est faux). Renvoie le PerfRecorder ou None.
+    """
+    _state.recorder = PerfRecorder() if enabled else None
+    return _state.recorder
+
+
+def current_recorder():
+    return getattr(_state, 'recorder', None)
+
+
+def span(name, **attrs):
+    """
+    Chronomètre un bloc : `with span('clean_data'):`. Sans enregistrement en
+    cours dans ce thread, renvoie un contexte vide partagé (aucune mesure).
+    """
+    recorder = getattr(_state, 'recorder', None)
+    if recorder is None:
+        return _NOOP
+    return _SpanContext(recorder, name, attrs)
+
+
+def traced(name=None):
+    """Décorateur : chaque appel de la fonction devient un span (rien n'est mesuré si l'enregistrement est coupé)."""
+    def decorator(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            recorder = getattr(_state, 'recorder', None)
+            if recorder is None:
+                return func(*args, **kwargs)
+            with _SpanContext(recorder, label, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,34 +1,54 @@
 # utils/prep.py (Version Simplifiée)
+import numpy as np
 import pandas as pd
-import geopandas as gpd
 import streamlit as st 
 
-def clean_data(df_raw):
+from utils.geometry import StationGeometry, import_geopandas
+from utils.perf import traced
+
+COUNT_COLUMNS = ['CapaciteTotal', 'BornesLibres', 'VelosDispoTotal', 'VelosMecaniques', 'VelosElectriques']
+# Colonnes texte supprimées si plus de la moitié des valeurs manquent (nom brut -> nom nettoyé).
+TEXT_COLUMNS = {'nom_arrondissement_communes': 'Commune', 'name': 'NomStation'}
+
+
+def count_missing_text(df_raw):
+    """Nombre de valeurs manquantes par colonne texte d'un lot brut (colonne absente = tout manque)."""
+    return {
+        col: int(df_raw[raw].isnull().sum()) if raw in df_raw.columns else len(df_raw)
+        for raw, col in TEXT_COLUMNS.items()
+    }
+
+
+def sparse_text_columns(missing, n_rows):
+    """Colonnes texte à supprimer : plus de 50% de manquants sur `n_rows` lignes brutes."""
+    if n_rows == 0:
+        return []
+    return [col for col, n_missing in missing.items() if n_missing / n_rows * 100 > 50]
+
+
+def drop_sparse_columns(df, sparse_columns):
+    """Supprime les colonnes texte retenues par `sparse_text_columns`."""
+    for col in TEXT_COLUMNS.values():
+        if col in sparse_columns and col in df.columns:
+            df = df.drop(columns=[col])
+            st.warning(f"Colonne '{col}' supprimée car >50% de valeurs manquantes.")
+    return df
+
+
+@traced()
+def clean_data(df_raw, keep_keys=False, sparse_columns=None):
     """
     Nettoie les données brutes Vélib' de manière simplifiée: 
     extraction coordonnées, remplacements basiques, suppression si trop de manquants.
+    Avec `keep_keys=True`, conserve aussi `stationcode` et `duedate` (UTC),
+    nécessaires à l'historique.
+    Quand `df_raw` n'est qu'une partie des données (lot, stations modifiées),
+    l'appelant passe `sparse_columns`, décidé sur l'ensemble ; sinon la
+    décision est prise sur `df_raw`.
     """
     if df_raw.empty:
         return pd.DataFrame(), "Les données brutes sont vides."
 
-    df = df_raw.copy()
-    
-
-    try:
-        if 'coordonnees_geo' in df.columns and df['coordonnees_geo'].apply(lambda x: isinstance(x, dict)).any():
-            coords = pd.json_normalize(df['coordonnees_geo'])
-            df['lat'] = coords.get('lat', pd.NA)
-            df['lon'] = coords.get('lon', pd.NA)
-        else: 
-            df['lat'] = pd.NA
-            df['lon'] = pd.NA
-            
-    except Exception as e:
-        st.warning(f"Impossible d'extraire les coordonnées géo : {e}")
-        df['lat'] = pd.NA
-        df['lon'] = pd.NA
-
-    
     rename_map = {
         'name': 'NomStation',
         'nom_arrondissement_communes': 'Commune',
@@ -40,35 +60,47 @@ def clean_data(df_raw):
         'is_renting': 'LocationPossible',
         'is_returning': 'RetourPossible'
     }
-    df = df.rename(columns=rename_map)
-    
-    
-    cols_to_keep = list(rename_map.values()) + ['lat', 'lon']
-    
-    
-    for col in df.columns:
-        if col not in cols_to_keep:
-           
-            if col in df.columns:
-                 df = df.drop(columns=[col])
 
+    # On ne copie que les colonnes utiles, dans l'ordre d'origine.
+    key_cols = ['stationcode', 'duedate'] if keep_keys else []
+    keep_raw = [col for col in df_raw.columns if col in rename_map or col in key_cols]
+    df = df_raw[keep_raw].copy()
 
-   
+    try:
+        coords = df_raw['coordonnees_geo'] if 'coordonnees_geo' in df_raw.columns else None
+        if coords is not None and coords.dtype == object:
+            df['lat'] = coords.str.get('lat')
+            df['lon'] = coords.str.get('lon')
+        elif 'lat' in df_raw.columns and 'lon' in df_raw.columns:
+            # Coordonnées déjà aplaties (ingestion en flux).
+            df['lat'] = df_raw['lat']
+            df['lon'] = df_raw['lon']
+        else: 
+            df['lat'] = pd.NA
+            df['lon'] = pd.NA
+            
+    except Exception as e:
+        st.warning(f"Impossible d'extraire les coordonnées géo : {e}")
+        df['lat'] = pd.NA
+        df['lon'] = pd.NA
+
+    df = df.rename(columns=rename_map)
+
+    if 'stationcode' in df.columns:
+        df['stationcode'] = df['stationcode'].astype(str)
+    if 'duedate' in df.columns:
+        df['duedate'] = pd.to_datetime(df['duedate'], utc=True, errors='coerce')
 
     
+    if sparse_columns is None:
+        sparse_columns = sparse_text_columns(count_missing_text(df_raw), len(df_raw))
+    df = drop_sparse_columns(df, sparse_columns)
     for col in ['Commune', 'NomStation']:
         if col in df.columns:
-            missing_pct = df[col].isnull().mean() * 100
-            if missing_pct > 50: 
-                df = df.drop(columns=[col])
-                st.warning(f"Colonne '{col}' supprimée car >50% de valeurs manquantes.")
-            else:
-                 
-                 df[col] = df[col].fillna('Inconnue').astype(str)
+            df[col] = df[col].fillna('Inconnue').astype(str)
 
    
-    numeric_cols = ['CapaciteTotal', 'BornesLibres', 'VelosDispoTotal', 'VelosMecaniques', 'VelosElectriques']
-    for col in numeric_cols:
+    for col in COUNT_COLUMNS:
         if col in df.columns:
             
             df[col] = pd.to_numeric(df[col], errors='coerce')
@@ -87,65 +119,112 @@ def clean_data(df_raw):
     for col in bool_cols:
         if col in df.columns:
            
-            df[col] = df[col].astype(str).apply(lambda x: True if x == 'OUI' else False)
+            df[col] = df[col].astype(str) == 'OUI'
 
     if 'LocationPossible' in df.columns and 'RetourPossible' in df.columns:
-        df = df[(df['LocationPossible'] == True) | (df['RetourPossible'] == True)]
+        df = df[df['LocationPossible'] | df['RetourPossible']]
     elif 'LocationPossible' in df.columns:
-         df = df[df['LocationPossible'] == True]
+         df = df[df['LocationPossible']]
     elif 'RetourPossible' in df.columns:
-         df = df[df['RetourPossible'] == True]
+         df = df[df['RetourPossible']]
          
     
     if 'CapaciteTotal' in df.columns and 'VelosDispoTotal' in df.columns:
        
-        df['TauxDispo'] = df.apply(lambda row: (row['VelosDispoTotal'] / row['CapaciteTotal'] * 100) if row['CapaciteTotal'] > 0 else 0, axis=1)
+        capacite = df['CapaciteTotal'].to_numpy()
+        velos = df['VelosDispoTotal'].to_numpy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            df['TauxDispo'] = np.where(capacite > 0, velos / capacite * 100, 0.0)
     else:
         df['TauxDispo'] = 0 
 
     
-    data_quality_report = f"""
-    - **Stations initiales**: {len(df_raw)}.
-    - **Stations après nettoyage/filtrage**: {len(df)}.
-    - *Nettoyage simplifié appliqué (remplacement par 0 ou 'Inconnue', suppression lignes sans coordonnées valides).*
-    """
+    data_quality_report = quality_report(len(df_raw), len(df))
     if df.empty:
         return pd.DataFrame(), "Aucune donnée valide restante après nettoyage."
 
     return df, data_quality_report
 
 
+def quality_report(n_initial, n_clean):
+    """Texte du rapport de qualité des données affiché dans l'application."""
+    return f"""
+    - **Stations initiales**: {n_initial}.
+    - **Stations après nettoyage/filtrage**: {n_clean}.
+    - *Nettoyage simplifié appliqué (remplacement par 0 ou 'Inconnue', suppression lignes sans coordonnées valides).*
+    """
+
+
+def _narrow_int_dtype(values):
+    """Plus petit type entier capable de représenter `values`."""
+    if len(values) == 0:
+        return np.uint8
+    lo, hi = int(values.min()), int(values.max())
+    for dtype in (np.uint8, np.uint16, np.uint32) if lo >= 0 else (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return dtype
+    return np.int64
+
+
+@traced()
+def compact_station_table(df_clean):
+    """
+    Représentation compacte du tableau nettoyé : communes, noms de stations,
+    réseaux et identifiants de station en catégories (dictionnaire), compteurs
+    en entiers non signés étroits, coordonnées et TauxDispo en float32, index
+    positionnel. Les identifiants sont uniques, mais une catégorie reste lisible
+    sans copie depuis un fichier Arrow mappé (voir `utils.artifact.map_table`).
+    """
+    df = df_clean.reset_index(drop=True)
+    for col in ['Commune', 'NomStation', 'Reseau', 'stationcode']:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    for col in COUNT_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype(_narrow_int_dtype(df[col].to_numpy()))
+    for col in ['lat', 'lon', 'TauxDispo']:
+        if col in df.columns:
+            df[col] = df[col].astype(np.float32)
+    return df
+
+
+def memory_report(bytes_before, df_compact):
+    """Ligne du rapport de qualité décrivant l'empreinte mémoire du tableau."""
+    bytes_after = int(df_compact.memory_usage(deep=True).sum())
+    ratio = bytes_before / bytes_after if bytes_after else 0
+    return (
+        f"- **Mémoire du tableau des stations**: {bytes_after / 1024 ** 2:.2f} Mo "
+        f"(contre {bytes_before / 1024 ** 2:.2f} Mo avant compactage, ×{ratio:.1f})."
+    )
+
+
+@traced()
 def make_geodataframe(df_clean):
-    """Crée un GeoDataFrame pour la cartographie (inchangé)."""
+    """
+    Crée un GeoDataFrame (copie, `df_clean` n'est pas modifié). Réservé aux
+    opérations spatiales : la carte de l'application n'en a pas besoin.
+    """
     if df_clean.empty or 'lon' not in df_clean.columns or 'lat' not in df_clean.columns:
         st.warning("Données géographiques (lat/lon) manquantes ou invalides pour créer GeoDataFrame.")
         return None
-        
-   
-    df_clean['lat'] = pd.to_numeric(df_clean['lat'], errors='coerce')
-    df_clean['lon'] = pd.to_numeric(df_clean['lon'], errors='coerce')
-    
-    if df_clean[['lat', 'lon']].isnull().any().any():
-        rows_to_drop = df_clean[['lat', 'lon']].isnull().any(axis=1).sum()
-        if rows_to_drop > 0:
-            st.warning(f"Suppression de {rows_to_drop} stations avec coordonnées invalides pour la carte.")
-            df_geo = df_clean.dropna(subset=['lat', 'lon']).copy() 
-        else:
-             df_geo = df_clean.copy()
-    else:
-        df_geo = df_clean.copy()
-        
-    if df_geo.empty:
+
+    geometry = StationGeometry.from_frame(df_clean)
+    rows_to_drop = int((~geometry.valid).sum())
+    if rows_to_drop > 0:
+        st.warning(f"Suppression de {rows_to_drop} stations avec coordonnées invalides pour la carte.")
+    if rows_to_drop == len(geometry):
          st.warning("Aucune station avec coordonnées valides à afficher sur la carte.")
          return None
 
+    df_geo = df_clean[geometry.valid] if rows_to_drop else df_clean
     try:
-        gdf = gpd.GeoDataFrame(
-            df_geo, 
-            geometry=gpd.points_from_xy(df_geo.lon, df_geo.lat),
-            crs="EPSG:4326" 
+        gpd = import_geopandas()
+        return gpd.GeoDataFrame(
+            df_geo.assign(lat=geometry.lat[geometry.valid], lon=geometry.lon[geometry.valid]),
+            geometry=geometry.geoseries().values,
+            crs="EPSG:4326"
         )
-        return gdf
     except Exception as e:
         st.error(f"Erreur lors de la création du GeoDataFrame : {e}")
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,287 @@
+# utils/sections.py
+import os
+
+import streamlit as st
+
+from utils.anomalies import FROZEN_HOURS, anomaly_labels, anomaly_summary
+from utils.cache import section_cache, snapshot_cache
+from utils.io import HISTORY_PATH
+from utils.live import LIVE_SOURCE
+from utils.perf import span
+from utils.shared import shared_store
+from utils.spatial import nearest_stations
+
+
+KIND_LABELS = {'vide': 'Vide', 'pleine': 'Pleine'}
+
+
+# Sections de la page exécutées comme des fragments Streamlit : un widget placé
+# dans une section ne relance que cette section, pas toute la page. Les
+# encadrés repliés ne calculent leur contenu qu'une fois ouverts.
+
+
+def _lazy_expander(label, key):
+    """
+    Encadré dont le contenu n'est calculé qu'une fois ouvert (None si fermé :
+    rien à calculer). L'état ouvert/fermé est un interrupteur gardé dans
+    st.session_state : avant les versions récentes de Streamlit, un
+    st.expander ne dit pas s'il est ouvert.
+    """
+    if not st.toggle(label, key=key):
+        return None
+    return st.container(border=True)
+
+
+def _with_alerts(df, anomalies):
+    """Ajoute la colonne Alerte (stations suspectes) ; `anomalies` est aligné sur l'index positionnel du tableau complet."""
+    if anomalies is None:
+        return df
+    return df.assign(Alerte=anomaly_labels(anomalies[df.index.to_numpy()]))
+
+
+@st.fragment
+def zoom_commune_table(df_filtered, commune_select, anomalies=None):
+    """Tableau des stations de la commune choisie, calculé à l'ouverture de l'encadré."""
+    expander = _lazy_expander(f"📋 Les {len(df_filtered)} stations de {commune_select}", key='expander_zoom_commune')
+    if expander is None:
+        return
+    with expander, span('tableau commune'):
+        df_commune = _with_alerts(df_filtered, anomalies).sort_values(by='TauxDispo', ascending=False)
+        display_cols_map = {
+            'NomStation':'Station',
+            'VelosDispoTotal':'Vélos ',
+            'BornesLibres':'Places ',
+            'TauxDispo':'Dispo (%)',
+            'Alerte': 'Alerte',
+        }
+        df_display = df_commune[[col for col in display_cols_map if col in df_commune.columns]].rename(columns=display_cols_map)
+
+        if 'Station' in df_display.columns:
+            df_display = df_display.set_index('Station')
+
+        column_config = {}
+        if 'Dispo (%)' in df_display.columns:
+            column_config["Dispo (%)"] = st.column_config.ProgressColumn(
+                    "Dispo (%)", format="%.1f%%", min_value=0, max_value=100,
+                )
+
+        st.dataframe(df_display, column_config=column_config if column_config else None, height=300)
+        st.info(" Triez par Vélos ou Places en cliquant sur l'en-tête. La barre 'Dispo (%)' donne une vue rapide.")
+
+
+@st.fragment
+def secours_section(df_clean, spatial_index, anomalies=None):
+    """Stations de secours les plus proches d'un point ; ses réglages ne relancent que cette section."""
+    st.subheader("🆘 Les stations de secours les plus proches")
+    c1, c2, c3, c4, c5 = st.columns([2, 2, 2, 1, 2])
+    with c1:
+        secours_lat = st.number_input("Latitude de départ", value=48.8584, format="%.5f", step=0.001)
+    with c2:
+        secours_lon = st.number_input("Longitude de départ", value=2.3470, format="%.5f", step=0.001)
+    with c3:
+        secours_besoin = st.radio("Je cherche...", ['un vélo', 'une place'], horizontal=True)
+    with c4:
+        secours_min = st.number_input("Au moins", min_value=1, value=1, step=1, help="Nombre minimum de vélos (ou de places libres).")
+    with c5:
+        secours_k = st.slider("Nombre de stations proposées", min_value=1, max_value=10, value=3)
+
+    with span('stations de secours'):
+        df_secours = _with_alerts(nearest_stations(
+            df_clean, spatial_index, secours_lat, secours_lon, k=secours_k,
+            min_velos=secours_min if secours_besoin == 'un vélo' else 0,
+            min_bornes=secours_min if secours_besoin == 'une place' else 0,
+        ), anomalies)
+    if df_secours.empty:
+        st.warning("Aucune station ne répond à ce besoin pour le moment.")
+    else:
+        secours_cols = {'NomStation': 'Station', 'Commune': 'Commune', 'VelosDispoTotal': 'Vélos ', 'BornesLibres': 'Places ', 'Distance (m)': 'Distance (m)', 'Alerte': 'Alerte'}
+        st.dataframe(
+            df_secours[[col for col in secours_cols if col in df_secours.columns]].rename(columns=secours_cols),
+            hide_index=True,
+        )
+        st.caption(f"Les {len(df_secours)} stations les plus proches du point ({secours_lat:.4f}, {secours_lon:.4f}) avec au moins {secours_min} {secours_besoin.split()[-1]}(s).")
+    st.divider()
+
+
+def _has_history():
+    """Vrai si un historique d'instantanés a été constitué (sans charger pyarrow.dataset)."""
+    return os.path.isdir(HISTORY_PATH) and bool(os.listdir(HISTORY_PATH))
+
+
+@st.fragment
+def forecast_section():
+    """Probabilités de disponibilité d'une station (affiché seulement si un historique existe)."""
+    if not _has_history():
+        return
+    # Import différé (pyarrow.dataset, modèle) : rendu en bas de page, après le reste.
+    from utils.forecast import load_forecasts
+
+    forecasts = load_forecasts()
+    if forecasts is None or not len(forecasts.stationcodes):
+        return
+    st.subheader("🔮 Et dans 10 minutes ?")
+    st.markdown("Probabilité qu'une station ait **au moins N vélos** dans 10, 30 et 60 minutes, d'après les semaines précédentes.")
+    forecast_labels = dict(sorted(
+        (f"{name} ({code})", code) for code, name in zip(forecasts.stationcodes, forecasts.names)
+    ))
+    fc1, fc2 = st.columns([3, 1])
+    with fc1:
+        forecast_label = st.selectbox("Station", list(forecast_labels))
+    with fc2:
+        forecast_min = st.number_input("Au moins N vélos", min_value=1, value=1, step=1)
+    df_forecast = forecasts.station_frame(forecast_labels[forecast_label], forecast_min)
+    df_forecast['Probabilité'] = df_forecast['Probabilité'] * 100
+    st.dataframe(
+        df_forecast,
+        column_config={"Probabilité": st.column_config.ProgressColumn(
+            "Probabilité", format="%.0f%%", min_value=0, max_value=100,
+        )},
+        hide_index=True,
+    )
+    st.caption(f"Prévision émise à partir de l'historique arrêté à {forecasts.issued_at.tz_convert('Europe/Paris').strftime('%d/%m %H:%M')}.")
+    st.divider()
+
+
+@st.fragment
+def episodes_section():
+    """Habitudes des stations vides ou pleines sur l'historique (affiché seulement si un historique existe)."""
+    if not _has_history():
+        return
+    from utils.episodes import load_episodes
+    from utils.viz import heatmap_hour_of_week
+
+    episodes = load_episodes()
+    if episodes is None or not len(episodes.stationcodes):
+        return
+    st.subheader("⏳ Vide le matin, pleine le soir ?")
+    st.markdown(
+        f"Sur les épisodes relevés du {episodes.start.tz_convert('Europe/Paris'):%d/%m} au "
+        f"{episodes.end.tz_convert('Europe/Paris'):%d/%m}, les créneaux de la semaine où les stations sont **vides** "
+        "(aucun vélo) ou **pleines** (aucune place pour rendre son vélo)."
+    )
+    ec1, ec2 = st.columns([1, 3])
+    with ec1:
+        kind = st.radio("Situation", list(KIND_LABELS), format_func=KIND_LABELS.get, horizontal=True)
+    with ec2:
+        station_labels = {"Tout le réseau": None}
+        station_labels.update(sorted(
+            (f"{name} ({code})", code) for code, name in zip(episodes.stationcodes, episodes.names)
+        ))
+        station_label = st.selectbox("Carte de chaleur pour", list(station_labels))
+
+    with span('épisodes'):
+        df_heat = episodes.heatmap_frame(kind, station_labels[station_label])
+        heat_chart = heatmap_hour_of_week(df_heat, f"Part du temps {KIND_LABELS[kind].lower()} — {station_label}")
+        df_ranking = episodes.ranking(kind)
+    st.altair_chart(heat_chart, use_container_width=True)
+
+    st.markdown(f"**Stations chroniquement {KIND_LABELS[kind].lower()}s** (créneau le plus touché de chaque station)")
+    if df_ranking.empty:
+        st.info(
+            f"Aucune station {KIND_LABELS[kind].lower()} sur un créneau suffisamment observé : "
+            "le classement se remplit à mesure que l'historique s'allonge."
+        )
+    else:
+        st.dataframe(
+            df_ranking,
+            column_config={
+                "Part du créneau (%)": st.column_config.ProgressColumn(
+                    "Part du créneau (%)", format="%.0f%%", min_value=0, max_value=100,
+                ),
+                "Part du temps (%)": st.column_config.NumberColumn("Part du temps (%)", format="%.0f%%"),
+                "Durée p95 (min)": st.column_config.NumberColumn("Durée p95 (min)", format="%.0f"),
+            },
+            hide_index=True,
+        )
+        st.caption(
+            "Part du créneau : temps passé dans cette situation sur ce créneau, toutes semaines confondues ; "
+            "part du temps : sur toute la période. "
+            "Durée p95 : 95 % des épisodes de la station durent moins longtemps."
+        )
+    st.divider()
+
+
+@st.fragment
+def quality_section(data_quality_report, live_feed=None, multi_feed=None, anomalies=None):
+    """Encadré qualité des données, stations suspectes, cache, mode live, réseaux suivis et limites (calculé à l'ouverture)."""
+    expander = _lazy_expander(" Qualité des Données & Limites de l'Analyse", key='expander_qualite')
+    if expander is None:
+        return
+    with expander:
+        st.markdown("### Qualité des Données")
+        st.info(data_quality_report)
+        if anomalies is not None:
+            summary = anomaly_summary(anomalies)
+            total = summary.pop('total')
+            st.caption(
+                f"Stations suspectes : {total} sur {len(anomalies)} ("
+                + ", ".join(f"{label} : {n}" for label, n in summary.items())
+                + f"). Compteurs figés : inchangés depuis au moins {FROZEN_HOURS:.0f} h d'un instantané à l'autre."
+            )
+
+        cache_stats = snapshot_cache.stats()
+        st.caption(
+            f"Cache de l'instantané : {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+            f"({cache_stats['hit_rate']:.0%}), {cache_stats['entries']} entrées, "
+            f"{cache_stats['bytes'] / 1024 ** 2:.1f} Mo, {cache_stats['evictions']} évictions, "
+            f"{cache_stats['invalidations']} invalidations."
+        )
+        section_stats = section_cache.stats()
+        st.caption(
+            f"Cache des sections (carte, graphiques) : {section_stats['hits']} hits / {section_stats['misses']} misses "
+            f"({section_stats['hit_rate']:.0%}), {section_stats['entries']} entrées."
+        )
+        shared_stats = shared_store.stats()
+        if shared_stats['current']:
+            st.caption(
+                f"Instantané partagé entre processus : génération {shared_stats['current'][:12]}, "
+                f"{shared_stats['generations']} génération(s) sur le disque ({shared_stats['bytes'] / 1024 ** 2:.1f} Mo), "
+                f"{sum(shared_stats['attached'].values())} attachement(s) actif(s) dans ce processus."
+            )
+
+        if live_feed is not None:
+            st.markdown("### Mode live")
+            latency = live_feed.latency_summary()
+            if latency:
+                last_poll = live_feed.metrics[-1]
+                st.caption(
+                    f"{latency['polls']} interrogations de {LIVE_SOURCE} — latence médiane {latency['p50_ms']:.0f} ms, "
+                    f"p95 {latency['p95_ms']:.0f} ms, max {latency['max_ms']:.0f} ms. Dernière : {last_poll.status} "
+                    f"({last_poll.changed} modifiées, {last_poll.added} ajoutées, {last_poll.removed} retirées)."
+                )
+            if live_feed.last_error:
+                st.warning(f"Dernière erreur du flux live : {live_feed.last_error}")
+
+        if multi_feed is not None:
+            st.markdown("### Réseaux suivis")
+            st.caption(
+                f"{len(multi_feed.sources)} réseaux interrogés en parallèle toutes les {multi_feed.interval:.0f} s ; "
+                f"dernier rafraîchissement en {multi_feed.refresh_ms or 0:.0f} ms (la durée suit le réseau le plus lent)."
+            )
+            st.dataframe(multi_feed.status_frame(), hide_index=True)
+
+        st.markdown("### Limites")
+        st.warning("""
+        - **Instantanéité Volatile**: Les données Vélib' changent à chaque seconde ! Ce dashboard est une photo, pas un film. Activez le mode live (barre latérale) pour suivre les mises à jour.
+        - **Boule de Cristal Limitée**: Sans historique, on ne prédit pas si la station sera vide dans 10 minutes ; avec historique, la prévision reste statistique (ni météo, ni événements).
+        - **Fiabilité des Capteurs**: L'analyse dépend de la précision des infos remontées par chaque station. Parfois, un vélo peut être marqué disponible alors qu'il est défectueux. Les stations aux compteurs figés ou incohérents sont signalées 🚩 (et peuvent être exclues des indicateurs), mais un vélo défectueux isolé reste invisible.
+        """)
+
+
+@st.fragment
+def performance_section(recorder):
+    """Spans du dernier rendu complet (calculé à l'ouverture de l'encadré)."""
+    expander = _lazy_expander("⏱️ Performance", key='expander_performance')
+    if expander is None:
+        return
+    with expander:
+        st.caption(
+            "Durée et variation de la mémoire résidente de chaque étape du dernier rendu complet. "
+            "Les étapes servies par le cache n'apparaissent pas (ou presque pas) : seules les constructions sont mesurées."
+        )
+        st.dataframe(recorder.frame(), hide_index=True)
+        st.download_button(
+            "Exporter (Chrome trace JSON)", recorder.chrome_trace(),
+            file_name="velib-trace.json", mime="application/json",
+            help="À ouvrir dans chrome://tracing ou ui.perfetto.dev.",
+        )
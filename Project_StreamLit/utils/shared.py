@@ -0,0 +1,172 @@
+# utils/shared.py
+import argparse
+import os
+import threading
+import weakref
+
+from utils.artifact import TABLE_VERSION, artifact_metadata, map_table, write_table
+from utils.perf import traced
+
+
+SHARED_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'shared')
+# VELIB_SHARED=0 : chaque processus garde sa propre copie du tableau nettoyé.
+SHARED_ENABLED = os.environ.get('VELIB_SHARED', '1').lower() not in ('0', 'false', 'non')
+
+_CURRENT = 'CURRENT'
+_SUFFIX = '.arrow'
+
+
+class SharedSnapshotStore:
+    """
+    Tableaux nettoyés publiés une seule fois pour toutes les sessions et tous
+    les processus de l'application, sous forme de fichiers Arrow IPC mappés en
+    mémoire en lecture seule (voir `utils.artifact.map_table`) :
+
+        <root>/<empreinte>.arrow   une génération par instantané
+        <root>/CURRENT             empreinte de la dernière génération publiée
+
+    Le premier processus qui nettoie un instantané publie sa génération ; les
+    autres s'y attachent au lieu de relire le JSON. Fichiers de génération et
+    pointeur CURRENT apparaissent par renommage atomique. Les anciennes
+    générations sont supprimées du disque à la publication d'une nouvelle,
+    sauf la génération courante (relue dans CURRENT, qu'un autre processus a
+    pu avancer entre-temps) et celles encore attachées dans ce processus. Un
+    autre processus qui mappe une génération supprimée garde ses pages jusqu'à
+    ce qu'il la lâche (le système ne libère la mémoire qu'au dernier mappage
+    fermé).
+
+    Dans un processus, chaque génération attachée est comptée jusqu'à ce que
+    son tableau soit libéré (plus aucune session ni entrée de cache ne le
+    référence) ; `collect` ne supprime pas une génération comptée.
+    """
+
+    def __init__(self, root=SHARED_PATH, keep=2):
+        self.root = os.path.abspath(root)
+        # Générations conservées sur le disque : la courante et la précédente,
+        # pour un processus qui s'y attacherait au moment même de la bascule.
+        self.keep = keep
+        self._attached = {}
+        self._lock = threading.Lock()
+
+    def generation_path(self, fingerprint):
+        return os.path.join(self.root, f'{fingerprint}{_SUFFIX}')
+
+    def current(self):
+        """Empreinte de la dernière génération publiée (None si aucune)."""
+        try:
+            with open(os.path.join(self.root, _CURRENT), encoding='utf-8') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    @traced('SharedSnapshotStore.attach')
+    def attach(self, fingerprint):
+        """(tableau nettoyé, rapport de qualité) de la génération `fingerprint`, None si elle n'est pas publiée."""
+        try:
+            df, meta = map_table(self.generation_path(fingerprint))
+        except FileNotFoundError:
+            return None
+        if meta.get('version') != TABLE_VERSION:
+            # Génération publiée par une version antérieure de l'application.
+            return None
+        with self._lock:
+            self._attached[fingerprint] = self._attached.get(fingerprint, 0) + 1
+        weakref.finalize(df, self._release, fingerprint)
+        return df, meta['report']
+
+    @traced('SharedSnapshotStore.publish')
+    def publish(self, fingerprint, df_clean, data_quality_report):
+        """
+        Publie `df_clean` comme génération `fingerprint`, en fait la génération
+        courante puis supprime les plus anciennes. Renvoie la génération mappée
+        (à utiliser à la place de `df_clean`, qui peut alors être libéré).
+        """
+        os.makedirs(self.root, exist_ok=True)
+        path = self.generation_path(fingerprint)
+        if (artifact_metadata(path) or {}).get('version') != TABLE_VERSION:
+            # Absente, ou publiée par une version antérieure : (ré)écrite par renommage atomique.
+            write_table(df_clean, path, {'report': data_quality_report})
+        tmp_path = os.path.join(self.root, f'{_CURRENT}.{os.getpid()}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(fingerprint)
+        os.replace(tmp_path, os.path.join(self.root, _CURRENT))
+        self.collect(protect=fingerprint)
+        return self.attach(fingerprint)
+
+    def collect(self, protect=None):
+        """
+        Supprime les générations au-delà des `keep` plus récentes, sauf la
+        génération courante, `protect` et celles attachées dans ce processus.
+        Renvoie le nombre supprimé.
+        """
+        with self._lock:
+            in_use = set(self._attached)
+        in_use.update(fingerprint for fingerprint in (self.current(), protect) if fingerprint)
+        generations = sorted(
+            (entry for entry in os.scandir(self.root) if entry.name.endswith(_SUFFIX)),
+            key=lambda entry: entry.stat().st_mtime_ns, reverse=True,
+        )
+        removed = 0
+        for entry in generations[self.keep:]:
+            if entry.name[:-len(_SUFFIX)] in in_use:
+                continue
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except OSError:
+                # Fichier encore ouvert sous Windows, ou déjà supprimé par un autre processus.
+                pass
+        return removed
+
+    def stats(self):
+        """Générations publiées sur le disque et générations attachées dans ce processus."""
+        try:
+            on_disk = [entry for entry in os.scandir(self.root) if entry.name.endswith(_SUFFIX)]
+        except FileNotFoundError:
+            on_disk = []
+        with self._lock:
+            attached = dict(self._attached)
+        return {
+            'current': self.current(),
+            'generations': len(on_disk),
+            'bytes': sum(entry.stat().st_size for entry in on_disk),
+            'attached': attached,
+        }
+
+    def _release(self, fingerprint):
+        with self._lock:
+            count = self._attached.get(fingerprint, 0) - 1
+            if count > 0:
+                self._attached[fingerprint] = count
+            else:
+                self._attached.pop(fingerprint, None)
+
+
+shared_store = SharedSnapshotStore()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Publie l'instantané JSON dans le dossier partagé (ou affiche l'état des générations).",
+    )
+    parser.add_argument('path', nargs='?', default=None, help="Instantané JSON à publier.")
+    parser.add_argument('--root', default=SHARED_PATH, help="Dossier des générations partagées.")
+    args = parser.parse_args()
+
+    store = SharedSnapshotStore(args.root)
+    if args.path:
+        from utils.cache import file_fingerprint
+        from utils.io import _compact, _read_raw
+        from utils.prep import clean_data
+
+        df_clean, data_quality_report = _compact(clean_data(_read_raw(args.path), keep_keys=True))
+        if df_clean.empty:
+            raise SystemExit(f"{args.path} : aucune station valide après nettoyage.")
+        store.publish(file_fingerprint(args.path), df_clean, data_quality_report)
+    stats = store.stats()
+    print(f"{store.root} : génération courante {stats['current']}, "
+          f"{stats['generations']} génération(s) sur le disque ({stats['bytes'] / 1024:.0f} Ko).")
+
+
+if __name__ == '__main__':
+    main()
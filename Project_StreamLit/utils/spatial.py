@@ -0,0 +1,143 @@
+# utils/spatial.py
+import numpy as np
+
+from utils.perf import traced
+
+
+EARTH_RADIUS_M = 6_371_000.0
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Distance orthodromique en mètres (vectorisée)."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+class StationSpatialIndex:
+    """
+    Index spatial en grille régulière, construit une fois par instantané.
+
+    Les stations sont projetées en mètres (projection équirectangulaire locale)
+    puis triées par cellule ; chaque cellule est une tranche contiguë de
+    `order`. Une requête parcourt des carrés de cellules de plus en plus
+    grands autour du point, jusqu'à ce que les k stations retenues soient
+    plus proches que le bord du carré.
+    """
+
+    def __init__(self, lat, lon, velos=None, bornes=None, stations_per_cell=4):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        n = len(self.lat)
+        self.velos = np.asarray(velos) if velos is not None else np.zeros(n, dtype=np.int64)
+        self.bornes = np.asarray(bornes) if bornes is not None else np.zeros(n, dtype=np.int64)
+
+        self.lat0 = float(np.mean(self.lat)) if n else 0.0
+        self._kx = np.radians(1.0) * EARTH_RADIUS_M * np.cos(np.radians(self.lat0))
+        self._ky = np.radians(1.0) * EARTH_RADIUS_M
+        x, y = self._project(self.lat, self.lon)
+
+        self.x0 = float(x.min()) if n else 0.0
+        self.y0 = float(y.min()) if n else 0.0
+        width = max(float(x.max()) - self.x0, 1.0) if n else 1.0
+        height = max(float(y.max()) - self.y0, 1.0) if n else 1.0
+        self.cell_size = max(np.sqrt(width * height * stations_per_cell / max(n, 1)), 1.0)
+        self.nx = int(width // self.cell_size) + 1
+        self.ny = int(height // self.cell_size) + 1
+
+        cells = self._cell_ids(*self._cell_coords(x, y))
+        self.order = np.argsort(cells, kind='stable')
+        self.cell_starts = np.searchsorted(cells[self.order], np.arange(self.nx * self.ny + 1))
+
+    @classmethod
+    @traced('StationSpatialIndex.from_frame')
+    def from_frame(cls, df):
+        """Construit l'index depuis un tableau de stations (lat, lon, VelosDispoTotal, BornesLibres)."""
+        return cls(
+            df['lat'].to_numpy(),
+            df['lon'].to_numpy(),
+            df['VelosDispoTotal'].to_numpy() if 'VelosDispoTotal' in df.columns else None,
+            df['BornesLibres'].to_numpy() if 'BornesLibres' in df.columns else None,
+        )
+
+    @property
+    def nbytes(self):
+        arrays = [self.lat, self.lon, self.velos, self.bornes, self.order, self.cell_starts]
+        return int(sum(a.nbytes for a in arrays))
+
+    def _project(self, lat, lon):
+        return (np.asarray(lon) * self._kx, np.asarray(lat) * self._ky)
+
+    def _cell_coords(self, x, y):
+        cx = np.clip(((x - self.x0) // self.cell_size).astype(np.int64), 0, self.nx - 1)
+        cy = np.clip(((y - self.y0) // self.cell_size).astype(np.int64), 0, self.ny - 1)
+        return cx, cy
+
+    def _cell_ids(self, cx, cy):
+        return cx * self.ny + cy
+
+    def _candidates(self, cx, cy, radius):
+        """Positions (dans l'ordre trié) des stations du carré de cellules de demi-côté `radius`."""
+        xs = np.arange(max(cx - radius, 0), min(cx + radius, self.nx - 1) + 1)
+        y_lo, y_hi = max(cy - radius, 0), min(cy + radius, self.ny - 1)
+        # Pour une colonne de cellules, les stations sont contiguës dans le tableau trié.
+        starts = self.cell_starts[xs * self.ny + y_lo]
+        ends = self.cell_starts[xs * self.ny + y_hi + 1]
+        lengths = ends - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return offsets + np.arange(total)
+
+    @traced('StationSpatialIndex.nearest')
+    def nearest(self, lat, lon, k=5, min_velos=0, min_bornes=0):
+        """
+        Les k stations les plus proches de (lat, lon) ayant au moins `min_velos`
+        vélos et `min_bornes` places libres. Renvoie (positions, distances en
+        mètres), triées par distance croissante.
+        """
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+        if len(self.lat) == 0 or k <= 0:
+            return empty
+
+        qx, qy = self._project(lat, lon)
+        cx, cy = (int(c[0]) for c in self._cell_coords(np.array([qx]), np.array([qy])))
+        # Distance du point au bord de la grille, pour savoir quand le carré la couvre entièrement.
+        max_radius = max(cx, cy, self.nx - 1 - cx, self.ny - 1 - cy)
+        outside = max(self.x0 - qx, qx - (self.x0 + self.nx * self.cell_size),
+                      self.y0 - qy, qy - (self.y0 + self.ny * self.cell_size), 0.0)
+
+        radius = 1
+        while True:
+            positions = self.order[self._candidates(cx, cy, radius)]
+            positions = positions[(self.velos[positions] >= min_velos) & (self.bornes[positions] >= min_bornes)]
+
+            covers_all = radius >= max_radius
+            if len(positions) >= k or covers_all:
+                distances = haversine_m(lat, lon, self.lat[positions], self.lon[positions])
+                top = np.argsort(distances, kind='stable')[:k]
+                # Tout point hors du carré est à au moins `radius` cellules (moins la marge
+                # hors grille) ; 1 % de marge couvre l'écart projection / haversine.
+                bound = 0.99 * (radius * self.cell_size - outside)
+                if covers_all or distances[top[-1]] <= bound:
+                    return positions[top], distances[top]
+            radius = min(radius * 2, max_radius) if radius < max_radius else radius + 1
+
+
+def nearest_stations(df, index, lat, lon, k=5, min_velos=0, min_bornes=0):
+    """Lignes de `df` correspondant à `index.nearest(...)`, avec une colonne Distance (m)."""
+    positions, distances = index.nearest(lat, lon, k, min_velos, min_bornes)
+    result = df.iloc[positions].copy()
+    result['Distance (m)'] = np.round(distances).astype(np.int64)
+    return result
+
+
+def nearest_bruteforce(lat_arr, lon_arr, lat, lon, k=5, mask=None):
+    """Référence : distance haversine à toutes les stations, puis tri."""
+    distances = haversine_m(lat, lon, lat_arr, lon_arr)
+    positions = np.arange(len(distances))
+    if mask is not None:
+        positions, distances = positions[mask], distances[mask]
+    top = np.argsort(distances, kind='stable')[:k]
+    return positions[top], distances[top]
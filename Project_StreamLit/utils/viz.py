@@ -1,22 +1,36 @@
 # utils/viz.py
-import altair as alt
 import streamlit as st
+import numpy as np
 import pandas as pd
 
-def bar_chart_dispo_commune(df_filtered):
+from utils.perf import span, traced
+
+
+MAP_MAX_POINTS = 2000
+# Stations signalées par utils/anomalies.py.
+SUSPECT_COLOR = "#8E44AD"
+DENSITY_MAX_BINS = 60
+
+@traced()
+def bar_chart_dispo_commune(df_filtered, df_agg=None):
     """
     Crée un graphique en barres montrant la disponibilité moyenne par commune.
+    `df_agg` (Commune, TauxDispo) peut être fourni déjà agrégé, par exemple
+    depuis le cube d'agrégats, pour éviter de reparcourir les stations.
     """
+    # Import différé : altair n'est chargé qu'au rendu du premier graphique.
+    import altair as alt
     
-    if 'Commune' not in df_filtered.columns:
-        st.error("La colonne 'Commune' est manquante pour créer le graphique par commune.")
-        return alt.Chart(pd.DataFrame({'x':[0], 'y':[0]})).mark_bar() # Return empty chart
+    if df_agg is None:
+        if 'Commune' not in df_filtered.columns:
+            st.error("La colonne 'Commune' est manquante pour créer le graphique par commune.")
+            return alt.Chart(pd.DataFrame({'x':[0], 'y':[0]})).mark_bar() # Return empty chart
 
-    # Calculer la disponibilité moyenne par commune
-    df_agg = df_filtered.groupby('Commune')['TauxDispo'].mean().reset_index().sort_values(by='TauxDispo', ascending=False)
+        # Calculer la disponibilité moyenne par commune
+        df_agg = df_filtered.groupby('Commune', observed=True)['TauxDispo'].mean().reset_index().sort_values(by='TauxDispo', ascending=False)
     
     # Garder le Top 20 pour la lisibilité
-    df_top = df_agg.head(20)
+    df_top = df_agg[['Commune', 'TauxDispo']].head(20)
 
     chart = alt.Chart(df_top).mark_bar().encode(
         x=alt.X('TauxDispo', axis=alt.Axis(title='Taux de Disponibilité Moyen (%)')),
@@ -31,10 +45,42 @@ def bar_chart_dispo_commune(df_filtered):
 
     return chart
 
+def density_bins(df_filtered, x_col='CapaciteTotal', y_col='VelosDispoTotal', max_bins=DENSITY_MAX_BINS):
+    """
+    Agrège les stations dans une grille 2D (x_col × y_col) : nombre de
+    stations, TauxDispo moyen et une station d'exemple par case. La taille
+    du résultat est bornée par max_bins², quel que soit le nombre de stations.
+    """
+    x = df_filtered[x_col].to_numpy(dtype=np.float64)
+    y = df_filtered[y_col].to_numpy(dtype=np.float64)
+    # Pas entier : les compteurs Vélib' sont des entiers, une case = une valeur tant que possible.
+    x_step = max(1.0, np.ceil((x.max() - x.min() + 1) / max_bins)) if len(x) else 1.0
+    y_step = max(1.0, np.ceil((y.max() - y.min() + 1) / max_bins)) if len(y) else 1.0
+
+    df_bins = pd.DataFrame({
+        'x0': np.floor(x / x_step) * x_step,
+        'y0': np.floor(y / y_step) * y_step,
+        'TauxDispo': df_filtered['TauxDispo'].to_numpy(dtype=np.float64),
+        'NomStation': df_filtered['NomStation'].astype(str).to_numpy(),
+    })
+    df_bins = df_bins.groupby(['x0', 'y0'], sort=False).agg(
+        Stations=('TauxDispo', 'size'),
+        TauxDispo=('TauxDispo', 'mean'),
+        Exemple=('NomStation', 'first'),
+    ).reset_index()
+    df_bins['x1'] = df_bins['x0'] + x_step
+    df_bins['y1'] = df_bins['y0'] + y_step
+    return df_bins
+
+
+@traced()
 def scatter_plot_capacite_vs_dispo(df_filtered):
     """
-    Crée un nuage de points : Capacité vs Vélos Disponibles, couleur par TauxDispo.
+    Crée une carte de densité : Capacité vs Vélos Disponibles, couleur par
+    TauxDispo moyen, opacité par nombre de stations. Toutes les stations sont
+    comptées (pas d'échantillonnage), les points isolés restent visibles.
     """
+    import altair as alt
     
     required_cols = ['CapaciteTotal', 'VelosDispoTotal', 'TauxDispo', 'NomStation', 'Commune']
     if not all(col in df_filtered.columns for col in required_cols):
@@ -42,21 +88,21 @@ def scatter_plot_capacite_vs_dispo(df_filtered):
         return alt.Chart(pd.DataFrame({'x':[0], 'y':[0]})).mark_point() # Return empty chart
         
     
-    if len(df_filtered) > 1000:
-        df_sample = df_filtered.sample(1000, random_state=42)
-    else:
-        df_sample = df_filtered
+    df_bins = density_bins(df_filtered)
 
-    chart = alt.Chart(df_sample).mark_circle(size=60).encode(
-        x=alt.X('CapaciteTotal', axis=alt.Axis(title='Capacité Totale de la Station')),
-        y=alt.Y('VelosDispoTotal', axis=alt.Axis(title='Nombre de Vélos Disponibles')),
-        color=alt.Color('TauxDispo', scale=alt.Scale(scheme='redyellowgreen'), title="Taux Dispo (%)"),
+    chart = alt.Chart(df_bins).mark_rect().encode(
+        x=alt.X('x0:Q', axis=alt.Axis(title='Capacité Totale de la Station')),
+        x2='x1:Q',
+        y=alt.Y('y0:Q', axis=alt.Axis(title='Nombre de Vélos Disponibles')),
+        y2='y1:Q',
+        color=alt.Color('TauxDispo:Q', scale=alt.Scale(scheme='redyellowgreen', domain=[0, 100]), title="Taux Dispo (%)"),
+        opacity=alt.Opacity('Stations:Q', scale=alt.Scale(type='log', range=[0.35, 1]), legend=None),
         tooltip=[
-            alt.Tooltip('NomStation', title="Station"),
-            alt.Tooltip('Commune'),
-            alt.Tooltip('CapaciteTotal', title="Capacité"),
-            alt.Tooltip('VelosDispoTotal', title="Vélos Dispo"),
-            alt.Tooltip('TauxDispo', format=".1f", title="Taux Dispo (%)")
+            alt.Tooltip('Stations:Q', title="Stations"),
+            alt.Tooltip('Exemple:N', title="Exemple"),
+            alt.Tooltip('x0:Q', title="Capacité (à partir de)"),
+            alt.Tooltip('y0:Q', title="Vélos Dispo (à partir de)"),
+            alt.Tooltip('TauxDispo:Q', format=".1f", title="Taux Dispo moyen (%)")
         ]
     ).properties(
         title="Disponibilité vs Capacité des Stations"
@@ -64,45 +110,133 @@ def scatter_plot_capacite_vs_dispo(df_filtered):
 
     return chart
 
-def map_chart_dispo(gdf_filtered):
+
+@traced()
+def heatmap_hour_of_week(df_heat, title):
+    """
+    Carte de chaleur jour × heure (sortie de `EpisodeStats.heatmap_frame`) :
+    part du temps passé vide ou pleine à chaque créneau de la semaine.
+    """
+    import altair as alt
+    from utils.episodes import JOURS
+
+    chart = alt.Chart(df_heat).mark_rect().encode(
+        x=alt.X('Heure:O', axis=alt.Axis(title='Heure (Paris)', labelAngle=0)),
+        y=alt.Y('Jour:N', sort=JOURS, axis=alt.Axis(title=None)),
+        color=alt.Color('Part (%):Q', scale=alt.Scale(scheme='orangered', domain=[0, max(float(df_heat['Part (%)'].max() or 0), 1)]), title="Part du temps (%)"),
+        tooltip=[
+            alt.Tooltip('Jour:N'),
+            alt.Tooltip('Heure:O'),
+            alt.Tooltip('Part (%):Q', format=".1f", title="Part du temps (%)")
+        ]
+    ).properties(
+        title=title
+    )
+
+    return chart
+
+
+def color_bucket(taux_dispo):
+    """Couleur de la carte selon le taux de disponibilité (vectorisé, gris si inconnu)."""
+    taux = np.asarray(taux_dispo, dtype=np.float64)
+    return np.select(
+        [taux < 10, taux < 30, taux >= 30],
+        ["#FF0000", "#FFA500", "#008000"],
+        default="#808080",
+    )
+
+
+@traced()
+def aggregate_map_bins(df_filtered, max_points=MAP_MAX_POINTS, geometry=None, suspects=None):
+    """
+    Niveau de détail de la carte : au-delà de `max_points` stations, regroupe
+    les stations dans une grille d'au plus `max_points` cases (position
+    moyenne, nombre de stations, vélos cumulés, TauxDispo moyen).
+    Les coordonnées sont lues dans `geometry` (StationGeometry alignée sur
+    `df_filtered`) si elle est fournie, sinon dans les colonnes lat/lon.
+    `suspects` (booléens alignés sur `df_filtered`) donne le nombre de
+    stations suspectes de chaque point (colonne Suspectes).
+    Renvoie (df_map, cell_size_deg) ; cell_size_deg vaut None sans regroupement.
+    """
+    velos = df_filtered['VelosDispoTotal'].to_numpy(dtype=np.int64)
+    taux = df_filtered['TauxDispo'].to_numpy(dtype=np.float64)
+    suspects = np.zeros(len(velos), dtype=np.int64) if suspects is None else np.asarray(suspects, dtype=np.int64)
+    if geometry is not None:
+        lat, lon = geometry.lat, geometry.lon
+        if not geometry.valid.all():
+            lat, lon = lat[geometry.valid], lon[geometry.valid]
+            velos, taux, suspects = velos[geometry.valid], taux[geometry.valid], suspects[geometry.valid]
+    else:
+        lat = df_filtered['lat'].to_numpy(dtype=np.float64)
+        lon = df_filtered['lon'].to_numpy(dtype=np.float64)
+
+    if len(lat) <= max_points:
+        return pd.DataFrame({
+            'lat': lat, 'lon': lon, 'Stations': 1, 'VelosDispoTotal': velos, 'TauxDispo': taux, 'Suspectes': suspects,
+        }), None
+
+    side = int(np.sqrt(max_points))
+    extent = max(lat.max() - lat.min(), lon.max() - lon.min(), 1e-9)
+    cell = extent / side * (1 + 1e-9)
+    cells = (
+        np.floor((lat - lat.min()) / cell).astype(np.int64) * side
+        + np.floor((lon - lon.min()) / cell).astype(np.int64)
+    )
+    uniques, inverse, counts = np.unique(cells, return_inverse=True, return_counts=True)
+    df_map = pd.DataFrame({
+        'lat': np.bincount(inverse, lat) / counts,
+        'lon': np.bincount(inverse, lon) / counts,
+        'Stations': counts,
+        'VelosDispoTotal': np.bincount(inverse, velos).astype(np.int64),
+        'TauxDispo': np.bincount(inverse, np.nan_to_num(taux)) / counts,
+        'Suspectes': np.bincount(inverse, suspects, minlength=len(counts)).astype(np.int64),
+    })
+    return df_map, cell
+
+
+@traced()
+def map_chart_dispo(df_filtered, map_bins=None):
     """
     Crée une carte des stations, colorée par taux de disponibilité.
+    `map_bins` (résultat de `aggregate_map_bins`) peut être fourni déjà calculé.
     """
-    if gdf_filtered is None or gdf_filtered.empty:
+    if df_filtered is None or df_filtered.empty:
         st.warning("Impossible d'afficher la carte : données géographiques invalides.")
         return
         
     
-    if 'TauxDispo' not in gdf_filtered.columns or 'VelosDispoTotal' not in gdf_filtered.columns:
+    if 'TauxDispo' not in df_filtered.columns or 'VelosDispoTotal' not in df_filtered.columns:
         st.error("Colonnes 'TauxDispo' ou 'VelosDispoTotal' manquantes pour la carte.")
        
-        st.map(gdf_filtered, latitude='lat', longitude='lon', zoom=11)
+        st.map(df_filtered[['lat', 'lon']].astype('float64'), latitude='lat', longitude='lon', zoom=11)
         return
 
     
-    def get_color(taux_dispo):
-        
-        try:
-            taux = float(taux_dispo)
-            if taux < 10:
-                return "#FF0000"  
-            elif taux < 30:
-                return "#FFA500" 
-            else:
-                return "#008000"  
-        except (ValueError, TypeError):
-             return "#808080" 
-
-    gdf_copy = gdf_filtered.copy()
-    gdf_copy['color'] = gdf_copy['TauxDispo'].apply(get_color)
-
-
-    st.map(
-        gdf_copy,
-        latitude='lat',
-        longitude='lon',
-        size='VelosDispoTotal', 
-        color='color',          
-        zoom=11                 
-    )
-    st.caption("🔴 Taux dispo < 10% | 🟠 < 30% | 🟢 >= 30%. La taille représente le nombre absolu de vélos disponibles.")
\ No newline at end of file
+    df_map, cell_size_deg = map_bins if map_bins is not None else aggregate_map_bins(df_filtered)
+    color = color_bucket(df_map['TauxDispo'])
+    suspects = df_map['Suspectes'].to_numpy() if 'Suspectes' in df_map.columns else np.zeros(len(df_map), dtype=np.int64)
+    # Points dont toutes les stations sont suspectes : leurs chiffres ne sont pas fiables.
+    color = np.where((suspects > 0) & (suspects == df_map['Stations'].to_numpy()), SUSPECT_COLOR, color)
+    df_map = df_map.assign(color=color)
+
+
+    with span('st.map', points=len(df_map)):
+        st.map(
+            df_map,
+            latitude='lat',
+            longitude='lon',
+            size='VelosDispoTotal', 
+            color='color',          
+            zoom=11                 
+        )
+    st.caption("🔴 Taux dispo < 10% | 🟠 < 30% | 🟢 >= 30%. La taille représente le nombre absolu de vélos disponibles.")
+    if suspects.any():
+        st.caption(
+            f"🟣 {int(suspects.sum())} station(s) suspecte(s) : compteurs figés ou incohérents, "
+            "leurs vélos affichés ne sont peut-être pas disponibles."
+        )
+    if cell_size_deg is not None:
+        st.caption(
+            f"{len(df_filtered)} stations regroupées en {len(df_map)} zones d'environ "
+            f"{cell_size_deg * 111:.1f} km (vélos cumulés, taux moyen)."
+        )